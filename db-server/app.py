@@ -22,6 +22,7 @@ async def check_session(request: Request, call_next):
         "/status",
         "/register",
         "/ruler/get",
+        "/ruler/get_batch",
         "/net/get_net_file",
         "/node/metrics",
         "/job/update",
@@ -28,6 +28,11 @@ class Config(object):
     Allow_methods = ["*"]
     Allow_headers = ["*"]
 
+    # 数据对齐任务进度轮询配置
+    Aligned_poll_interval = 2  # 轮询节点对齐进度的间隔(秒)
+    Aligned_poll_retries = 30  # 连续请求失败多少次后放弃(节点重启期间会短暂不可用)
+    Aligned_node_timeout = 24 * 60 * 60  # 单个节点对齐任务的最长等待时间(秒)
+
     # database config
     Redis_host = "10.211.55.12"
     Redis_port = 6379
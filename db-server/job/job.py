@@ -73,6 +73,8 @@ def start_job():
                 'epochs': job.get('job_info').get('epochs'),
                 "input_field": job.get('job_info').get('input_field'),
                 "output_field": job.get('job_info').get('output_field'),
+                "loader_config": job.get('job_info').get('loader_config'),
+                "validation": job.get('job_info').get('validation'),
             }
             logger.info("%s", json.dumps(json_data))
             try:
@@ -123,6 +123,7 @@ class Ruler(BaseModel):
     original_db = JSONField(null=False)
     data_count = IntegerField(null=False)
     file_name = CharField(null=False)
+    storage_format = CharField(null=False, default="hdf5")
     created_at = DateTimeField(default=datetime.datetime.now)
     updated_at = DateTimeField(default=datetime.datetime.now)
 
@@ -135,6 +136,8 @@ class RulerDetail(BaseModel):
     ruler_id = IntegerField(null=False)
     original_db = JSONField(null=False)
     operator = JSONField(null=False)
+    aligned_rows = IntegerField(null=False, default=0)  # 已对齐的原始数据行数(高水位)
+    constants = JSONField(null=True)  # 创建时聚合操作符(avg/max/min)的结果，增量刷新时沿用
     created_at = DateTimeField(default=datetime.datetime.now)
     updated_at = DateTimeField(default=datetime.datetime.now)
 
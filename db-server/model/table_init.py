@@ -1,4 +1,5 @@
 from peewee import *
+from playhouse.migrate import MySQLMigrator, migrate
 import datetime
 import json
 
@@ -82,5 +83,59 @@ def init_table():
     db.create_tables([Job, NodeJob])
 
 
+def migrate_table():
+    # 为已有表添加新字段
+    migrator = MySQLMigrator(db)
+    columns = {column.name for column in db.get_columns("ruler")}
+    operations = []
+    if "storage_format" not in columns:
+        operations.append(migrator.add_column(
+            "ruler", "storage_format", CharField(null=False, default="hdf5")))
+    columns = {column.name for column in db.get_columns("ruler_detail")}
+    backfill = "aligned_rows" not in columns
+    if backfill:
+        operations.append(migrator.add_column(
+            "ruler_detail", "aligned_rows", IntegerField(null=False, default=0)))
+    if "constants" not in columns:
+        operations.append(migrator.add_column(
+            "ruler_detail", "constants", JSONField(null=True)))
+    migrate(*operations)
+    if backfill:
+        backfill_aligned_rows()
+
+
+def backfill_aligned_rows():
+    """
+    为添加 aligned_rows 字段之前创建的规则补写高水位
+
+    这些规则创建时对齐了原始数据的全部行: 只有一个原始数据库的规则取规则的 data_count，
+    多个原始数据库时取各原始数据库登记的行数(data_number)。
+    """
+    details = {}
+    for ruler_id, detail_id, original_db in db.execute_sql(
+            "SELECT ruler_id, id, original_db FROM ruler_detail WHERE aligned_rows = 0").fetchall():
+        details.setdefault(ruler_id, []).append((detail_id, json.loads(original_db)))
+    with db.atomic():
+        for ruler_id, items in details.items():
+            row = db.execute_sql(
+                "SELECT data_count FROM ruler WHERE id = %s", (ruler_id,)).fetchone()
+            if row is None:
+                continue
+            total = db.execute_sql(
+                "SELECT COUNT(*) FROM ruler_detail WHERE ruler_id = %s", (ruler_id,)).fetchone()[0]
+            for detail_id, original_db in items:
+                if total == 1:
+                    aligned_rows = row[0]
+                else:
+                    number = db.execute_sql(
+                        "SELECT data_number FROM data_base WHERE id = %s",
+                        (original_db.get("id"),)).fetchone()
+                    aligned_rows = number[0] if number else 0
+                db.execute_sql(
+                    "UPDATE ruler_detail SET aligned_rows = %s WHERE id = %s",
+                    (aligned_rows, detail_id))
+
+
 if __name__ == "__main__":
     init_table()
+    migrate_table()
@@ -0,0 +1,82 @@
+"""对齐规则表达式校验模块
+
+对 expr 操作符的算术表达式做语法校验，只允许数字常量、字段名、+ - * / ** 运算、
+正负号以及 abs/sqrt/log/exp/round 函数。表达式在节点上编译为按列求值的函数，
+允许的语法需与节点 utils/expression.py 保持一致。
+"""
+
+import ast
+
+EXPRESSION_OPERATOR = "expr"
+
+_BINARY_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow)
+_UNARY_OPERATORS = (ast.USub, ast.UAdd)
+_FUNCTIONS = ("abs", "sqrt", "log", "exp", "round")
+
+
+def parse_expression(expression):
+    """解析并校验算术表达式
+
+    Args:
+        expression (str): 表达式字符串
+
+    Returns:
+        list: 按出现顺序去重的字段名列表
+
+    Raises:
+        ValueError: 表达式语法错误或包含不支持的内容
+    """
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"表达式语法错误: {expression}") from e
+    fields = []
+    _check_node(tree.body, fields)
+    return fields
+
+
+def _check_node(node, fields):
+    if isinstance(node, ast.Name):
+        if node.id not in fields:
+            fields.append(node.id)
+    elif isinstance(node, ast.Constant):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise ValueError(f"表达式中不支持的常量: {node.value!r}")
+    elif isinstance(node, ast.BinOp):
+        if not isinstance(node.op, _BINARY_OPERATORS):
+            raise ValueError(f"表达式中不支持的运算符: {type(node.op).__name__}")
+        _check_node(node.left, fields)
+        _check_node(node.right, fields)
+    elif isinstance(node, ast.UnaryOp):
+        if not isinstance(node.op, _UNARY_OPERATORS):
+            raise ValueError(f"表达式中不支持的运算符: {type(node.op).__name__}")
+        _check_node(node.operand, fields)
+    elif isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in _FUNCTIONS:
+            raise ValueError(f"表达式中不支持的函数: {ast.unparse(node.func)}")
+        name = node.func.id
+        if node.keywords or len(node.args) not in ((1, 2) if name == "round" else (1,)):
+            raise ValueError(f"函数 {name} 的参数错误")
+        if len(node.args) == 2 and not (
+                isinstance(node.args[1], ast.Constant) and type(node.args[1].value) is int):
+            raise ValueError("round 的小数位数必须为整数常量")
+        _check_node(node.args[0], fields)
+    else:
+        raise ValueError(f"表达式中不支持的语法: {type(node).__name__}")
+
+
+def validate_expression(expression, original_fields):
+    """校验 expr 操作符的表达式，表达式中的字段必须全部出现在 original_fields 中
+
+    Args:
+        expression (str): 表达式字符串
+        original_fields (list): 该操作符声明的原始字段名
+
+    Raises:
+        ValueError: 校验失败
+    """
+    if not expression:
+        raise ValueError("expr 操作符缺少表达式")
+    missing = [f for f in parse_expression(expression) if f not in original_fields]
+    if missing:
+        raise ValueError(f"表达式中的字段未在原始字段中声明: {', '.join(missing)}")
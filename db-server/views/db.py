@@ -4,11 +4,17 @@
 - 数据库信息的上传
 - 数据库列表的获取
 - 数据库字段的查询
+- 数据库的删除
 等功能
+
+节点按文件内容存储原始数据，多个数据库可能引用同一个文件(同一节点上 file_name 相同)，
+删除数据库时只有最后一个引用被删除后才通知节点删除文件。
 """
 import json
 from datetime import datetime
+import requests
 from fastapi import APIRouter, Request, HTTPException
+from config import config
 from model import DataBase, User, redis
 from pydantic import BaseModel
 
@@ -129,3 +135,63 @@ def get_filed(request: Request):
             }
         )
     return {"field_list": field_list}
+
+
+class DeleteInfo(BaseModel):
+    id: int
+
+
+def count_references(node, file_name):
+    """
+    统计引用同一原始数据文件的数据库个数
+
+    Args:
+        node (Node): 原始数据所在节点
+        file_name (str): 原始数据文件名
+
+    Returns:
+        int: 引用该文件的数据库个数
+    """
+    return (
+        DataBase.select()
+        .where(DataBase.node == node, DataBase.file_name == file_name)
+        .count()
+    )
+
+
+@db.post("/delete")
+def delete(request: Request, delete_info: DeleteInfo):
+    session = request.headers.get("Authorization")
+    if session is None:
+        raise HTTPException(401, detail="请先登录")
+    user_info = redis.get(session)
+    if user_info is None:
+        raise HTTPException(401, detail="请先登录")
+    user_info = json.loads(user_info)
+    user = User.get_or_none(User.id == user_info["id"])
+    if user is None:
+        raise HTTPException(401, detail="用户不存在")
+    data_base = DataBase.get_or_none(DataBase.id == delete_info.id)
+    if data_base is None:
+        raise HTTPException(400, detail="数据库不存在")
+    if data_base.node.id != user.node.id:
+        raise HTTPException(400, detail="只能删除本节点的数据库")
+    node = data_base.node
+    file_name = data_base.file_name
+    data_base.delete_instance()
+    references = count_references(node, file_name)
+    if references == 0:
+        # 已没有数据库引用该文件，通知节点删除
+        try:
+            res = requests.post(
+                f"http://{node.ip}:{node.port}/db/delete",
+                headers={"x-forwarded-for": config.Host},
+                json={"file_name": file_name},
+                timeout=5,
+            )
+            if res.status_code != 200:
+                config.logger.warning(
+                    f"节点 {node.nodename} 删除文件 {file_name} 失败: {res.text}")
+        except requests.RequestException as e:
+            config.logger.warning(f"节点 {node.nodename} 删除文件 {file_name} 失败: {e}")
+    return {"message": "数据库已删除", "references": references}
@@ -21,6 +21,22 @@ class ServerConfig(BaseModel):
     accept_failure: bool = False
 
 
+class LoaderConfig(BaseModel):
+    num_workers: int = 0  # 节点 DataLoader 工作进程数
+    prefetch_factor: int = 2  # 每个工作进程预取的批数
+    pin_memory: bool = False  # 是否使用锁页内存
+    shuffle: bool = False  # 是否打乱训练数据(随机顺序读取数据块 + 有界缓冲区内打乱)
+    shuffle_buffer: int = 100000  # 打乱缓冲区的行数
+    seed: Optional[int] = None  # 随机种子，为空时各节点随机生成
+    cache: bool = False  # 是否缓存转换后的训练数据，只适用于确定性的 transform(不含随机数据增强)
+
+
+class ValidationConfig(BaseModel):
+    fraction: Optional[float] = 0.1  # 验证集占比(按数据块抽取)，0 为不划分验证集
+    row_range: Optional[List[int]] = None  # 验证集行区间 [start, stop)，指定时优先于 fraction
+    max_rows: Optional[int] = None  # 验证集最大行数，超过时抽样
+
+
 class Field(BaseModel):
     field: str
     type: str
@@ -35,6 +51,8 @@ class JobInfo(BaseModel):
     epochs: int = 5
     strategy: str = "FedAvg"
     server_config: Optional[ServerConfig]
+    loader_config: Optional[LoaderConfig] = None  # 为空时各节点使用自己的默认配置
+    validation: Optional[ValidationConfig] = None  # 为空时各节点使用自己的默认配置
 
 
 @job.get("/list")
@@ -5,19 +5,31 @@
 主要用于处理不同数据源之间的数据对齐操作。
 """
 
-from typing import List, Union
+from typing import List, Optional, Union
 import uuid
 import json
+import time
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
 from fastapi import APIRouter, Request, HTTPException
 from pydantic import BaseModel
 from model import DataBase, RulerDetail, Node
 from model import Ruler as RulerModel
+from model import db as database
+from model import redis
 from config import config
+from utils.expression import EXPRESSION_OPERATOR, validate_expression
 
 
 ruler = APIRouter(prefix="/ruler")
 
+STORAGE_FORMATS = ("hdf5", "columnar")
+ERROR_POLICIES = ("raise", "coerce", "drop")
+RULER_TASK_EXPIRE = 60 * 60 * 24 * 7  # 规则创建任务状态保留7天
+active_ruler_tasks = set()  # 当前进程中正在运行的规则创建任务
+
 
 class DB(BaseModel):
     id: int
@@ -35,6 +47,7 @@ class OriginalField(BaseModel):
 class AlignedField(BaseModel):
     field: str
     type: str
+    on_error: Optional[str] = None  # 类型转换失败时的处理策略: raise / coerce / drop，为空时保持原有逐值转换
 
 
 class Operator(BaseModel):
@@ -42,6 +55,7 @@ class Operator(BaseModel):
     aligned_field: AlignedField
     operator: str
     original_field: Union[OriginalField, List[OriginalField]]
+    expression: Optional[str] = None  # operator 为 expr 时的算术表达式，字段名需出现在 original_field 中
 
 
 class Ruler(BaseModel):
@@ -55,6 +69,13 @@ class RulerInfo(BaseModel):
     original_db: List[DB]
     field: List[AlignedField]
     ruler: List[Ruler]
+    storage_format: str = "hdf5"  # 对齐数据存储格式: hdf5 / columnar
+    complevel: Optional[int] = None  # HDF5 压缩级别，为空时使用节点默认配置
+    complib: Optional[str] = None  # HDF5 压缩库，为空时使用节点默认配置
+
+
+class RulerId(BaseModel):
+    id: int
 
 
 class UpdateFieldType(BaseModel):
@@ -63,70 +84,498 @@ class UpdateFieldType(BaseModel):
     type: str
 
 
+def validate_ruler(ruler_info):
+    """
+    校验对齐规则: 对齐字段的类型转换策略以及 expr 操作符的表达式
+
+    Args:
+        ruler_info (RulerInfo): 规则信息
+
+    Raises:
+        HTTPException: 校验失败时抛出400错误
+    """
+    for ruler_item in ruler_info.ruler:
+        for op in ruler_item.operator:
+            on_error = op.aligned_field.on_error
+            if on_error is not None and on_error not in ERROR_POLICIES:
+                raise HTTPException(
+                    400, detail=f"{op.aligned_field.field}: 不支持的错误处理策略 {on_error}")
+            if op.operator != EXPRESSION_OPERATOR:
+                continue
+            original_fields = op.original_field if isinstance(
+                op.original_field, list) else [op.original_field]
+            try:
+                validate_expression(op.expression, [f.field for f in original_fields])
+            except ValueError as e:
+                raise HTTPException(
+                    400, detail=f"{ruler_item.db.name}.{op.aligned_field.field}: {e}") from e
+
+
+def compression_query(complevel=None, complib=None):
+    """HDF5 压缩参数的查询字符串，未指定的参数由节点使用默认配置"""
+    query = ""
+    if complevel is not None:
+        query += f"&complevel={complevel}"
+    if complib:
+        query += f"&complib={complib}"
+    return query
+
+
+def request_aligned(db_item, file_name, storage_format, ruler_json, start=0,
+                    timeout=None, complevel=None, complib=None, on_progress=None):
+    """
+    请求原始数据所在节点执行对齐
+
+    节点以后台任务方式执行对齐，这里只发起任务，然后轮询进度直到完成；
+    节点重启导致任务中断时，请求节点从检查点继续。
+
+    Args:
+        db_item (DataBase): 原始数据库
+        file_name (str): 对齐数据文件名
+        storage_format (str): 对齐数据存储格式
+        ruler_json (dict): 该数据库的对齐规则(Ruler)
+        start (int): 从原始数据的第几行开始对齐
+        timeout (int): 等待对齐完成的最长时间(秒)，默认为 config.Aligned_node_timeout
+        complevel (int): HDF5 压缩级别，只对新建的对齐文件生效
+        complib (str): HDF5 压缩库，只对新建的对齐文件生效
+        on_progress: 每次查询到进度后的回调，参数为节点返回的进度
+
+    Returns:
+        dict: 节点返回的最终进度，包含 data_count、high_water_mark、rows_per_second
+    """
+    node = db_item.node
+    base_url = f"http://{node.ip}:{node.port}/aligned"
+    headers = {"x-forwarded-for": config.Host}
+    res = requests.post(
+        f"{base_url}/add"
+        f"?file_name={file_name}&original_file={db_item.file_name}"
+        f"&storage_format={storage_format}&start={start}"
+        f"{compression_query(complevel, complib)}",
+        headers=headers,
+        json=ruler_json,
+        timeout=300  # 设置300秒超时，防止请求无限等待
+    )
+    if res.status_code != 200:
+        raise HTTPException(
+            400, detail=f"对齐数据失败,res:{res.json().get('detail')}"
+        )
+    return wait_aligned_job(node, res.json().get("job_id"), timeout, on_progress)
+
+
+def wait_aligned_job(node, job_id, timeout=None, on_progress=None):
+    """
+    轮询节点上的后台任务(对齐或字段类型转换)直到完成
+
+    任务中断时请求节点从检查点继续，连续 config.Aligned_poll_retries 次请求失败时放弃。
+
+    Args:
+        node (Node): 任务所在节点
+        job_id (str): 任务ID
+        timeout (int): 等待完成的最长时间(秒)，默认为 config.Aligned_node_timeout
+        on_progress: 每次查询到进度后的回调，参数为节点返回的进度
+
+    Returns:
+        dict: 节点返回的最终进度
+    """
+    base_url = f"http://{node.ip}:{node.port}/aligned"
+    headers = {"x-forwarded-for": config.Host}
+    deadline = time.time() + (timeout or config.Aligned_node_timeout)
+    failures = 0
+    while True:
+        if time.time() > deadline:
+            raise HTTPException(
+                400, detail=f"对齐数据超时,{node.ip}:{node.port},job_id={job_id}")
+        time.sleep(config.Aligned_poll_interval)
+        try:
+            res = requests.get(
+                f"{base_url}/progress/{job_id}", headers=headers, timeout=10)
+            if res.status_code != 200:
+                raise HTTPException(
+                    400, detail=f"获取对齐进度失败,res:{res.json().get('detail')}")
+            progress = res.json()
+            if progress["status"] == "interrupted":
+                config.logger.info("对齐任务中断，从检查点继续: job_id=%s", job_id)
+                res = requests.post(f"{base_url}/resume/{job_id}",
+                                    headers=headers, timeout=10)
+                if res.status_code != 200:
+                    raise HTTPException(
+                        400, detail=f"继续对齐任务失败,res:{res.json().get('detail')}")
+            failures = 0
+        except requests.RequestException as e:
+            failures += 1
+            if failures >= config.Aligned_poll_retries:
+                raise HTTPException(
+                    400, detail=f"获取对齐进度失败,{node.ip}:{node.port},{e}") from e
+            continue
+        if on_progress is not None:
+            on_progress(progress)
+        if progress["status"] == "finished":
+            return progress
+        elif progress["status"] == "failed":
+            raise HTTPException(
+                400, detail=f"对齐数据失败,res:{progress.get('error')}")
+
+
+def delete_aligned(node, file_name):
+    """
+    通知节点删除对齐数据，用于规则创建失败后清理已写入的部分，失败时只记录日志
+
+    Args:
+        node (Node): 对齐数据所在节点
+        file_name (str): 对齐数据文件名
+    """
+    try:
+        res = requests.post(
+            f"http://{node.ip}:{node.port}/aligned/delete",
+            headers={"x-forwarded-for": config.Host},
+            json={"file_name": file_name},
+            timeout=30,
+        )
+        if res.status_code != 200:
+            config.logger.warning(
+                f"节点 {node.nodename} 删除对齐数据 {file_name} 失败: {res.text}")
+    except requests.RequestException as e:
+        config.logger.warning(f"节点 {node.nodename} 删除对齐数据 {file_name} 失败: {e}")
+
+
+def save_ruler_task(task):
+    """保存规则创建任务状态"""
+    task["updated_at"] = time.time()
+    redis.set(f"ruler_task:{task['task_id']}", json.dumps(task), ex=RULER_TASK_EXPIRE)
+
+
+def load_ruler_task(task_id):
+    """读取规则创建任务状态，不存在时返回 None"""
+    task = redis.get(f"ruler_task:{task_id}")
+    if task is None:
+        return None
+    return json.loads(task)
+
+
 @ruler.post("/add")
 def add(ruler_info: RulerInfo) -> dict:
     """
     添加数据对齐规则
 
+    校验规则后立即返回任务ID，各节点的对齐及规则的保存在后台线程中执行，
+    进度通过 /ruler/add/progress/{task_id} 查询。
+
     Args:
         ruler_info (RulerInfo): 规则信息，包含规则名称、对齐数据库、原始数据库、字段和规则列表
 
     Returns:
-        dict: 包含状态信息的字典，成功返回 {"status": "success"}
+        dict: {"status": "running", "task_id": ...}
 
     Raises:
-        HTTPException: 当规则为空或创建规则失败时抛出400错误
+        HTTPException: 存储格式、规则不合法或原始数据库不存在时抛出400错误
     """
 
+    if ruler_info.storage_format not in STORAGE_FORMATS:
+        raise HTTPException(
+            400, detail=f"不支持的存储格式: {ruler_info.storage_format}")
+    validate_ruler(ruler_info)
     file_name = str(uuid.uuid4())
-    original_db = ruler_info.original_db
-    ruler_model = RulerModel(
-        aligned_db=ruler_info.aligned_db,
-        ruler_name=ruler_info.ruler_name,
-        ruler_field=[field.model_dump()
-                     for field in ruler_info.field],  # 序列化字段列表
-        original_db=[db.model_dump() for db in original_db],  # 序列化数据库列表
-        data_count=0,
-        file_name=file_name,
-    )
-    data_count = 0
-    ruler_detail = []
-    for ruler_item in ruler_info.ruler:
+
+    groups = {}
+    for index, ruler_item in enumerate(ruler_info.ruler):
         data_base = ruler_item.db
         db_item = DataBase.select().where(DataBase.nodename == data_base.nodename,
-                                          DataBase.db_name == data_base.name, DataBase.id == data_base.id).get()
+                                          DataBase.db_name == data_base.name, DataBase.id == data_base.id).get_or_none()
+        if db_item is None:
+            raise HTTPException(400, detail=f"{data_base.name},数据库不存在")
+        groups.setdefault(db_item.node.id, []).append((index, ruler_item, db_item))
+
+    task = {
+        "task_id": str(uuid.uuid4()),
+        "status": "running",
+        "ruler_name": ruler_info.ruler_name,
+        "file_name": file_name,
+        # 各原始数据库的对齐进度，顺序与 ruler_info.ruler 一致
+        "items": [{
+            "nodename": ruler_item.db.nodename,
+            "db_name": ruler_item.db.name,
+            "status": "pending",
+            "rows_done": 0,
+            "rows_total": None,
+            "rows_per_second": 0.0,
+        } for ruler_item in ruler_info.ruler],
+        "timings": [],
+        "ruler_id": None,
+        "error": None,
+        "created_at": time.time(),
+    }
+    save_ruler_task(task)
+    active_ruler_tasks.add(task["task_id"])
+    threading.Thread(target=run_add_task, args=(task, ruler_info, groups), daemon=True).start()
+    return {"status": "running", "task_id": task["task_id"]}
 
-        node = db_item.node
-        res = requests.post(
-            f"http://{node.ip}:{node.port}/aligned/add"
-            f"?file_name={file_name}&original_file={db_item.file_name}",
-            headers={
-                "x-forwarded-for": config.Host
-            },
-            json=ruler_item.model_dump(),
-            timeout=300  # 设置300秒超时，防止请求无限等待
+
+def run_add_task(task, ruler_info, groups):
+    """
+    在后台线程中执行规则创建: 各节点并发对齐，全部成功后写入规则及详情
+
+    任一节点失败时不保存规则，并删除各节点上已写入的对齐数据。
+
+    Args:
+        task (dict): 规则创建任务状态
+        ruler_info (RulerInfo): 规则信息
+        groups (dict): 节点ID -> [(序号, 该数据库的规则, 原始数据库)]
+    """
+    file_name = task["file_name"]
+    lock = threading.Lock()  # 各节点线程共同更新任务状态
+
+    def update_item(index, **fields):
+        with lock:
+            task["items"][index].update(fields)
+            save_ruler_task(task)
+
+    def align_node(items):
+        # 同一节点上的数据库写入同一个对齐文件，在同一线程中依次执行
+        node_results = []
+        for index, ruler_item, db_item in items:
+            started_at = time.time()
+            update_item(index, status="running")
+            try:
+                result = request_aligned(
+                    db_item, file_name, ruler_info.storage_format, ruler_item.model_dump(),
+                    complevel=ruler_info.complevel, complib=ruler_info.complib,
+                    on_progress=lambda progress, index=index: update_item(
+                        index, rows_done=progress["rows_done"], rows_total=progress["rows_total"],
+                        rows_per_second=progress["rows_per_second"]))
+            except Exception as e:
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                update_item(index, status="failed")
+                node_results.append((index, None, f"{db_item.nodename}-{db_item.db_name}: {detail}"))
+                break
+            update_item(index, status="finished")
+            node_results.append((index, (result, time.time() - started_at), None))
+        return node_results
+
+    try:
+        # 各节点的对齐任务并发执行，总耗时取决于最慢的节点
+        results = {}
+        errors = []
+        with ThreadPoolExecutor(max_workers=max(len(groups), 1)) as executor:
+            for future in as_completed([executor.submit(align_node, items) for items in groups.values()]):
+                for index, result, error in future.result():
+                    if error is None:
+                        results[index] = result
+                    else:
+                        errors.append(error)
+
+        timings = []
+        for index, ruler_item in enumerate(ruler_info.ruler):
+            if index in results:
+                result, seconds = results[index]
+                timings.append({
+                    "nodename": ruler_item.db.nodename,
+                    "db_name": ruler_item.db.name,
+                    "seconds": round(seconds, 2),
+                    "data_count": result.get("data_count", 0),
+                    "rows_per_second": result.get("rows_per_second", 0),
+                    "rows_dropped": result.get("rows_dropped", 0),
+                    "field_failures": result.get("field_failures", {}),
+                })
+        task["timings"] = timings
+        if errors:
+            # 规则不会保存，删除各节点上已写入的对齐数据(包括只写入了一部分的节点)
+            for items in groups.values():
+                delete_aligned(items[0][2].node, file_name)
+            task["status"] = "failed"
+            task["error"] = f"对齐数据失败,{'; '.join(errors)}"
+            return
+
+        # 全部节点成功后才写入规则及详情
+        ruler_model = RulerModel(
+            aligned_db=ruler_info.aligned_db,
+            ruler_name=ruler_info.ruler_name,
+            ruler_field=[field.model_dump()
+                         for field in ruler_info.field],  # 序列化字段列表
+            original_db=[db.model_dump() for db in ruler_info.original_db],  # 序列化数据库列表
+            data_count=0,
+            file_name=file_name,
+            storage_format=ruler_info.storage_format,
         )
+        data_count = 0
+        ruler_detail = []
+        for index, ruler_item in enumerate(ruler_info.ruler):
+            result, _ = results[index]
+            data_count += result.get("data_count", 0)
+
+            ruler_detail.append(
+                RulerDetail(
+                    original_db=ruler_item.db.model_dump(),
+                    operator=[op.model_dump() for op in ruler_item.operator],
+                    aligned_rows=result.get(
+                        "high_water_mark", result.get("data_count", 0)),
+                    constants=result.get("constants"),
+                )
+            )
+        with database.atomic():
+            ruler_model.data_count = int(data_count)
+            ruler_model.save()
+            for detail in ruler_detail:
+                detail.ruler_id = ruler_model.id
+                detail.save()
+        task["ruler_id"] = ruler_model.id
+        task["status"] = "finished"
+    except Exception as e:
+        config.logger.error("创建对齐规则失败: task_id=%s, %s", task["task_id"], str(e))
+        for items in groups.values():
+            delete_aligned(items[0][2].node, file_name)
+        task["status"] = "failed"
+        task["error"] = str(e)
+    finally:
+        active_ruler_tasks.discard(task["task_id"])
+        with lock:
+            save_ruler_task(task)
+
+
+@ruler.get("/add/progress/{task_id}")
+def get_add_progress(task_id: str) -> dict:
+    """
+    查询规则创建任务进度
+
+    Returns:
+        dict: status 为 running/finished/failed/interrupted，interrupted 表示任务未完成但
+            已不在运行(如中心服务器重启)，需要重新创建规则；items 为各原始数据库的对齐进度，
+            rows_done/rows_total 为全部数据库的合计(节点尚未返回总行数时 rows_total 不含该数据库)，
+            finished 时 ruler_id 为新建的规则ID
+    """
+    task = load_ruler_task(task_id)
+    if task is None:
+        raise HTTPException(400, detail=f"规则创建任务{task_id}不存在")
+    if task["status"] == "running" and task_id not in active_ruler_tasks:
+        task["status"] = "interrupted"
+    task["rows_done"] = sum(item["rows_done"] for item in task["items"])
+    task["rows_total"] = sum(item["rows_total"] or 0 for item in task["items"])
+    return task
+
+
+@ruler.post("/dry_run")
+def dry_run(ruler_info: RulerInfo, request: Request) -> dict:
+    """
+    试运行数据对齐规则
+
+    各原始数据库所在节点随机抽取若干数据块执行规则，不写入对齐数据，也不保存规则。
+    汇总各节点的预览数据、字段类型转换失败率和错误，并估算完整对齐的耗时和输出大小:
+    同一节点上的数据库依次对齐，耗时相加；不同节点并发执行，总耗时取最慢的节点。
+
+    Args:
+        ruler_info (RulerInfo): 规则信息
+        request (Request): 请求对象，可选查询参数 chunks(每个数据库抽样块数)
+
+    Returns:
+        dict: 包含各数据库试运行结果及汇总估算的字典
+    """
+    if ruler_info.storage_format not in STORAGE_FORMATS:
+        raise HTTPException(
+            400, detail=f"不支持的存储格式: {ruler_info.storage_format}")
+    validate_ruler(ruler_info)
+    chunks = request.query_params.get("chunks")
+
+    def dry_run_db(ruler_item):
+        data_base = ruler_item.db
+        db_item = DataBase.select().where(DataBase.nodename == data_base.nodename,
+                                          DataBase.db_name == data_base.name, DataBase.id == data_base.id).get_or_none()
+        if db_item is None:
+            raise HTTPException(400, detail=f"{data_base.name},数据库不存在")
+        node = db_item.node
+        url = (f"http://{node.ip}:{node.port}/aligned/dry_run"
+               f"?original_file={db_item.file_name}&storage_format={ruler_info.storage_format}"
+               f"{compression_query(ruler_info.complevel, ruler_info.complib)}")
+        if chunks:
+            url += f"&chunks={chunks}"
+        res = requests.post(url, headers={"x-forwarded-for": config.Host},
+                            json=ruler_item.model_dump(), timeout=300)
         if res.status_code != 200:
             raise HTTPException(
-                400, detail=f"对齐数据失败,res:{res.json().get('detail')}"
-            )
-        data_count += res.json().get("data_count", 0)
+                400, detail=f"{data_base.nodename}-{data_base.name}: 试运行失败,res:{res.json().get('detail')}")
+        return node.id, res.json()
+
+    with ThreadPoolExecutor(max_workers=max(len(ruler_info.ruler), 1)) as executor:
+        results = list(executor.map(dry_run_db, ruler_info.ruler))
+
+    items = []
+    node_seconds = {}
+    estimated_bytes = 0
+    total_rows = 0
+    for ruler_item, (node_id, result) in zip(ruler_info.ruler, results):
+        items.append({
+            "nodename": ruler_item.db.nodename,
+            "db_name": ruler_item.db.name,
+            **result,
+        })
+        total_rows += result.get("total_rows", 0)
+        estimated_bytes += result.get("estimated_bytes") or 0
+        node_seconds[node_id] = node_seconds.get(node_id, 0) + (result.get("estimated_seconds") or 0)
 
-        ruler_detail.append(
-            RulerDetail(
-                ruler_id=ruler_model.id,
-                original_db=ruler_item.db.model_dump(),
-                operator=[op.model_dump() for op in ruler_item.operator],
-            )
+    return {
+        "status": "success",
+        "items": items,
+        "total_rows": total_rows,
+        "estimated_seconds": round(max(node_seconds.values(), default=0), 2),
+        "estimated_bytes": int(estimated_bytes),
+    }
+
+
+@ruler.post("/refresh")
+def refresh(ruler_id: RulerId) -> dict:
+    """
+    增量刷新对齐数据
+
+    复用已保存的规则(RulerDetail.operator)，只对齐各原始数据库在高水位
+    (RulerDetail.aligned_rows)之后新增的行，并追加到已有的对齐数据中。
+    聚合操作符(avg/max/min)沿用创建时保存的结果(RulerDetail.constants)，新增的行与
+    已对齐的行使用相同的常量；保存该字段之前创建的规则没有这些结果，第一次刷新时由节点
+    按当前的全部原始数据重新计算并保存，此后的刷新沿用这次的结果。
+    原始数据在节点上按内容存储，新增的行原地追加到原文件中，引用同一文件的数据库都会看到；
+    节点导入时记录了行数，已被追加过的文件不会再被相同内容的上传复用(见节点 utils.upload)。
+
+    Args:
+        ruler_id (RulerId): 对齐规则ID
+
+    Returns:
+        dict: 包含状态信息和本次新增行数的字典
+    """
+    ruler_item = RulerModel.select().where(
+        RulerModel.id == ruler_id.id).get_or_none()
+    if ruler_item is None:
+        raise HTTPException(400, detail="对齐规则不存在")
+
+    new_rows = 0
+    for detail in RulerDetail.select().where(RulerDetail.ruler_id == ruler_item.id):
+        db_item = DataBase.select().where(
+            DataBase.id == detail.original_db.get("id")).get_or_none()
+        if db_item is None:
+            raise HTTPException(
+                400, detail=f"{detail.original_db.get('name')},数据库不存在")
+        if detail.aligned_rows == 0 and ruler_item.data_count > 0 and db_item.data_number > 0:
+            # 高水位缺失(如未补写的旧规则)时从第 0 行开始会重复追加已对齐的数据
+            raise HTTPException(
+                400, detail=f"{detail.original_db.get('name')},已对齐行数未知,请重新创建对齐规则")
+        result = request_aligned(
+            db_item,
+            ruler_item.file_name,
+            ruler_item.storage_format,
+            {"db": detail.original_db, "operator": detail.operator,
+             "constants": detail.constants},
+            start=detail.aligned_rows,
         )
-    # try:
-    ruler_model.data_count = int(data_count)
-    ruler_model.save()
-    for detail in ruler_detail:
-        detail.ruler_id = ruler_model.id
+        count = int(result.get("data_count", 0))
+        new_rows += count
+        # 每个数据库刷新完成后立即保存，中途失败时已追加的数据不会被重复对齐
+        detail.aligned_rows = result.get(
+            "high_water_mark", detail.aligned_rows + count)
+        if detail.constants is None:
+            detail.constants = result.get("constants")
+        detail.updated_at = datetime.now()
         detail.save()
+        ruler_item.data_count += count
+        ruler_item.updated_at = datetime.now()
+        ruler_item.save()
 
-    return {"status": "success"}
+    return {"status": "success", "data_count": new_rows}
 
 
 @ruler.get("/get")
@@ -148,6 +597,56 @@ def get(operator: Operator):
         raise HTTPException(400, detail=f"获取{op}({operator.original_field})失败")
 
 
+@ruler.post("/get_batch")
+def get_batch(operators: List[Operator]):
+    """
+    批量获取聚合操作符的统计结果
+
+    按 (节点, 文件) 分组，每组只请求一次节点的 /aligned/get_data_batch，
+    节点在一次扫描中算出该文件涉及的全部统计量。
+
+    Args:
+        operators (List[Operator]): 聚合操作符列表
+
+    Returns:
+        dict: {"data": {对齐字段名: 统计结果}}
+    """
+    groups = {}
+    for operator in operators:
+        if not isinstance(operator.original_field, OriginalField):
+            raise HTTPException(
+                400, detail=f"{operator.operator}只能作用于单个字段")
+        key = (operator.original_field.node_id,
+               operator.original_field.file_name)
+        groups.setdefault(key, []).append(operator)
+
+    data = {}
+    for (node_id, file_name), group in groups.items():
+        node = Node.select().where(Node.id == node_id).get_or_none()
+        if node is None:
+            raise HTTPException(400, detail=f"节点{node_id}不存在")
+        res = requests.post(
+            f"http://{node.ip}:{node.port}/aligned/get_data_batch",
+            headers={
+                "x-forwarded-for": config.Host,
+            },
+            json={
+                "file_name": file_name,
+                "items": [
+                    {"field": op.original_field.field, "statistic": op.operator}
+                    for op in group
+                ],
+            },
+            timeout=300  # 设置300秒超时，防止请求无限等待
+        )
+        if res.status_code != 200:
+            raise HTTPException(
+                400, detail=f"获取统计量失败,res:{res.json().get('detail')}")
+        for op, value in zip(group, res.json().get("data", [])):
+            data[op.aligned_field.field] = value
+    return {"data": data}
+
+
 @ruler.get("/list")
 def get_ruler_list():
     ruler_list = RulerModel.select().order_by(RulerModel.updated_at.desc()).dicts()
@@ -183,36 +682,61 @@ def get_aligned_data(request: Request):
 
 @ruler.post("/update-field-type")
 def update_field_type(field_type: UpdateFieldType):
+    """
+    修改对齐数据的字段类型
+
+    分两步在各节点的对齐数据上执行后台任务: 先全量校验所有节点的该列是否都能转换，
+    全部通过后再改写各节点对齐数据中的该列，最后更新规则中的字段类型。
+
+    Args:
+        field_type (UpdateFieldType): 规则ID、字段及目标类型
+
+    Returns:
+        dict: 包含状态信息的字典
+    """
     ruler_item = RulerModel.select().where(
         RulerModel.id == field_type.id).get_or_none()
     if ruler_item is None:
         raise HTTPException(400, detail="对齐规则不存在")
-    original_db_list = ruler_item.original_db
-    for original_db in original_db_list:
+    # 同一节点上的多个原始数据库共用一个对齐文件，每个节点只处理一次
+    nodes = {}
+    for original_db in ruler_item.original_db:
         db_item = DataBase.select().where(
             DataBase.id == original_db.get("id")).get_or_none()
         if db_item is None:
             raise HTTPException(
                 400, detail=f"{original_db.get('name')},数据库不存在")
-        node = db_item.node
-        json_data = dict(field_type)
-        json_data["file_name"] = ruler_item.file_name
+        nodes[db_item.node.id] = db_item.node
+
+    json_data = dict(field_type)
+    json_data["file_name"] = ruler_item.file_name
+
+    def run(node, mode):
         res = requests.post(
-            f"http://{node.ip}:{node.port}/aligned/update_field_type",
+            f"http://{node.ip}:{node.port}/aligned/update_field_type?mode={mode}",
             json=json_data,
             timeout=300,
             headers={
                 "x-forwarded-for": config.Host
             },
         )
-        if res.status_code == 200:
-            result = res.json()
-            if not result.get("convertible", False):
-                raise HTTPException(
-                    400, detail=result.get("message", "格式无法转换"))
-        else:
+        if res.status_code != 200:
             raise HTTPException(
                 400, detail=res.json().get("detail", "更新字段类型失败"))
+        if res.json().get("job_id") is None:
+            # 目标类型无法转换时节点直接返回校验结果
+            return res.json()
+        return wait_aligned_job(node, res.json().get("job_id"))
+
+    for mode in ("validate", "convert"):
+        with ThreadPoolExecutor(max_workers=max(len(nodes), 1)) as executor:
+            results = list(executor.map(lambda node: run(node, mode), nodes.values()))
+        for node, result in zip(nodes.values(), results):
+            if not result.get("convertible", False):
+                raise HTTPException(
+                    400, detail=f"{node.ip}:{node.port} " + (result.get("message") or (
+                        f"字段类型无法转换: {result.get('failures')} 个值无法转换为 "
+                        f"{field_type.type}, 例如 {result.get('examples')}")))
     try:
         for field in ruler_item.ruler_field:
             if field["field"] == field_type.field:
@@ -18,9 +18,13 @@ async def check_session(request: Request, call_next):
     center_request = [
         "/login",
         "/aligned/get_data",
+        "/aligned/get_data_batch",
         "/aligned/add",
+        "/aligned/dry_run",
+        "/aligned/delete",
         "/job/start",
-        "/aligned/update_field_type"
+        "/aligned/update_field_type",
+        "/db/delete"
     ]
     not_check_session = [
         "/check_session",
@@ -31,7 +35,8 @@ async def check_session(request: Request, call_next):
     ]
     if request.url.path in not_check_session or request.url.path.startswith("/job/log/"):
         return await call_next(request)
-    elif request.url.path in center_request:
+    elif request.url.path in center_request or request.url.path.startswith(
+            ("/aligned/progress/", "/aligned/resume/")):
         ip = request.headers.get("x-forwarded-for")
         if ip != config.center_host:
             raise HTTPException(401, detail="请求中心服务器")
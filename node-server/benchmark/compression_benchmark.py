@@ -0,0 +1,111 @@
+"""HDF5 压缩性能测试
+
+在合成数据上对比不同压缩库和压缩级别的写入吞吐量、读取吞吐量和文件大小。
+写入使用 utils.hdf.TableWriter，读取使用 utils.hdf.TableReader 分块读取全部数据，
+与上传和对齐时的读写路径一致。
+
+用法(在 node-server 目录下):
+    python benchmark/compression_benchmark.py --rows 1000000
+    python benchmark/compression_benchmark.py --codecs blosc:lz4:5 blosc:zstd:5 zlib:5
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.hdf import TableReader, TableWriter, compression_options  # noqa: E402
+
+DEFAULT_CODECS = [
+    "none",
+    "zlib:1", "zlib:5",
+    "bzip2:5",
+    "blosc:blosclz:5",
+    "blosc:lz4:1", "blosc:lz4:5", "blosc:lz4:9",
+    "blosc:lz4hc:5",
+    "blosc:zstd:1", "blosc:zstd:5",
+]
+
+
+def make_data(rows, seed=0):
+    """合成数据: 数值特征、低基数的类别列、较长的文本列"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "id": np.arange(rows, dtype=np.int64),
+        "age": rng.integers(18, 90, rows),
+        "score": rng.normal(60, 15, rows).round(2),
+        "ratio": rng.random(rows),
+        "label": rng.integers(0, 2, rows),
+        "city": rng.choice(["北京", "上海", "广州", "深圳", "杭州", "成都"], rows),
+        "code": pd.Series(rng.integers(0, 100000, rows)).map(lambda v: f"C{v:06d}"),
+    })
+
+
+def parse_codec(codec):
+    """'none' -> (0, None)，'blosc:lz4:5' -> (5, 'blosc:lz4')"""
+    if codec == "none":
+        return 0, None
+    complib, _, complevel = codec.rpartition(":")
+    return int(complevel), complib
+
+
+def run(df, path, complevel, complib, chunk_size):
+    if os.path.exists(path):
+        os.remove(path)
+    start = time.perf_counter()
+    with TableWriter(path, complevel=complevel, complib=complib) as writer:
+        for i in range(0, len(df), chunk_size):
+            writer.append(df.iloc[i:i + chunk_size])
+    write_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rows = 0
+    with TableReader(path) as reader:
+        for chunk in reader.iter_chunks(chunk_size):
+            rows += len(chunk)
+    read_time = time.perf_counter() - start
+    assert rows == len(df)
+    return write_time, read_time, os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument("--codecs", nargs="+", default=DEFAULT_CODECS,
+                        help="压缩方式，格式为 complib:complevel，none 表示不压缩")
+    args = parser.parse_args()
+
+    # TableReader 每次读取都会记录日志，测试时关闭
+    logging.disable(logging.INFO)
+    df = make_data(args.rows)
+    print(f"rows: {args.rows}, chunk_size: {args.chunk_size}, "
+          f"memory: {df.memory_usage(deep=True).sum() / 2**20:.1f} MiB")
+    print(f"{'codec':<18}{'write rows/s':>14}{'read rows/s':>14}{'size MiB':>11}{'ratio':>8}")
+
+    baseline = None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "benchmark.h5")
+        for codec in args.codecs:
+            complevel, complib = parse_codec(codec)
+            try:
+                complevel, complib = compression_options(complevel, complib)
+            except ValueError as e:
+                print(f"{codec:<18}跳过: {e}")
+                continue
+            write_time, read_time, size = run(df, path, complevel, complib, args.chunk_size)
+            if baseline is None:
+                baseline = size
+            print(f"{codec:<18}{args.rows / write_time:>14,.0f}{args.rows / read_time:>14,.0f}"
+                  f"{size / 2**20:>11.1f}{baseline / size:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""训练数据加载性能测试
+
+在合成的对齐数据上对比 StreamingDataset 两种输出方式的吞吐量:
+- 逐行输出，由 DataLoader(batch_size=N) 调用 default_collate 组批
+- 按批输出(batch_size=N)，DataLoader(batch_size=None) 直接返回数据集切好的批
+两种方式的批划分一致，测试时同时校验每一批的数据相同。
+另外测试按批输出并启用缓存时多个 epoch 的耗时(第一个 epoch 读取文件并写入缓存，之后读取缓存)，
+--cache-bytes 设为 0 时测试溢出到磁盘文件的情况。
+最后按 --validation-fraction 划分验证集，调用 FlowerClient.evaluate 测试验证集上的评估耗时，
+并校验评估的行数与验证集行数一致。
+
+用法(在 node-server 目录下):
+    python benchmark/dataloader_benchmark.py --rows 200000 --batch-size 32
+    python benchmark/dataloader_benchmark.py --epochs 5 --cache-bytes 0
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job.node_server import Field, FlowerClient, StreamingDataset, split_validation  # noqa: E402
+from utils.hdf import TableReader, TableWriter  # noqa: E402
+
+
+def make_data(path, rows, features, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({f"x{i}": rng.normal(size=rows) for i in range(features)})
+    df["label"] = rng.integers(0, 2, rows)
+    with TableWriter(path) as writer:
+        for i in range(0, rows, 100000):
+            writer.append(df.iloc[i:i + 100000])
+
+
+def transform_x(X):
+    return torch.tensor(X, dtype=torch.float32)
+
+
+def transform_y(y):
+    return torch.tensor(y, dtype=torch.long)
+
+
+def run(loader):
+    start = time.perf_counter()
+    batches = [(inputs, labels) for inputs, labels in loader]
+    return time.perf_counter() - start, batches
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--features", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--cache-bytes", type=int, default=1 << 30)
+    parser.add_argument("--validation-fraction", type=float, default=0.1)
+    args = parser.parse_args()
+
+    # TableReader 每次读取都会记录日志，测试时关闭
+    logging.disable(logging.INFO)
+    input_field = [Field(field=f"x{i}", type="float") for i in range(args.features)]
+    output_field = Field(field="label", type="int")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "aligned.h5")
+        make_data(path, args.rows, args.features)
+
+        rows_dataset = StreamingDataset(path, transform_x, transform_y, input_field,
+                                        output_field, chunk_size=args.chunk_size)
+        batch_dataset = StreamingDataset(path, transform_x, transform_y, input_field,
+                                         output_field, chunk_size=args.chunk_size,
+                                         batch_size=args.batch_size)
+        rows_time, rows_batches = run(DataLoader(rows_dataset, batch_size=args.batch_size))
+        batch_time, batch_batches = run(DataLoader(batch_dataset, batch_size=None))
+
+        cache_dataset = StreamingDataset(path, transform_x, transform_y, input_field,
+                                         output_field, chunk_size=args.chunk_size,
+                                         batch_size=args.batch_size, cache=True,
+                                         cache_bytes=args.cache_bytes)
+        cache_loader = DataLoader(cache_dataset, batch_size=None)
+        epoch_times = []
+        for _ in range(args.epochs):
+            epoch_time, cache_batches = run(cache_loader)
+            epoch_times.append(epoch_time)
+            for (x1, y1), (x2, y2) in zip(batch_batches, cache_batches):
+                assert torch.equal(x1, x2) and torch.equal(y1, y2)
+        spilled = cache_dataset._cache.arrays is not None
+
+        # 按训练任务的方式划分验证集并评估
+        with TableReader(path) as reader:
+            ranges = reader.chunk_ranges(args.chunk_size)
+        train_ranges, val_ranges = split_validation(ranges, args.validation_fraction, seed=0)
+        val_rows = sum(stop - start for start, stop in val_ranges)
+        val_dataset = StreamingDataset(path, transform_x, transform_y, input_field,
+                                       output_field, chunk_size=args.chunk_size,
+                                       batch_size=args.batch_size, cache=True,
+                                       row_ranges=val_ranges)
+        train_dataset = StreamingDataset(path, transform_x, transform_y, input_field,
+                                         output_field, chunk_size=args.chunk_size,
+                                         batch_size=args.batch_size, row_ranges=train_ranges)
+        model = nn.Linear(args.features, 2)
+        client = FlowerClient(
+            DataLoader(train_dataset, batch_size=None), model, logging.getLogger("benchmark"),
+            nn.CrossEntropyLoss(), torch.optim.SGD(model.parameters(), lr=0.01), 1, 0, "benchmark",
+            valloader=DataLoader(val_dataset, batch_size=None))
+        parameters = client.get_parameters(config={})
+        eval_times = []
+        for _ in range(2):
+            start = time.perf_counter()
+            _, total, metrics = client.evaluate(parameters, {})
+            eval_times.append(time.perf_counter() - start)
+            assert total == val_rows, (total, val_rows)
+
+    assert len(rows_batches) == len(batch_batches)
+    for (x1, y1), (x2, y2) in zip(rows_batches, batch_batches):
+        assert torch.equal(x1, x2) and torch.equal(y1, y2)
+    print(f"rows: {args.rows}, features: {args.features}, batch_size: {args.batch_size}")
+    print(f"per-row:  {rows_time:.3f}s ({args.rows / rows_time:,.0f} samples/s)")
+    print(f"batched:  {batch_time:.3f}s ({args.rows / batch_time:,.0f} samples/s)")
+    print(f"speedup:  {rows_time / batch_time:.1f}x")
+    print(f"cached epochs ({'mmap' if spilled else 'memory'}): "
+          + ", ".join(f"{args.rows / t:,.0f}" for t in epoch_times) + " samples/s")
+    print(f"evaluate ({val_rows} validation rows): "
+          + ", ".join(f"{t:.3f}s" for t in eval_times) + f", acc {metrics['acc']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
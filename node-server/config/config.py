@@ -31,6 +31,44 @@ class Config(object):
     center_host = "127.0.0.1"
     center_port = 8000
 
+    # 数据对齐配置
+    Aligned_chunk_size = 10000  # 每个数据块的行数
+    Aligned_workers = 1  # 对齐工作进程数，1 为单进程顺序处理，0 为使用全部 CPU 核心
+    Aligned_queue_depth = 4  # 同时在途的数据块数量上限，用于限制内存占用
+    Aligned_dry_run_chunks = 5  # 试运行时随机抽样的数据块数量
+
+    # 大文件上传配置
+    Upload_window = 8  # 建议客户端同时在途(未确认)的最大分块数
+    Upload_expire = 60 * 60 * 24 * 2  # 上传会话保留时间(秒)，期间可断线续传
+
+    # 数据导入配置
+    Ingest_chunk_size = 100000  # pandas 解析 CSV 及读取 HDF5 时每块的行数
+    Ingest_block_size = 64 << 20  # pyarrow 解析 CSV 时每块的字节数
+
+    # HDF5 压缩配置(部署级默认值，上传和对齐时可按数据集单独指定)
+    Hdf_complevel = 0  # 压缩级别 0-9，0 为不压缩
+    Hdf_complib = "blosc:lz4"  # 压缩库: zlib / lzo / bzip2 / blosc / blosc:lz4 / blosc:zstd 等
+
+    # 字符串列存储配置
+    String_min_itemsize = 8  # 字符串列的最小存储长度(字节)
+    Category_max_unique = 1000  # 不同取值不超过该数量的字符串列按字典编码(categorical)存储
+    Category_max_ratio = 0.5  # 且不同取值数不超过行数的该比例
+
+    # 训练数据配置
+    # 第一次读取时缓存转换后的训练数据，之后的 epoch 和轮次直接读取缓存(任务未指定时使用)。
+    # 缓存的是转换函数的输出，只适用于确定性的 transform_x/transform_y，带随机数据增强时
+    # 第一个 epoch 之后的增强结果会被固定，因此默认关闭
+    Train_cache = False
+    Train_cache_bytes = 1 << 30  # 内存缓存的字节数上限，超过时溢出到磁盘文件(内存映射读取)
+    Train_cache_dir = "data/cache"  # 溢出文件目录
+    Train_num_workers = 0  # DataLoader 工作进程数，0 为在训练进程中读取数据(任务未指定时使用)
+    Train_prefetch_factor = 2  # 每个工作进程预取的批数
+    Train_pin_memory = False  # 是否使用锁页内存(仅在使用 GPU 时生效)
+    Train_shuffle = False  # 是否打乱训练数据: 随机顺序读取数据块，再在有界缓冲区内打乱行
+    Train_shuffle_buffer = 100000  # 打乱缓冲区的行数，决定打乱的范围和内存占用
+    Train_validation_fraction = 0.1  # 验证集占数据的比例(按数据块抽取)，0 为不划分验证集
+    Train_validation_max_rows = None  # 验证集的最大行数，超过时抽样，为空时不限制
+
     # database config
     Redis_host = "10.211.55.14"
     Redis_port = 6379
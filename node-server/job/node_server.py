@@ -1,16 +1,20 @@
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import IterableDataset, DataLoader
+from torch.utils.data import IterableDataset, DataLoader, get_worker_info
 import pandas as pd
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 import flwr as fl
 import logging
 import importlib
-from typing import Tuple
+import os
+import tempfile
+import numpy as np
+from typing import Optional, Tuple
 from pydantic import BaseModel
 from typing import List
 from config import config
+from utils.storage import aligned_path, open_reader
 import requests
 import time
 
@@ -67,9 +71,17 @@ def init_net(net_id) -> Tuple[nn.Module, dict]:
 
 # 客户端类
 class FlowerClient(fl.client.NumPyClient):
-    def __init__(self, trainloader, model, logger, criterion, optimizer, epochs, node_id, job_id):
+    """
+    Args:
+        trainloader (DataLoader): 训练数据
+        valloader (DataLoader): 验证数据，为空时在训练数据上评估
+    """
+
+    def __init__(self, trainloader, model, logger, criterion, optimizer, epochs, node_id, job_id,
+                 valloader=None):
         self.model = model.to(device)
         self.trainloader = trainloader
+        self.valloader = valloader
         self.criterion = criterion
         self.optimizer = optimizer
         self.epochs = epochs
@@ -87,23 +99,28 @@ class FlowerClient(fl.client.NumPyClient):
 
     def fit(self, parameters, config):
         self.set_parameters(parameters)
-        self.model.train()
         current_round = config.get("current_round", 0)
 
         self.logger.info(f"\n=== 第 {current_round} 轮参数交换后的训练 ===")
-        _, _, data = self.evaluate(parameters, config)
-        self.logger.info(
-            f"[第{current_round}轮初始] Loss: {float(data['loss']):.4f}, Acc: {float(data['acc']):.4f}"
-        )
+        if self.valloader is not None:
+            # 只在验证集上评估，训练集上的指标由训练过程顺带统计
+            data = self.evaluate_loader(self.valloader)
+            self.logger.info(
+                f"[第{current_round}轮初始] 验证 Loss: {float(data['loss']):.4f}, Acc: {float(data['acc']):.4f}"
+            )
+        self.model.train()
 
         # 记录处理的样本数
         samples_processed = 0
+        epoch_loss = epoch_acc = 0.0
 
         for epoch in range(self.epochs):  # 本地训练5个epoch
-            total_loss = 0.0
-            correct = 0.0
+            # 指标在设备上累加，每个 epoch 结束时再同步一次，避免每批同步
+            total_loss = torch.zeros((), device=device)
+            correct = torch.zeros((), device=device)
             total = 0
             for inputs, labels in self.trainloader:
+                inputs, labels = to_device(inputs), to_device(labels)
                 self.optimizer.zero_grad()
                 outputs = self.model(inputs)
                 loss = self.criterion(outputs, labels)
@@ -114,14 +131,14 @@ class FlowerClient(fl.client.NumPyClient):
                 batch_size = inputs.size(0)
                 if epoch == 0:
                     samples_processed += batch_size
-                total_loss += loss.item() * batch_size
-                _, predicted = torch.max(outputs, 1)
-                correct += (predicted == labels).sum().item()
+                total_loss += loss.detach() * batch_size
+                _, predicted = torch.max(outputs.detach(), 1)
+                correct += (predicted == labels).sum()
                 total += batch_size
 
             # 每个epoch输出
-            epoch_loss = total_loss / total
-            epoch_acc = correct / total
+            epoch_loss = total_loss.item() / max(total, 1)
+            epoch_acc = correct.item() / max(total, 1)
             self.logger.info(
                 f"第{current_round}轮 - Epoch {epoch+1} - Loss: {epoch_loss:.4f}, Acc: {epoch_acc:.4f}"
             )
@@ -129,62 +146,377 @@ class FlowerClient(fl.client.NumPyClient):
             update_jop_data(current_round*self.epochs+epoch+1,
                             self.job_id, self.node_id, self.logger)
             time.sleep(0.2)
-        _, _, finally_data = self.evaluate(parameters, config)
-        self.logger.info(
-            f"[第{current_round}轮最终] Loss: {float(finally_data['loss']):.4f}, Acc: {float(finally_data['acc']):.4f}"
-        )
-        # 返回处理的样本数而不是数据集长度
-        return self.get_parameters(config={}), samples_processed, {}
+        if self.valloader is not None:
+            finally_data = self.evaluate_loader(self.valloader)
+            self.logger.info(
+                f"[第{current_round}轮最终] 验证 Loss: {float(finally_data['loss']):.4f}, Acc: {float(finally_data['acc']):.4f}"
+            )
+        # 返回处理的样本数而不是数据集长度，训练指标取最后一个 epoch
+        return self.get_parameters(config={}), samples_processed, {
+            "train_loss": epoch_loss, "train_acc": epoch_acc}
 
     def evaluate(self, parameters, config):
-        """辅助方法用于评估模型"""
+        """在验证集上评估给定的模型参数"""
+        self.set_parameters(parameters)
+        # DataLoader 没有长度(StreamingDataset 未定义 __len__)，不能用 or 判断
+        loader = self.valloader if self.valloader is not None else self.trainloader
+        data = self.evaluate_loader(loader)
+        return float(data["loss"]), data["total"], {"acc": data["acc"], "loss": data["loss"]}
+
+    def evaluate_loader(self, loader):
+        """在指定数据上评估当前模型
+
+        Returns:
+            dict: {"loss", "acc", "total"}
+        """
         self.model.eval()
-        total_loss = 0.0
-        correct = 0
+        total_loss = torch.zeros((), device=device)
+        correct = torch.zeros((), device=device)
         total = 0
         with torch.no_grad():
-            for inputs, labels in self.trainloader:
+            for inputs, labels in loader:
+                inputs, labels = to_device(inputs), to_device(labels)
                 outputs = self.model(inputs)
                 loss = self.criterion(outputs, labels)
-                total_loss += loss.item() * inputs.size(0)
-                _, predicted = torch.max(outputs.data, 1)
+                total_loss += loss * inputs.size(0)
+                _, predicted = torch.max(outputs, 1)
                 total += labels.size(0)
-                correct += (predicted == labels).sum().item()
-        return (
-            float(total_loss / total),
-            total,
-            {"acc": correct / total, "loss": total_loss / total},
-        )
+                correct += (predicted == labels).sum()
+        total_loss, correct = total_loss.item(), correct.item()
+        return {
+            "loss": total_loss / max(total, 1),
+            "acc": correct / max(total, 1),
+            "total": total,
+        }
+
+
+def to_device(tensor):
+    """将一批数据移动到训练设备，锁页内存中的数据异步复制"""
+    return tensor.to(device, non_blocking=True)
+
+
+def to_tensor(data):
+    """将 transform 的结果转换为张量，与 DataLoader 默认的 collate 结果一致"""
+    return data if torch.is_tensor(data) else torch.as_tensor(data)
+
+
+class TensorCache:
+    """转换后训练数据的缓存
+
+    按数据块依次写入，总字节数不超过 max_bytes 时保存在内存中，
+    超过后将已有数据和后续数据写入磁盘上的临时文件，写完后以内存映射方式读取。
+    读取时按写入时的数据块划分返回，与直接读取原始数据的结果一致。
+
+    Args:
+        max_bytes (int): 内存缓存的字节数上限
+        spill_dir (str): 溢出文件目录
+    """
+
+    def __init__(self, max_bytes, spill_dir):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.chunks = []  # 内存缓存的 (X, y)
+        self.chunk_rows = []  # 每个数据块的行数
+        self.nbytes = 0
+        self.files = None  # 溢出时 X、y 的临时文件
+        self.layout = None  # 溢出时 X、y 的 (dtype, 每行形状)
+        self.arrays = None  # 溢出文件的内存映射
+        self.offsets = None  # 溢出时各数据块的起始行
+        self.complete = False
+
+    def add(self, X, y):
+        """写入一个数据块"""
+        nbytes = X.element_size() * X.nelement() + y.element_size() * y.nelement()
+        if self.files is None and self.nbytes + nbytes > self.max_bytes:
+            self._spill()
+        self.nbytes += nbytes
+        self.chunk_rows.append(len(X))
+        if self.files is None:
+            self.chunks.append((X, y))
+        else:
+            self._write(X, y)
+
+    def finish(self):
+        """写入完成，溢出时映射临时文件"""
+        if self.files is not None:
+            self.offsets = np.concatenate([[0], np.cumsum(self.chunk_rows)]).tolist()
+            rows = self.offsets[-1]
+            self.arrays = []
+            for file, (dtype, shape) in zip(self.files, self.layout):
+                file.flush()
+                # copy-on-write 映射，转换为张量时不需要复制，也不会修改文件
+                self.arrays.append(np.memmap(file, dtype=dtype, mode="c", shape=(rows, *shape)))
+        self.complete = True
+
+    def __len__(self):
+        return len(self.chunk_rows)
+
+    def __getitem__(self, index):
+        """第 index 个数据块"""
+        if self.arrays is None:
+            return self.chunks[index]
+        X, y = self.arrays
+        start, stop = self.offsets[index], self.offsets[index + 1]
+        return torch.from_numpy(X[start:stop]), torch.from_numpy(y[start:stop])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def _spill(self):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        # 临时文件关闭(缓存被回收)后自动删除
+        self.files = [tempfile.TemporaryFile(dir=self.spill_dir) for _ in range(2)]
+        chunks, self.chunks = self.chunks, []
+        for X, y in chunks:
+            self._write(X, y)
+
+    def _write(self, X, y):
+        arrays = [X.numpy(), y.numpy()]
+        layout = [(array.dtype, array.shape[1:]) for array in arrays]
+        if self.layout is None:
+            self.layout = layout
+        elif layout != self.layout:
+            raise ValueError(f"数据块的类型或形状不一致: {layout} != {self.layout}")
+        for file, array in zip(self.files, arrays):
+            file.write(np.ascontiguousarray(array).tobytes())
+
+
+def shuffle_buffer(chunks, buffer_size, rng):
+    """在有界缓冲区内打乱行顺序
+
+    依次读入数据块，缓冲区行数达到 buffer_size 后随机排列其中的行整体输出，
+    内存中至多保留 buffer_size 加一个数据块的行数。
+
+    Args:
+        chunks: (X, y) 数据块迭代器
+        buffer_size (int): 缓冲区行数
+        rng (np.random.Generator): 随机数生成器
+
+    Yields:
+        tuple: 打乱后的 (X, y)
+    """
+    buffer_x, buffer_y, rows = [], [], 0
+    for X, y in chunks:
+        buffer_x.append(to_tensor(X))
+        buffer_y.append(to_tensor(y))
+        rows += len(X)
+        if rows >= buffer_size:
+            index = torch.from_numpy(rng.permutation(rows))
+            yield torch.cat(buffer_x)[index], torch.cat(buffer_y)[index]
+            buffer_x, buffer_y, rows = [], [], 0
+    if rows:
+        index = torch.from_numpy(rng.permutation(rows))
+        yield torch.cat(buffer_x)[index], torch.cat(buffer_y)[index]
+
+
+def complement_ranges(ranges, total):
+    """[0, total) 中不在 ranges(有序、互不重叠)中的行区间"""
+    result = []
+    position = 0
+    for start, stop in ranges:
+        if start > position:
+            result.append((position, start))
+        position = max(position, stop)
+    if position < total:
+        result.append((position, total))
+    return result
+
+
+def split_validation(ranges, fraction=None, row_range=None, max_rows=None, seed=None):
+    """
+    划分训练集和验证集
+
+    指定 row_range 时以该行区间为验证集，否则按 fraction 随机抽取数据块作为验证集，
+    验证集超过 max_rows 行时再随机抽取部分数据块，其余的行全部作为训练集。
+    同一个 seed 的划分结果相同。
+
+    Args:
+        ranges (list): 全部数据按数据块切分的行区间(reader.chunk_ranges 的结果)
+        fraction (float): 验证集占比
+        row_range (list): 验证集行区间 [start, stop)
+        max_rows (int): 验证集最大行数
+        seed (int): 随机种子
+
+    Returns:
+        tuple: (训练集行区间列表, 验证集行区间列表)
+    """
+    rng = np.random.default_rng(seed)
+    nrows = ranges[-1][1] if ranges else 0
+    if row_range is not None:
+        start, stop = max(row_range[0], 0), min(row_range[1], nrows)
+        validation = [(start, stop)] if start < stop else []
+    elif fraction:
+        if len(ranges) < 2:
+            # 数据不足两个数据块时取末尾的行
+            rows = int(np.ceil(nrows * fraction))
+            validation = [(nrows - rows, nrows)] if 0 < rows < nrows else []
+        else:
+            count = min(max(int(round(len(ranges) * fraction)), 1), len(ranges) - 1)
+            validation = [ranges[index] for index in sorted(
+                rng.choice(len(ranges), count, replace=False))]
+    else:
+        validation = []
+    if max_rows is not None and sum(stop - start for start, stop in validation) > max_rows:
+        # 验证集过大时抽样，按数据块随机抽取
+        sampled = []
+        rows = 0
+        for index in rng.permutation(len(validation)):
+            start, stop = validation[index]
+            stop = min(stop, start + max_rows - rows)
+            sampled.append((start, stop))
+            rows += stop - start
+            if rows >= max_rows:
+                break
+        validation = sorted(sampled)
+    return complement_ranges(validation, nrows), validation
 
 
 class StreamingDataset(IterableDataset):
-    def __init__(self, file_path, transform_x, transform_y, input_field, output_field, chunk_size=1000):
+    """分块读取对齐数据的训练数据集
+
+    Args:
+        file_path (str): 对齐数据路径
+        transform_x: 特征转换函数
+        transform_y: 标签转换函数
+        input_field (list): 输入字段
+        output_field (Field): 输出字段
+        chunk_size (int): 每次读取的行数
+        batch_size (int): 按批输出时每批的行数，配合 DataLoader(batch_size=None) 使用；
+            为空时逐行输出，由 DataLoader 组批
+        cache (bool): 是否在第一次完整读取时缓存转换后的数据，之后的 epoch 和轮次直接读取缓存。
+            transform_x/transform_y 必须是确定性的，带随机数据增强时缓存会固定第一次的结果
+        cache_bytes (int): 内存缓存的字节数上限，默认为 config.Train_cache_bytes
+        shuffle (bool): 是否打乱数据: 每次读取时按随机顺序访问数据块(有数据块索引时按索引切分)，
+            再经 shuffle_buffer 打乱行
+        shuffle_buffer_size (int): 打乱缓冲区的行数，默认为 config.Train_shuffle_buffer
+        seed (int): 随机种子，为空时随机生成。第 n 次读取(每轮的每个 epoch)使用由 (seed, n, 工作进程序号)
+            派生的随机数，各轮次、各 epoch 的顺序不同且可复现
+        row_ranges (list): 只读取这些行区间 [(start, stop), ...]，为空时读取全部数据
+
+    DataLoader 使用多个工作进程时，各进程按数据块轮流分配读取的行区间，每行只被一个进程读取；
+    缓存保存在各工作进程中(需 persistent_workers=True)，内存上限按进程数均分。
+    """
+
+    def __init__(self, file_path, transform_x, transform_y, input_field, output_field,
+                 chunk_size=1000, batch_size=None, cache=False, cache_bytes=None,
+                 shuffle=False, shuffle_buffer_size=None, seed=None, row_ranges=None):
         self.file_path = file_path
         self.chunk_size = chunk_size
+        self.batch_size = batch_size
         self.transform_x = transform_x
         self.transform_y = transform_y
         self.input_field = input_field
         self.output_field = output_field
+        self.cache = cache
+        self.cache_bytes = config.Train_cache_bytes if cache_bytes is None else cache_bytes
+        self._cache = None
+        self.shuffle = shuffle
+        self.shuffle_buffer_size = shuffle_buffer_size or config.Train_shuffle_buffer
+        self.seed = seed if seed is not None else np.random.SeedSequence().entropy
+        self._iteration = 0  # 已开始的读取次数，各工作进程中的副本同步递增
+        self.row_ranges = row_ranges
+
+    def next_rng(self):
+        """本次读取使用的随机数生成器"""
+        worker = get_worker_info()
+        rng = np.random.default_rng(
+            [self.seed, self._iteration, worker.id if worker is not None else 0])
+        self._iteration += 1
+        return rng
+
+    def iter_transformed(self, rng=None):
+        """逐块返回转换后的数据，启用缓存时第一次完整读取后从缓存返回
+
+        Args:
+            rng (np.random.Generator): 不为空时按随机顺序访问数据块
+
+        Yields:
+            tuple: (X, y) 转换后的一个数据块
+        """
+        if self._cache is not None:
+            order = range(len(self._cache)) if rng is None else rng.permutation(len(self._cache))
+            for index in order:
+                yield self._cache[index]
+            return
+        if not self.cache:
+            yield from self.read_transformed(rng)
+            return
+        worker = get_worker_info()
+        num_workers = worker.num_workers if worker is not None else 1
+        cache = TensorCache(self.cache_bytes // num_workers, config.Train_cache_dir)
+        for X, y in self.read_transformed(rng):
+            X, y = to_tensor(X), to_tensor(y)
+            cache.add(X, y)
+            yield X, y
+        # 中途停止读取时缓存不完整，下次重新读取
+        cache.finish()
+        self._cache = cache
+
+    def read_transformed(self, rng=None):
+        """逐块读取并转换数据
+
+        Args:
+            rng (np.random.Generator): 不为空时按随机顺序读取数据块
+
+        Yields:
+            tuple: (X, y) 转换后的一个数据块
+        """
+        # 只读取输入输出字段，分块读取数据
+        columns = list(dict.fromkeys(
+            [field.field for field in self.input_field] + [self.output_field.field]))
+        with open_reader(self.file_path) as reader:
+            # 有数据块索引时按写入时的数据块边界切分，打乱的是索引中数据块内的行区间
+            if self.row_ranges is None:
+                ranges = reader.chunk_ranges(self.chunk_size)
+            else:
+                ranges = [bounds for start, stop in self.row_ranges
+                          for bounds in reader.chunk_ranges(self.chunk_size, start, stop)]
+            worker = get_worker_info()
+            if worker is not None:
+                # 多个工作进程时按数据块轮流分配，避免重复读取
+                ranges = ranges[worker.id::worker.num_workers]
+            if rng is not None:
+                ranges = [ranges[index] for index in rng.permutation(len(ranges))]
+            for start, stop in ranges:
+                chunk = reader.read(columns=columns, start=start, stop=stop)
+                input_cols = []
+                for field in self.input_field:
+                    col = chunk[field.field].astype(field.type, copy=False)
+                    input_cols.append(col)
+                X = pd.concat(input_cols, axis=1).values
+
+                # 处理多输出字段
+                y = chunk[self.output_field.field].astype(
+                    self.output_field.type, copy=False).values
+
+                # 对每个批次进行预处理
+                yield self.transform_x(X), self.transform_y(y)
 
     def __iter__(self):
-        # 使用 pandas 分块读取数据
-        for chunk in pd.read_hdf(self.file_path, 'df', chunksize=self.chunk_size):
-            input_cols = []
-            for field in self.input_field:
-                col = chunk[field.field].astype(field.type)
-                input_cols.append(col)
-            X = pd.concat(input_cols, axis=1).values
-
-            # 处理多输出字段
-            y = chunk[self.output_field.field].astype(
-                self.output_field.type).values
-
-            # 对每个批次进行预处理
-            X = self.transform_x(X)
-            y = self.transform_y(y)
-
-            for i in range(len(X)):
-                yield X[i], y[i]
+        if self.shuffle:
+            rng = self.next_rng()
+            chunks = shuffle_buffer(self.iter_transformed(rng), self.shuffle_buffer_size, rng)
+        else:
+            chunks = self.iter_transformed()
+        if self.batch_size is None:
+            for X, y in chunks:
+                for i in range(len(X)):
+                    yield X[i], y[i]
+            return
+        # 按批输出: 直接切片转换后的张量，不足一批的剩余行与下一块拼接，
+        # 批的划分与逐行输出再由 DataLoader 组批时一致
+        rest_x = rest_y = None
+        for X, y in chunks:
+            X, y = to_tensor(X), to_tensor(y)
+            if rest_x is not None:
+                X, y = torch.cat([rest_x, X]), torch.cat([rest_y, y])
+            full = len(X) - len(X) % self.batch_size
+            for i in range(0, full, self.batch_size):
+                yield X[i:i + self.batch_size], y[i:i + self.batch_size]
+            rest_x, rest_y = (X[full:], y[full:]) if full < len(X) else (None, None)
+        if rest_x is not None:
+            yield rest_x, rest_y
 
 
 class Field(BaseModel):
@@ -192,6 +524,22 @@ class Field(BaseModel):
     type: str
 
 
+class LoaderConfig(BaseModel):
+    num_workers: int = config.Train_num_workers
+    prefetch_factor: int = config.Train_prefetch_factor
+    pin_memory: bool = config.Train_pin_memory
+    shuffle: bool = config.Train_shuffle
+    shuffle_buffer: int = config.Train_shuffle_buffer
+    seed: Optional[int] = None
+    cache: bool = config.Train_cache
+
+
+class ValidationConfig(BaseModel):
+    fraction: Optional[float] = config.Train_validation_fraction
+    row_range: Optional[List[int]] = None  # [start, stop)，指定时优先于 fraction
+    max_rows: Optional[int] = config.Train_validation_max_rows
+
+
 class JobInfo(BaseModel):
     node_id: int
     job_id: str
@@ -200,6 +548,33 @@ class JobInfo(BaseModel):
     epochs: int
     input_field: List[Field]
     output_field: Field
+    loader_config: Optional[LoaderConfig] = None
+    validation: Optional[ValidationConfig] = None
+
+
+def create_loader(dataset, loader_config):
+    """
+    创建训练数据的 DataLoader
+
+    Args:
+        dataset (StreamingDataset): 按批输出的数据集
+        loader_config (LoaderConfig): 工作进程数、预取批数、锁页内存配置
+
+    Returns:
+        DataLoader: 数据加载器
+    """
+    options = {
+        "batch_size": None,  # 数据集已按批输出，DataLoader 不再组批
+        "pin_memory": loader_config.pin_memory and torch.cuda.is_available(),
+    }
+    if loader_config.num_workers > 0:
+        options.update(
+            num_workers=loader_config.num_workers,
+            prefetch_factor=loader_config.prefetch_factor,
+            # 工作进程在各 epoch 和轮次之间保留，进程中的缓存才能复用
+            persistent_workers=True,
+        )
+    return DataLoader(dataset, **options)
 
 
 def start(job, logger):
@@ -223,19 +598,52 @@ def start(job, logger):
         optimizer = function['optimizer'](model)  # 传入模型参数创建优化器
         criterion = function['criterion']()  # 创建损失函数实例
         # 加载数据集
+        loader_config = job_info.loader_config or LoaderConfig()
+        validation = job_info.validation or ValidationConfig()
+        file_path = aligned_path(job_info.aligned_file, base_dir="./data/aligned")  # 按已有数据集判断存储格式
         dataset = StreamingDataset(
-            f"./data/aligned/{job_info.aligned_file}.h5",  # 使用模型字段
+            file_path,
             function['transform_x'],
             function['transform_y'],
             job_info.input_field,
-            job_info.output_field
+            job_info.output_field,
+            batch_size=32,
+            cache=loader_config.cache,
+            shuffle=loader_config.shuffle,
+            shuffle_buffer_size=loader_config.shuffle_buffer,
+            seed=loader_config.seed
         )
-        trainloader = DataLoader(dataset, batch_size=32)
+        with open_reader(file_path) as reader:
+            # 与 StreamingDataset 相同，按数据块索引切分
+            ranges = reader.chunk_ranges(dataset.chunk_size)
+        train_ranges, val_ranges = split_validation(
+            ranges, validation.fraction, validation.row_range,
+            validation.max_rows, seed=dataset.seed)
+        valloader = None
+        if val_ranges:
+            dataset.row_ranges = train_ranges
+            # 验证集只读取一次，之后从缓存中评估
+            val_dataset = StreamingDataset(
+                file_path,
+                function['transform_x'],
+                function['transform_y'],
+                job_info.input_field,
+                job_info.output_field,
+                batch_size=32,
+                cache=True,
+                row_ranges=val_ranges
+            )
+            valloader = DataLoader(val_dataset, batch_size=None)
+            logger.info("验证集 %d 行，训练集 %d 行",
+                        sum(stop - start for start, stop in val_ranges),
+                        sum(stop - start for start, stop in train_ranges))
+        trainloader = create_loader(dataset, loader_config)
 
         fl.client.start_numpy_client(
             server_address="127.0.0.1:10001",
             client=FlowerClient(trainloader, model, logger,
-                                criterion, optimizer, job_info.epochs, job_info.node_id, job_info.job_id).to_client(),
+                                criterion, optimizer, job_info.epochs, job_info.node_id, job_info.job_id,
+                                valloader=valloader).to_client(),
         )
     except Exception as e:
         logger.error("任务启动失败: %s", str(e))
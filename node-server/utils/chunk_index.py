@@ -0,0 +1,184 @@
+"""数据块索引模块
+
+HDF5 表写入时按追加的数据块记录索引(与 HDF5 文件同目录的 .index.json):
+- 每个数据块的起止行号: 对齐、试运行和训练数据读取按数据块边界切分行区间，
+  每个工作进程读取的行区间不跨越写入时的数据块
+- 每个数据块的字节数(内存中各列的字节数)
+- 每个数据块中数值列的最小值 / 最大值: 统计目录失效(如原始数据追加了新数据)时，
+  max/min 统计量直接由各数据块的结果合并，不需要扫描文件
+
+索引记录数据文件的大小和修改时间，文件变化后自动失效，此时读取端按行数切分、扫描文件。
+"""
+
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def index_path(file_path):
+    """索引文件路径: data/original/xxx.h5 -> data/original/xxx.index.json"""
+    return f"{os.path.splitext(file_path)[0]}.index.json"
+
+
+def file_signature(file_path):
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def move_index(src_path, dst_path):
+    """数据文件被替换后一同移动索引文件(如临时文件写完后替换原文件)"""
+    src, dst = index_path(src_path), index_path(dst_path)
+    if os.path.exists(src):
+        os.replace(src, dst)
+    elif os.path.exists(dst):
+        # 新文件没有索引，删除原文件的旧索引
+        os.remove(dst)
+
+
+def remove_index(file_path):
+    path = index_path(file_path)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _to_json(value):
+    """numpy 标量转换为 JSON 数值，整数保持精度"""
+    value = value.item() if isinstance(value, np.generic) else value
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def summarize(chunk):
+    """统计一个数据块的字节数和数值列的最小值 / 最大值
+
+    Returns:
+        dict: {"rows", "bytes", "min": {列名: 值}, "max": {列名: 值}}
+    """
+    summary = {
+        "rows": len(chunk),
+        "bytes": int(chunk.memory_usage(index=False).sum()),
+        "min": {},
+        "max": {},
+    }
+    for column in chunk.columns:
+        values = chunk[column]
+        if not pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+            continue
+        valid = values.dropna()
+        if len(valid) == 0:
+            continue
+        summary["min"][column] = _to_json(valid.min())
+        summary["max"][column] = _to_json(valid.max())
+    return summary
+
+
+def split_ranges(ranges, chunk_size):
+    """将每个行区间再切分为不超过 chunk_size 行的行区间"""
+    return [(begin, min(begin + chunk_size, stop))
+            for start, stop in ranges
+            for begin in range(start, stop, chunk_size)]
+
+
+class ChunkIndex:
+    """数据块索引
+
+    Args:
+        chunks (list): 数据块统计信息列表，每项包含 start、stop、bytes、min、max
+        key (str): 表名
+    """
+
+    def __init__(self, chunks=None, key="df"):
+        self.chunks = list(chunks or [])
+        self.key = key
+
+    @property
+    def nrows(self):
+        return self.chunks[-1]["stop"] if self.chunks else 0
+
+    def add(self, chunk):
+        """记录追加的一个数据块"""
+        if len(chunk) == 0:
+            return
+        summary = summarize(chunk)
+        start = self.nrows
+        self.chunks.append({
+            "start": start,
+            "stop": start + summary.pop("rows"),
+            **summary,
+        })
+
+    def truncate(self, rows):
+        """删除第 rows 行之后的数据块，被截断的数据块的最小值 / 最大值置为 None(未知)"""
+        chunks = []
+        for chunk in self.chunks:
+            if chunk["start"] >= rows:
+                break
+            if chunk["stop"] > rows:
+                chunk = {
+                    "start": chunk["start"],
+                    "stop": rows,
+                    "bytes": chunk["bytes"] * (rows - chunk["start"]) // (chunk["stop"] - chunk["start"]),
+                    "min": None,
+                    "max": None,
+                }
+            chunks.append(chunk)
+        self.chunks = chunks
+
+    def ranges(self, start=None, stop=None):
+        """[start, stop) 按数据块边界切分的行区间列表"""
+        start = 0 if start is None else start
+        stop = self.nrows if stop is None else min(stop, self.nrows)
+        return [(max(chunk["start"], start), min(chunk["stop"], stop))
+                for chunk in self.chunks
+                if chunk["stop"] > start and chunk["start"] < stop]
+
+    def extreme(self, column, statistic):
+        """由各数据块的最小值 / 最大值合并整列的 min/max(忽略空值)
+
+        Returns:
+            数值；存在被截断的数据块或该列没有统计信息(非数值列、含无穷大)时返回 None
+        """
+        values = []
+        for chunk in self.chunks:
+            if chunk[statistic] is None:
+                return None
+            if column in chunk[statistic]:
+                value = chunk[statistic][column]
+                if value is None:
+                    return None
+                values.append(value)
+        if not values:
+            return None
+        return max(values) if statistic == "max" else min(values)
+
+    def save(self, file_path):
+        """保存索引，记录数据文件的大小和修改时间用于失效判断"""
+        path = index_path(file_path)
+        data = {
+            "source": file_signature(file_path),
+            "key": self.key,
+            "chunks": self.chunks,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, file_path, key="df"):
+        """读取索引，不存在或数据文件已变化时返回 None"""
+        path = index_path(file_path)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("source") != file_signature(file_path) or data.get("key") != key:
+            return None
+        return cls(data["chunks"], key=key)
@@ -0,0 +1,412 @@
+"""列式数据集存储模块
+
+对齐数据的列式存储格式，目录结构:
+    data/aligned/{file_name}/
+        meta.json           行数以及每列的名称、类型
+        {i}.bin             第 i 列的原始二进制数据(小端、定长)，可直接内存映射
+        {i}.vocab           低基数字符串列(kind 为 str)的词表，每行一个 JSON 字符串，
+                            对应的 .bin 中保存 int32 编码(-1 表示空值)
+        {i}.data            高基数字符串列(kind 为 bytes)的 UTF-8 数据，对应的 .bin 中保存
+                            int64 结束偏移量(空值保存为 -(结束偏移量 + 1))
+
+字符串列先按字典编码写入，不同取值超过 config.Category_max_unique 或行数的
+config.Category_max_ratio 时改为偏移量 + 字节存储。词表只追加新出现的值，不重写整个文件。
+读取时数值列通过 np.memmap 零拷贝映射，低基数字符串列以 pd.Categorical 返回，不需要逐值解码。
+接口与 utils.hdf.TableReader/TableWriter 保持一致。
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from config import config
+from utils.chunk_index import split_ranges
+
+META_FILE = "meta.json"
+
+
+def _load_meta(dir_path):
+    with open(os.path.join(dir_path, META_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _load_vocab(path, size):
+    """读取词表的前 size 个值(之后的是上次写入中断时多写的)"""
+    vocab = []
+    if size > 0:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                vocab.append(json.loads(line))
+                if len(vocab) >= size:
+                    break
+    return vocab
+
+
+def _decode_offsets(offsets):
+    """偏移量数组 -> (结束偏移量, 空值掩码)"""
+    mask = offsets < 0
+    return np.where(mask, -offsets - 1, offsets), mask
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class ColumnarWriter:
+    """列式数据集写入器，支持向已有数据集追加
+
+    Args:
+        dir_path (str): 数据集目录
+        max_unique (int): 字典编码的最大不同取值数，默认为 config.Category_max_unique
+        max_ratio (float): 字典编码的最大不同取值比例，默认为 config.Category_max_ratio
+    """
+
+    def __init__(self, dir_path, max_unique=None, max_ratio=None):
+        self.dir_path = dir_path
+        self.max_unique = config.Category_max_unique if max_unique is None else max_unique
+        self.max_ratio = config.Category_max_ratio if max_ratio is None else max_ratio
+        os.makedirs(dir_path, exist_ok=True)
+        if os.path.exists(os.path.join(dir_path, META_FILE)):
+            self.meta = _load_meta(dir_path)
+        else:
+            self.meta = {"format": "columnar", "rows": 0, "columns": []}
+        self.vocabs = {}
+        for i, column in enumerate(self.meta["columns"]):
+            # 截掉上次写入中断时 meta.json 之外多写的数据
+            self._truncate_file(
+                self._data_path(i), self.meta["rows"] * np.dtype(column["dtype"]).itemsize)
+            if column["kind"] == "str":
+                vocab = _load_vocab(self._vocab_path(i), column["vocab_size"])
+                self.vocabs[i] = {value: code for code, value in enumerate(vocab)}
+                with open(self._vocab_path(i), "rb") as f:
+                    lines = sum(1 for _ in f)
+                if lines > len(vocab):
+                    self._write_vocab(i, vocab, mode="w")
+            elif column["kind"] == "bytes":
+                self._truncate_file(self._bytes_path(i), self._bytes_end(i, self.meta["rows"]))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _data_path(self, index):
+        return os.path.join(self.dir_path, f"{index}.bin")
+
+    def _vocab_path(self, index):
+        return os.path.join(self.dir_path, f"{index}.vocab")
+
+    def _bytes_path(self, index):
+        return os.path.join(self.dir_path, f"{index}.data")
+
+    @staticmethod
+    def _truncate_file(path, size):
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            os.truncate(path, size)
+
+    def _write_vocab(self, index, values, mode="a"):
+        with open(self._vocab_path(index), mode, encoding="utf-8") as f:
+            f.writelines(json.dumps(value, ensure_ascii=False) + "\n" for value in values)
+
+    def _bytes_end(self, index, rows):
+        """高基数字符串列前 rows 行数据的字节数"""
+        if rows == 0:
+            return 0
+        offsets = np.fromfile(self._data_path(index), dtype="<i8", count=1,
+                              offset=(rows - 1) * 8)
+        return int(_decode_offsets(offsets)[0][0])
+
+    def _define_columns(self, chunk):
+        for name in chunk.columns:
+            series = chunk[name]
+            index = len(self.meta["columns"])
+            if pd.api.types.is_numeric_dtype(series):
+                column = {"name": name, "kind": "numeric",
+                          "dtype": np.dtype(series.dtype).newbyteorder("<").str}
+            else:
+                column = {"name": name, "kind": "str", "dtype": "<i4", "vocab_size": 0}
+                self.vocabs[index] = {}
+                self._write_vocab(index, [], mode="w")
+            self.meta["columns"].append(column)
+
+    def _keep_dictionary(self, index, rows):
+        """不同取值超过上限，或超过行数的比例(行数不少于上限时才判断)时不再使用字典编码"""
+        unique = len(self.vocabs[index])
+        return unique <= self.max_unique and (
+            rows < self.max_unique or unique <= rows * self.max_ratio)
+
+    def append(self, chunk):
+        """追加一个数据块，列名与类型需与已有数据一致"""
+        if not self.meta["columns"]:
+            self._define_columns(chunk)
+        names = [column["name"] for column in self.meta["columns"]]
+        if list(chunk.columns) != names:
+            raise ValueError(f"列不一致: {list(chunk.columns)} != {names}")
+
+        for i, column in enumerate(self.meta["columns"]):
+            series = chunk[column["name"]]
+            if column["kind"] == "numeric":
+                dtype = np.dtype(column["dtype"])
+                if not np.can_cast(series.dtype, dtype, casting="same_kind"):
+                    raise ValueError(
+                        f"{column['name']} 类型不一致: {series.dtype} -> {dtype}")
+                values = series.to_numpy(dtype=dtype)
+            elif column["kind"] == "str":
+                vocab_size = len(self.vocabs[i])
+                values = self._encode(i, series)
+                if self._keep_dictionary(i, self.meta["rows"] + len(chunk)):
+                    # 词表只追加新出现的值
+                    self._write_vocab(i, list(self.vocabs[i])[vocab_size:])
+                    column["vocab_size"] = len(self.vocabs[i])
+                else:
+                    self._to_bytes(i)
+                    values = self._append_bytes(i, series)
+            else:
+                values = self._append_bytes(i, series)
+            with open(self._data_path(i), "ab") as f:
+                values.tofile(f)
+
+        self.meta["rows"] += len(chunk)
+        _write_json(os.path.join(self.dir_path, META_FILE), self.meta)
+
+    def _encode(self, index, series):
+        vocab = self.vocabs[index]
+        mask = series.isna().to_numpy()
+        strings = series[~mask].astype(str)
+        for value in pd.unique(strings):
+            if value not in vocab:
+                vocab[value] = len(vocab)
+        codes = np.full(len(series), -1, dtype="<i4")
+        codes[~mask] = strings.map(vocab).to_numpy(dtype="<i4")
+        return codes
+
+    def _append_bytes(self, index, series, end=None):
+        """将字符串追加到 .data 文件，返回每行的偏移量
+
+        Args:
+            end (int): .data 文件当前的字节数，为空时按已写入的行数计算
+        """
+        end = self._bytes_end(index, self.meta["rows"]) if end is None else end
+        mask = series.isna().to_numpy()
+        encoded = [b"" if missing else str(value).encode("utf-8")
+                   for value, missing in zip(series.tolist(), mask)]
+        ends = end + np.cumsum(np.fromiter(map(len, encoded), dtype="<i8", count=len(encoded)))
+        with open(self._bytes_path(index), "ab") as f:
+            f.write(b"".join(encoded))
+        return np.where(mask, -ends - 1, ends).astype("<i8")
+
+    def _to_bytes(self, index, chunksize=1 << 20):
+        """字典编码列改为偏移量 + 字节存储，已写入的数据按块解码后改写"""
+        column = self.meta["columns"][index]
+        vocab = pd.Index(list(self.vocabs.pop(index)), dtype=object)
+        rows = self.meta["rows"]
+        codes = np.fromfile(self._data_path(index), dtype="<i4", count=rows) if rows else []
+        tmp_path = f"{self._data_path(index)}.tmp"
+        if os.path.exists(self._bytes_path(index)):
+            os.remove(self._bytes_path(index))
+        end = 0
+        with open(tmp_path, "wb") as f:
+            for start in range(0, rows, chunksize):
+                series = pd.Series(pd.Categorical.from_codes(
+                    codes[start:start + chunksize], categories=vocab)).astype(object)
+                offsets = self._append_bytes(index, series, end)
+                end = int(_decode_offsets(offsets[-1:])[0][0])
+                offsets.tofile(f)
+        os.replace(tmp_path, self._data_path(index))
+        os.remove(self._vocab_path(index))
+        column.pop("vocab_size")
+        column.update({"kind": "bytes", "dtype": "<i8"})
+        # 立即保存列类型，中断时不会再按字典编码读取已改写的数据
+        _write_json(os.path.join(self.dir_path, META_FILE), self.meta)
+
+    @property
+    def nrows(self):
+        """已写入的行数"""
+        return self.meta["rows"]
+
+    def truncate(self, rows):
+        """删除第 rows 行之后的数据，用于从检查点恢复"""
+        if self.meta["rows"] <= rows:
+            return
+        self.meta["rows"] = rows
+        _write_json(os.path.join(self.dir_path, META_FILE), self.meta)
+        for i, column in enumerate(self.meta["columns"]):
+            os.truncate(self._data_path(i), rows * np.dtype(column["dtype"]).itemsize)
+            if column["kind"] == "bytes":
+                os.truncate(self._bytes_path(i), self._bytes_end(i, rows))
+
+    def close(self):
+        pass
+
+
+class ColumnarReader:
+    """列式数据集读取器
+
+    Args:
+        dir_path (str): 数据集目录
+        logger: 日志记录器，默认使用 config.logger
+    """
+
+    def __init__(self, dir_path, logger=None):
+        self.file_path = dir_path
+        self.logger = logger or config.logger
+        self.meta = _load_meta(dir_path)
+        self.rows_read = 0
+        self.bytes_read = 0
+        self._arrays = {}
+        self._categories = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._arrays.clear()
+
+    @property
+    def nrows(self):
+        return self.meta["rows"]
+
+    @property
+    def columns(self):
+        return [column["name"] for column in self.meta["columns"]]
+
+    @property
+    def dtypes(self):
+        return self.read(start=0, stop=0).dtypes
+
+    def _index(self, name):
+        for i, column in enumerate(self.meta["columns"]):
+            if column["name"] == name:
+                return i
+        raise KeyError(name)
+
+    def array(self, name):
+        """返回整列的内存映射数组(低基数字符串列为 int32 编码，高基数字符串列为偏移量)"""
+        i = self._index(name)
+        if i not in self._arrays:
+            dtype = np.dtype(self.meta["columns"][i]["dtype"])
+            if self.nrows == 0:
+                self._arrays[i] = np.empty(0, dtype=dtype)
+            else:
+                self._arrays[i] = np.memmap(
+                    os.path.join(self.file_path, f"{i}.bin"),
+                    dtype=dtype, mode="r", shape=(self.nrows,))
+        return self._arrays[i]
+
+    def categories(self, name):
+        """低基数字符串列的词表"""
+        i = self._index(name)
+        if i not in self._categories:
+            self._categories[i] = pd.Index(_load_vocab(
+                os.path.join(self.file_path, f"{i}.vocab"),
+                self.meta["columns"][i]["vocab_size"]), dtype=object)
+        return self._categories[i]
+
+    def _strings(self, name, start, stop):
+        """读取高基数字符串列的一段数据，返回 (object 数组, 读取的字节数)"""
+        ends, mask = _decode_offsets(np.asarray(self.array(name)[max(start - 1, 0):stop]))
+        begin = 0
+        if start > 0:
+            begin, ends, mask = int(ends[0]), ends[1:], mask[1:]
+        values = np.empty(len(ends), dtype=object)
+        if len(ends) == 0:
+            return values, 0
+        with open(os.path.join(self.file_path, f"{self._index(name)}.data"), "rb") as f:
+            f.seek(begin)
+            data = f.read(int(ends[-1]) - begin)
+        ends = (ends - begin).tolist()
+        for j, (value_start, value_end) in enumerate(zip([0] + ends[:-1], ends)):
+            values[j] = data[value_start:value_end].decode("utf-8")
+        values[mask] = None
+        return values, len(data)
+
+    def read(self, columns=None, start=None, stop=None, where=None):
+        """读取一段数据，数值列为内存映射切片，字符串列为 Categorical"""
+        if where is not None:
+            raise ValueError("列式存储不支持 where 条件")
+        columns = self.columns if columns is None else columns
+        start = 0 if start is None else start
+        stop = self.nrows if stop is None else min(stop, self.nrows)
+        data = {}
+        nbytes = 0
+        for name in columns:
+            kind = self.meta["columns"][self._index(name)]["kind"]
+            if kind == "bytes":
+                values, data_bytes = self._strings(name, start, stop)
+                nbytes += data_bytes + len(values) * 8
+            else:
+                values = self.array(name)[start:stop]
+                nbytes += values.nbytes
+            if kind == "str":
+                values = pd.Categorical.from_codes(values, categories=self.categories(name))
+            data[name] = values
+        chunk = pd.DataFrame(data, index=pd.RangeIndex(start, max(stop, start)), copy=False)
+        self.rows_read += len(chunk)
+        self.bytes_read += nbytes
+        self.logger.debug("读取 %s: %d 行, %d 字节", self.file_path, len(chunk), nbytes)
+        return chunk
+
+    def chunk_ranges(self, chunk_size, start=None, stop=None):
+        """将 [start, stop) 按行数切分为不超过 chunk_size 行的行区间"""
+        start = 0 if start is None else start
+        stop = self.nrows if stop is None else min(stop, self.nrows)
+        return split_ranges([(start, stop)], chunk_size)
+
+    def iter_chunks(self, chunksize, columns=None, start=None, stop=None, where=None):
+        """分块读取数据"""
+        start = 0 if start is None else start
+        stop = self.nrows if stop is None else min(stop, self.nrows)
+        rows_before, bytes_before = self.rows_read, self.bytes_read
+        try:
+            for chunk_start in range(start, stop, chunksize):
+                yield self.read(columns=columns, start=chunk_start,
+                                stop=min(chunk_start + chunksize, stop), where=where)
+        finally:
+            self.logger.info(
+                "读取 %s: %d 行, %d 字节", self.file_path,
+                self.rows_read - rows_before, self.bytes_read - bytes_before)
+
+
+def rewrite_column(dir_path, column, convert, chunksize, on_chunk=None):
+    """改写数据集中的一列，只重写该列的数据文件(及词表或字节数据)
+
+    新列先写入临时目录，完成后替换原列文件并更新 meta.json。
+
+    Args:
+        dir_path (str): 数据集目录
+        column (str): 列名
+        convert: 列转换函数，输入 pd.Series 返回转换后的数组
+        chunksize (int): 每块行数
+        on_chunk: 每写完一块后的回调，参数为该块行数
+    """
+    tmp_dir = f"{dir_path}.rewrite"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    with ColumnarReader(dir_path) as reader:
+        index = reader._index(column)
+        with ColumnarWriter(tmp_dir) as writer:
+            for chunk in reader.iter_chunks(chunksize, columns=[column]):
+                writer.append(pd.DataFrame({column: convert(chunk[column])}))
+                if on_chunk is not None:
+                    on_chunk(len(chunk))
+    meta = _load_meta(dir_path)
+    meta["columns"][index] = _load_meta(tmp_dir)["columns"][0]
+    os.replace(os.path.join(tmp_dir, "0.bin"), os.path.join(dir_path, f"{index}.bin"))
+    for suffix in ("vocab", "data"):
+        path = os.path.join(dir_path, f"{index}.{suffix}")
+        if os.path.exists(os.path.join(tmp_dir, f"0.{suffix}")):
+            os.replace(os.path.join(tmp_dir, f"0.{suffix}"), path)
+        elif os.path.exists(path):
+            os.remove(path)
+    _write_json(os.path.join(dir_path, META_FILE), meta)
+    shutil.rmtree(tmp_dir)
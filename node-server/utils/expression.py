@@ -0,0 +1,477 @@
+"""对齐规则的列级编译模块
+
+将对齐规则中的操作符在每次请求开始时编译为列级的 NumPy/pandas 运算，
+之后对每个数据块整体求值，不再逐行遍历。支持的操作符:
+- "=": 直接拷贝原始字段
+- "+", "-", "*", "/": 多字段四则运算(输入与结果均保留两位小数)
+- "avg", "max", "min": 由中心服务器预先计算的统计值，广播到整列
+- "expr": 算术表达式(如 "(a - b) / c * 100")，解析一次后编译为按列求值的函数
+
+对齐字段设置了 on_error 时，运算结果再按字段类型整列转换为原生类型(int64/float64/str)，
+无法转换的值按策略处理:
+- "raise": 报错，整个对齐任务失败
+- "coerce": 置为空值(int 字段因此保存为 float64)
+- "drop": 删除该行
+未设置 on_error 时保持逐值 convert_type 的原有行为。
+"""
+
+import ast
+
+import numpy as np
+import pandas as pd
+
+ARITHMETIC_OPERATORS = ("+", "-", "*", "/")
+AGGREGATE_OPERATORS = ("avg", "max", "min")
+EXPRESSION_OPERATOR = "expr"
+ERROR_POLICIES = ("raise", "coerce", "drop")
+FIELD_TYPES = ("int", "float", "str")
+FIELD_TYPE_ALIASES = {"string": "str"}  # 前端使用的类型名
+
+# 表达式中允许的运算符和函数
+_BINARY_OPERATORS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.true_divide,
+    ast.Pow: np.power,
+}
+_UNARY_OPERATORS = {
+    ast.USub: np.negative,
+    ast.UAdd: np.positive,
+}
+_FUNCTIONS = {
+    "abs": np.abs,
+    "sqrt": np.sqrt,
+    "log": np.log,
+    "exp": np.exp,
+    "round": np.round,
+}
+
+
+def convert_type(value, type_str):
+    """根据类型字符串转换单个值的数据类型"""
+    try:
+        if type_str == "int":
+            return int(value)
+        elif type_str == "float":
+            return float(value)
+        elif type_str == "str":
+            return str(value)
+        elif type_str == "list":
+            return list(value)
+        return value
+    except (ValueError, TypeError):
+        return value
+
+
+def convert_array(values, type_str):
+    """按列转换运算结果的数据类型，行为与逐值调用 convert_type 一致
+
+    Args:
+        values (np.ndarray): float64 运算结果
+        type_str (str): 目标类型
+
+    Returns:
+        np.ndarray: 转换后的数组
+    """
+    if type_str == "int":
+        if np.isinf(values).any():
+            raise OverflowError("cannot convert float infinity to integer")
+        nan_mask = np.isnan(values)
+        if nan_mask.any():
+            # 含 NaN 时 int() 失败保留原值，整列退化为截断后的浮点数
+            return np.where(nan_mask, values, np.trunc(values))
+        return values.astype(np.int64)
+    elif type_str == "float":
+        return values.astype(np.float64)
+    elif type_str == "str":
+        return values.astype(str).astype(object)
+    return values
+
+
+def resolve_field_type(type_str):
+    """将前端类型名转换为字段类型，不支持的类型返回 None"""
+    type_str = FIELD_TYPE_ALIASES.get(type_str, type_str)
+    return type_str if type_str in FIELD_TYPES else None
+
+
+def round2(values):
+    """按列保留两位小数，结果与内置 round(x, 2) 逐值一致
+
+    np.round 先乘 100 再取整，在 x.xx5 附近会与内置 round 的精确十进制舍入不同，
+    这部分临界值(通常不足 1%)单独回退到内置 round。
+    """
+    values = np.asarray(values, dtype=np.float64)
+    scaled = values * 100
+    result = np.rint(scaled) / 100
+    tie = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6
+    if tie.any():
+        result[tie] = [round(float(v), 2) for v in values[tie]]
+    return result
+
+
+def coerce_array(values, type_str):
+    """按字段类型整列转换，不能转换的值置为空值
+
+    Args:
+        values: 运算结果(数组或标量)
+        type_str (str): 目标类型，int/float 转换为 float64(int 截断小数)，str 转换为字符串
+
+    Returns:
+        tuple: (转换后的数组, 转换失败的行掩码)
+    """
+    type_str = FIELD_TYPE_ALIASES.get(type_str, type_str)
+    series = pd.Series(values)
+    notna = series.notna().to_numpy()
+    if type_str in ("int", "float"):
+        numeric = pd.to_numeric(series, errors="coerce").to_numpy(
+            dtype=np.float64, na_value=np.nan, copy=True)
+        if type_str == "int":
+            # int 无法表示无穷大，按转换失败处理
+            numeric[np.isinf(numeric)] = np.nan
+            numeric = np.trunc(numeric)
+        return numeric, notna & np.isnan(numeric)
+    elif type_str == "str":
+        result = series.astype(object).to_numpy(copy=True)
+        result[notna] = series[notna].astype(str).to_numpy(dtype=object)
+        return result, np.zeros(len(series), dtype=bool)
+    return series.to_numpy(), np.zeros(len(series), dtype=bool)
+
+
+def cast_column(series, type_str):
+    """将整列转换为字段类型对应的原生类型(int64/float64/str)
+
+    Args:
+        series (pd.Series): 原始列
+        type_str (str): 目标类型
+
+    Returns:
+        tuple: (转换后的数组, 无法转换的行掩码)，int 字段的空值也视为无法转换
+
+    Raises:
+        ValueError: 不支持的目标类型
+    """
+    if resolve_field_type(type_str) is None:
+        raise ValueError(f"不支持的字段类型: {type_str}")
+    type_str = resolve_field_type(type_str)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(object)
+    values, failed = coerce_array(series, type_str)
+    if type_str == "int":
+        failed = np.isnan(values)
+        values = np.where(failed, 0, values).astype(np.int64)
+    return values, failed
+
+
+def arithmetic(operator, arrays):
+    """对多个列执行四则运算，结合顺序与 utils.add/sub/mul/div 相同"""
+    if operator == "+":
+        result = arrays[0]
+        for array in arrays[1:]:
+            result = result + array
+    elif operator == "-":
+        rest = 0.0
+        for array in arrays[1:]:
+            rest = rest + array
+        result = arrays[0] - rest
+    elif operator == "*":
+        result = arrays[0]
+        for array in arrays[1:]:
+            result = result * array
+    elif operator == "/":
+        result = arrays[0]
+        for array in arrays[1:]:
+            if (array == 0).any():
+                raise ZeroDivisionError("float division by zero")
+            result = result / array
+    else:
+        raise ValueError(f"不支持的操作符: {operator}")
+    return round2(result)
+
+
+def parse_expression(expression):
+    """解析并校验算术表达式
+
+    只允许数字常量、字段名、+ - * / ** 运算、正负号以及 abs/sqrt/log/exp/round 函数，
+    round 的第二个参数必须为整数常量。
+
+    Args:
+        expression (str): 表达式字符串
+
+    Returns:
+        tuple: (表达式语法树, 按出现顺序去重的字段名列表)
+
+    Raises:
+        ValueError: 表达式语法错误或包含不支持的内容
+    """
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"表达式语法错误: {expression}") from e
+    fields = []
+    _check_node(tree.body, fields)
+    return tree.body, fields
+
+
+def _check_node(node, fields):
+    if isinstance(node, ast.Name):
+        if node.id not in fields:
+            fields.append(node.id)
+    elif isinstance(node, ast.Constant):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise ValueError(f"表达式中不支持的常量: {node.value!r}")
+    elif isinstance(node, ast.BinOp):
+        if type(node.op) not in _BINARY_OPERATORS:
+            raise ValueError(f"表达式中不支持的运算符: {type(node.op).__name__}")
+        _check_node(node.left, fields)
+        _check_node(node.right, fields)
+    elif isinstance(node, ast.UnaryOp):
+        if type(node.op) not in _UNARY_OPERATORS:
+            raise ValueError(f"表达式中不支持的运算符: {type(node.op).__name__}")
+        _check_node(node.operand, fields)
+    elif isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in _FUNCTIONS:
+            raise ValueError(f"表达式中不支持的函数: {ast.unparse(node.func)}")
+        name = node.func.id
+        if node.keywords or len(node.args) not in ((1, 2) if name == "round" else (1,)):
+            raise ValueError(f"函数 {name} 的参数错误")
+        if len(node.args) == 2 and not (
+                isinstance(node.args[1], ast.Constant) and type(node.args[1].value) is int):
+            raise ValueError("round 的小数位数必须为整数常量")
+        _check_node(node.args[0], fields)
+    else:
+        raise ValueError(f"表达式中不支持的语法: {type(node).__name__}")
+
+
+def compile_expression(expression):
+    """将算术表达式编译为按列求值的函数
+
+    返回的函数接收 字段名 -> float64 数组 的映射并返回结果数组。
+    中间结果尽量原地复用(out=)，一次求值的临时数组个数不超过表达式树的深度，
+    总内存随数据块大小线性增长。
+
+    Args:
+        expression (str): 表达式字符串
+
+    Returns:
+        tuple: (求值函数, 字段名列表)
+    """
+    tree, fields = parse_expression(expression)
+    evaluate = _compile_node(tree)
+
+    def run(arrays):
+        value, _ = evaluate(arrays)
+        return value
+
+    return run, fields
+
+
+def _compile_node(node):
+    # 每个节点编译为 arrays -> (结果, 结果是否为可原地修改的临时数组)
+    if isinstance(node, ast.Constant):
+        value = float(node.value)
+        return lambda arrays: (value, False)
+    if isinstance(node, ast.Name):
+        name = node.id
+        return lambda arrays: (arrays[name], False)
+    if isinstance(node, ast.UnaryOp):
+        ufunc = _UNARY_OPERATORS[type(node.op)]
+        operand = _compile_node(node.operand)
+
+        def unary(arrays):
+            value, owned = operand(arrays)
+            return _apply(ufunc, (value,), 0 if owned else None), True
+        return unary
+    if isinstance(node, ast.Call):
+        func = _FUNCTIONS[node.func.id]
+        operand = _compile_node(node.args[0])
+        if node.func.id == "round":
+            decimals = node.args[1].value if len(node.args) == 2 else 0
+
+            def round_call(arrays):
+                value, owned = operand(arrays)
+                if np.isscalar(value):
+                    return np.round(value, decimals), False
+                return np.round(value, decimals, out=value if owned else None), True
+            return round_call
+
+        def call(arrays):
+            value, owned = operand(arrays)
+            return _apply(func, (value,), 0 if owned else None), True
+        return call
+
+    ufunc = _BINARY_OPERATORS[type(node.op)]
+    is_div = isinstance(node.op, ast.Div)
+    left = _compile_node(node.left)
+    right = _compile_node(node.right)
+
+    def binary(arrays):
+        left_value, left_owned = left(arrays)
+        right_value, right_owned = right(arrays)
+        if is_div and np.any(np.asarray(right_value) == 0):
+            raise ZeroDivisionError("float division by zero")
+        out = 0 if left_owned else (1 if right_owned else None)
+        return _apply(ufunc, (left_value, right_value), out), True
+    return binary
+
+
+def _apply(ufunc, args, out_index):
+    """调用 ufunc，out_index 指定可复用为输出的参数位置(None 表示新分配)"""
+    if out_index is None or np.isscalar(args[out_index]):
+        return ufunc(*args)
+    return ufunc(*args, out=args[out_index])
+
+
+def row_dtype(dtypes):
+    """iterrows 按行取值时的公共类型
+
+    纯数值表逐行读取会被提升为同一数值类型(如 int 与 float 混合时整数列变为 float)，
+    含字符串等其他类型时保留各列原类型。返回 None 表示无需提升。
+
+    Args:
+        dtypes: 原始表全部列的数据类型
+    """
+    dtypes = list(dtypes)
+    if dtypes and all(isinstance(d, np.dtype) and d.kind in "iuf" for d in dtypes):
+        return np.result_type(*dtypes)
+    return None
+
+
+def _fields(original_field):
+    if isinstance(original_field, list):
+        return [f.field for f in original_field]
+    return [original_field.field]
+
+
+class CompiledRuler:
+    """编译后的对齐规则
+
+    Args:
+        operators (list): 规则中的 Operator 列表
+        constants (dict): 聚合操作符的计算结果，键为对齐字段名
+    """
+
+    def __init__(self, operators, constants=None):
+        constants = constants or {}
+        self.steps = []
+        self.policies = {}
+        for op in operators:
+            name = op.aligned_field.field
+            type_str = op.aligned_field.type
+            policy = getattr(op.aligned_field, "on_error", None)
+            if policy is not None:
+                if policy not in ERROR_POLICIES:
+                    raise ValueError(f"{name} 不支持的错误处理策略: {policy}")
+                self.policies[name] = (type_str, policy)
+            if op.operator in AGGREGATE_OPERATORS:
+                value = convert_type(constants[name], type_str)
+                self.steps.append((name, self._constant(value)))
+            elif op.operator in ARITHMETIC_OPERATORS:
+                self.steps.append((name, self._arithmetic(
+                    op.operator, _fields(op.original_field), type_str)))
+            elif op.operator == EXPRESSION_OPERATOR:
+                self.steps.append((name, self._expression(op.expression, type_str)))
+            elif op.operator == "=":
+                self.steps.append(
+                    (name, self._copy(_fields(op.original_field)[0])))
+            else:
+                raise ValueError(f"不支持的操作符: {op.operator}")
+
+    @property
+    def columns(self):
+        """规则读取的原始字段(去重并保持顺序)"""
+        return list(dict.fromkeys(
+            field for _, step in self.steps for field in step.fields))
+
+    @staticmethod
+    def _constant(value):
+        def step(chunk, dtype):
+            return value
+        step.fields = []
+        return step
+
+    @staticmethod
+    def _arithmetic(operator, fields, type_str):
+        def step(chunk, dtype):
+            arrays = [round2(chunk[f].to_numpy(dtype=np.float64))
+                      for f in fields]
+            return convert_array(arithmetic(operator, arrays), type_str)
+        step.fields = fields
+        return step
+
+    @staticmethod
+    def _expression(expression, type_str):
+        if not expression:
+            raise ValueError("expr 操作符缺少表达式")
+        evaluate, fields = compile_expression(expression)
+
+        def step(chunk, dtype):
+            arrays = {f: chunk[f].to_numpy(dtype=np.float64) for f in fields}
+            values = np.asarray(evaluate(arrays), dtype=np.float64)
+            if values.ndim == 0:
+                values = np.full(len(chunk), values)
+            return convert_array(values, type_str)
+        step.fields = fields
+        return step
+
+    @staticmethod
+    def _copy(field):
+        def step(chunk, dtype):
+            values = chunk[field].to_numpy()
+            if dtype is not None:
+                values = values.astype(dtype, copy=False)
+            return values
+        step.fields = [field]
+        return step
+
+    def __call__(self, chunk, dtypes=None):
+        """对一个数据块求值，返回对齐后的数据块，参数同 evaluate"""
+        return self.evaluate(chunk, dtypes)[0]
+
+    def evaluate(self, chunk, dtypes=None):
+        """对一个数据块求值并按字段的 on_error 策略转换类型
+
+        Args:
+            chunk (pd.DataFrame): 原始数据块，可以只包含 columns 中的列
+            dtypes: 原始表全部列的数据类型，只读取部分列时需传入，默认取 chunk 的类型
+
+        Returns:
+            tuple: (对齐后的数据块(索引为 0..n-1), 各字段类型转换失败的个数)
+
+        Raises:
+            ValueError: on_error 为 raise 的字段存在无法转换的值
+        """
+        dtype = row_dtype(chunk.dtypes if dtypes is None else dtypes)
+        data = {}
+        failures = {}
+        drop = np.zeros(len(chunk), dtype=bool)
+        for name, step in self.steps:
+            values = step(chunk, dtype)
+            if name not in self.policies:
+                data[name] = values
+                continue
+            type_str, policy = self.policies[name]
+            if np.ndim(values) == 0:
+                values = np.full(len(chunk), values, dtype=object)
+            values, failed = coerce_array(values, type_str)
+            failures[name] = int(failed.sum())
+            if failures[name] and policy == "raise":
+                raise ValueError(f"{name} 有 {failures[name]} 个值无法转换为 {type_str}")
+            if policy == "drop":
+                drop |= failed
+            if type_str == "int" and policy != "coerce":
+                # 空值无法保存为 int64，drop 时删除该行，raise 时报错
+                nulls = np.isnan(values)
+                if policy == "raise" and nulls.any():
+                    raise ValueError(f"{name} 含有 {int(nulls.sum())} 个空值，无法保存为 int")
+                drop |= nulls
+            data[name] = values
+
+        frame = pd.DataFrame(data, index=pd.RangeIndex(len(chunk)))
+        if drop.any():
+            frame = frame[~drop].reset_index(drop=True)
+        for name, (type_str, policy) in self.policies.items():
+            if type_str == "int" and policy != "coerce":
+                frame[name] = frame[name].astype(np.int64)
+        return frame, failures
+
@@ -0,0 +1,429 @@
+"""HDF5 数据读写模块
+
+统一的 HDF5 表读写入口:
+- 每个 TableReader 只打开一次 HDFStore，可多次读取
+- 只读取需要的列(columns)，可指定行区间(start/stop)或 where 条件
+- 每次调用结束后记录读取的行数和字节数(与读取全部列时的字节数对比)，便于观察列裁剪带来的收益
+
+字符串列的存储:
+- 按实际最大字节数分配长度(向上取 2 的幂)，而不是固定 100 字节，写入更长的字符串时自动扩容
+- 上传时通过 StringProfile 扫描一遍全部数据，不同取值较少的列按字典编码(categorical)存储，
+  读取时返回 pd.Categorical(整数编码 + 词表)，按需解码
+
+写入时的压缩参数默认取 config.Hdf_complevel/Hdf_complib，可按数据集单独指定。
+
+写入时同时维护数据块索引(utils.chunk_index)，读取时按索引中的数据块边界切分行区间。
+"""
+
+import os
+
+import pandas as pd
+import tables
+
+from config import config
+from utils.chunk_index import ChunkIndex, move_index, remove_index, split_ranges
+
+
+class TableReader:
+    """HDF5 表读取器
+
+    Args:
+        file_path (str): HDF5 文件路径
+        key (str): 表名，默认为 "df"
+        logger: 日志记录器，默认使用 config.logger
+    """
+
+    def __init__(self, file_path, key="df", logger=None):
+        self.file_path = file_path
+        self.key = key
+        self.logger = logger or config.logger
+        self.store = pd.HDFStore(file_path, mode="r")
+        self.rows_read = 0
+        self.bytes_read = 0
+        self._chunk_index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.store.is_open:
+            self.store.close()
+
+    @property
+    def storer(self):
+        return self.store.get_storer(self.key)
+
+    @property
+    def nrows(self):
+        """表的总行数"""
+        return self.storer.nrows
+
+    @property
+    def columns(self):
+        """表的全部列名"""
+        return list(self.storer.non_index_axes[0][1])
+
+    @property
+    def dtypes(self):
+        """表中各列的数据类型"""
+        return self.store.select(self.key, start=0, stop=1).dtypes
+
+    @property
+    def row_bytes(self):
+        """磁盘上每行的字节数(包含全部列)"""
+        return self.storer.table.rowsize
+
+    @property
+    def compression(self):
+        """表的压缩参数 (complevel, complib)，不压缩时 complib 为 None"""
+        filters = self.storer.table.filters
+        return filters.complevel, filters.complib if filters.complevel else None
+
+    @property
+    def chunk_index(self):
+        """数据块索引，没有索引或索引已失效时为 None"""
+        if self._chunk_index is None:
+            self._chunk_index = ChunkIndex.load(self.file_path, key=self.key) or False
+        return self._chunk_index or None
+
+    def chunk_ranges(self, chunk_size, start=None, stop=None):
+        """将 [start, stop) 切分为不超过 chunk_size 行的行区间，用于分块或多个进程并行读取
+
+        有索引时先按写入时的数据块边界切分，每个行区间只落在一个数据块内，否则按行数切分。
+        """
+        start = 0 if start is None else start
+        stop = self.nrows if stop is None else min(stop, self.nrows)
+        index = self.chunk_index
+        ranges = index.ranges(start, stop) if index is not None else [(start, stop)]
+        return split_ranges(ranges, chunk_size)
+
+    def read(self, columns=None, start=None, stop=None, where=None):
+        """读取一段数据
+
+        Args:
+            columns (list): 需要的列，None 表示全部列
+            start (int): 起始行
+            stop (int): 结束行(不包含)
+            where: pandas where 条件
+
+        Returns:
+            pd.DataFrame: 读取结果
+        """
+        chunk = self.store.select(
+            self.key, where=where, start=start, stop=stop, columns=columns)
+        rows, nbytes = self._account(chunk)
+        self._report(rows, nbytes, level="debug")
+        return chunk
+
+    def iter_chunks(self, chunksize, columns=None, start=None, stop=None, where=None):
+        """分块读取数据
+
+        Args:
+            chunksize (int): 每块行数
+            columns (list): 需要的列，None 表示全部列
+            start (int): 起始行
+            stop (int): 结束行(不包含)
+            where: pandas where 条件
+
+        Yields:
+            pd.DataFrame: 数据块
+        """
+        rows = 0
+        nbytes = 0
+        try:
+            for chunk in self.store.select(
+                self.key, where=where, start=start, stop=stop, columns=columns,
+                chunksize=chunksize, iterator=True, auto_close=False,
+            ):
+                chunk_rows, chunk_bytes = self._account(chunk)
+                rows += chunk_rows
+                nbytes += chunk_bytes
+                yield chunk
+        finally:
+            self._report(rows, nbytes)
+
+    def _account(self, chunk):
+        rows = len(chunk)
+        nbytes = int(chunk.memory_usage(index=False).sum())
+        self.rows_read += rows
+        self.bytes_read += nbytes
+        return rows, nbytes
+
+    def _report(self, rows, nbytes, level="info"):
+        getattr(self.logger, level)(
+            "读取 %s: %d 行, %d 字节(全部列约 %d 字节)",
+            self.file_path, rows, nbytes, rows * self.row_bytes,
+        )
+
+
+def read_table(file_path, columns=None, start=None, stop=None, where=None, key="df"):
+    """打开文件读取一段数据后关闭"""
+    with TableReader(file_path, key=key) as reader:
+        return reader.read(columns=columns, start=start, stop=stop, where=where)
+
+
+def iter_table(file_path, chunksize, columns=None, start=None, stop=None, where=None,
+               key="df", logger=None):
+    """打开文件分块读取数据，读取结束后关闭"""
+    with TableReader(file_path, key=key, logger=logger) as reader:
+        yield from reader.iter_chunks(
+            chunksize, columns=columns, start=start, stop=stop, where=where)
+
+
+def compression_options(complevel=None, complib=None):
+    """解析压缩参数，未指定时使用部署级默认值
+
+    Args:
+        complevel (int): 压缩级别 0-9
+        complib (str): 压缩库
+
+    Returns:
+        tuple: (complevel, complib)
+
+    Raises:
+        ValueError: 压缩级别超出范围或压缩库不可用
+    """
+    complevel = config.Hdf_complevel if complevel is None else int(complevel)
+    complib = complib or config.Hdf_complib
+    if not 0 <= complevel <= 9:
+        raise ValueError(f"压缩级别必须在 0-9 之间: {complevel}")
+    if complib not in tables.filters.all_complibs or tables.which_lib_version(complib) is None:
+        raise ValueError(f"不支持的压缩库: {complib}")
+    return complevel, complib
+
+
+def string_itemsize(nbytes):
+    """字符串列的存储长度: 不小于 nbytes 的 2 的幂，且不小于 config.String_min_itemsize"""
+    itemsize = config.String_min_itemsize
+    while itemsize < nbytes:
+        itemsize *= 2
+    return itemsize
+
+
+def max_string_bytes(series):
+    """字符串列中最长值的 UTF-8 字节数(HDF5 中按编码后的字节数存储)"""
+    values = series.dropna()
+    if len(values) == 0:
+        return 0
+    return int(values.astype(str).str.encode("utf-8").str.len().max())
+
+
+class StringProfile:
+    """字符串列画像，扫描全部数据块后确定每个字符串列的存储方式
+
+    Args:
+        max_unique (int): 字典编码的最大不同取值数，默认为 config.Category_max_unique
+        max_ratio (float): 字典编码的最大不同取值比例，默认为 config.Category_max_ratio
+    """
+
+    def __init__(self, max_unique=None, max_ratio=None):
+        self.max_unique = config.Category_max_unique if max_unique is None else max_unique
+        self.max_ratio = config.Category_max_ratio if max_ratio is None else max_ratio
+        self.rows = 0
+        self.max_bytes = {}
+        self.values = {}  # 列名 -> 不同取值集合，超过 max_unique 后置为 None 不再记录
+
+    def update(self, chunk):
+        """累加一个数据块"""
+        self.rows += len(chunk)
+        for column in chunk.select_dtypes(include=["object"]).columns:
+            series = chunk[column]
+            self.add(column, max_string_bytes(series),
+                     lambda: series.dropna().astype(str).unique())
+
+    def add(self, column, nbytes, unique):
+        """累加一个数据块中的一列
+
+        Args:
+            column (str): 列名
+            nbytes (int): 该块中最长值的字节数
+            unique: 返回该块中不同取值的函数，不同取值已超过上限时不再调用
+        """
+        self.max_bytes[column] = max(self.max_bytes.get(column, 0), nbytes)
+        values = self.values.setdefault(column, set())
+        if values is not None:
+            values.update(unique())
+            if len(values) > self.max_unique:
+                self.values[column] = None
+
+    def exclude(self, column):
+        """列在部分数据块中不是字符串时画像不完整，改为写入时自适应长度且不做字典编码"""
+        self.values[column] = None
+        self.max_bytes.pop(column, None)
+
+    def categories(self):
+        """按字典编码存储的列: 列名 -> 排序后的词表"""
+        return {
+            column: sorted(values)
+            for column, values in self.values.items()
+            if values is not None and len(values) <= self.rows * self.max_ratio
+        }
+
+    def min_itemsize(self):
+        """其余字符串列按最大字节数分配的存储长度"""
+        categories = self.categories()
+        return {column: string_itemsize(nbytes)
+                for column, nbytes in self.max_bytes.items() if column not in categories}
+
+
+class TableWriter:
+    """HDF5 表写入器，以追加方式写入 table 格式数据
+
+    Args:
+        file_path (str): HDF5 文件路径
+        key (str): 表名，默认为 "df"
+        min_itemsize (dict): 字符串列预分配的长度，未指定的列按第一个数据块中的最大长度分配
+        categories (dict): 按字典编码存储的列及其词表
+        complevel (int): 新建表的压缩级别，默认为 config.Hdf_complevel
+        complib (str): 新建表的压缩库，默认为 config.Hdf_complib
+
+    已有的表沿用创建时的压缩参数。追加写入时同时记录数据块索引，关闭时保存；
+    向没有有效索引的已有表追加时不再维护索引。
+    """
+
+    def __init__(self, file_path, key="df", min_itemsize=None, categories=None,
+                 complevel=None, complib=None):
+        self.file_path = file_path
+        self.key = key
+        self.min_itemsize = dict(min_itemsize or {})
+        self.categories = categories or {}
+        self.complevel, self.complib = compression_options(complevel, complib)
+        # 以追加模式打开文件会更新修改时间，需在打开前读取索引
+        index = ChunkIndex.load(file_path, key=key) if os.path.exists(file_path) else None
+        self.store = pd.HDFStore(
+            file_path, mode="a", complevel=self.complevel, complib=self.complib)
+        if self.key not in self.store:
+            self.index = ChunkIndex(key=key)
+        elif index is not None and index.nrows == self.nrows:
+            self.index = index
+        else:
+            self.index = None
+        # 写入过程中索引已与数据不一致，中断时不能留下旧索引
+        remove_index(file_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, chunk):
+        """追加一个数据块，字符串超过已有列长度时先扩容"""
+        # 表结构按 pandas 的列块划分，改写过列类型的数据块中同类型的列可能分属不同的列块，
+        # 与已有表的结构不一致；按列重新构造使同类型的列合并，同时复制数据，下面的编码不会修改调用方的数据块
+        chunk = pd.DataFrame({column: chunk[column] for column in chunk.columns})
+        if self.categories:
+            for column, categories in self.categories.items():
+                if column in chunk:
+                    values = chunk[column]
+                    chunk[column] = pd.Categorical(
+                        values.astype(str).where(values.notna()), categories=categories)
+        sizes = {
+            column: max_string_bytes(chunk[column])
+            for column in chunk.select_dtypes(include=["object"]).columns
+        }
+        if self.key in self.store:
+            itemsizes = self._itemsizes()
+            grow = {column: string_itemsize(nbytes) for column, nbytes in sizes.items()
+                    if column in itemsizes and nbytes > itemsizes[column]}
+            if grow:
+                self._resize(grow)
+        if self.key in self.store:
+            self.store.append(self.key, chunk, format="table")
+        else:
+            min_itemsize = {
+                column: max(self.min_itemsize.get(column, 0), string_itemsize(nbytes))
+                for column, nbytes in sizes.items()
+            }
+            self.store.append(self.key, chunk, format="table", min_itemsize=min_itemsize)
+        if self.index is not None:
+            self.index.add(chunk)
+
+    def _itemsizes(self):
+        """已有表中各字符串列的存储长度"""
+        table = self.store.get_storer(self.key).table
+        return {
+            name: desc.itemsize for name, desc in table.coldescrs.items()
+            if desc.kind == "string" and name != "index"
+        }
+
+    def _resize(self, grow):
+        """将已有数据复制到字符串列更长的新表中(临时文件 {file_path}.resize)，再替换原文件
+
+        替换的是整个文件，文件中只应有当前这一个表。
+        """
+        itemsizes = self._itemsizes()
+        itemsizes.update(grow)
+        config.logger.info("字符串列扩容 %s: %s", self.file_path, grow)
+        if self.nrows == 0:
+            # 空表直接删除，由下一次写入按新的长度重建
+            self.min_itemsize.update(itemsizes)
+            self.store.remove(self.key)
+            if self.index is None:
+                self.index = ChunkIndex(key=self.key)
+            return
+        tmp_path = f"{self.file_path}.resize"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        # 新表沿用原表的压缩参数
+        filters = self.store.get_storer(self.key).table.filters
+        with pd.HDFStore(tmp_path, mode="w", complevel=filters.complevel,
+                         complib=filters.complib) as tmp:
+            for chunk in self.store.select(
+                    self.key, chunksize=config.Aligned_chunk_size, iterator=True, auto_close=False):
+                tmp.append(self.key, chunk, format="table", min_itemsize=itemsizes)
+        self.store.close()
+        os.replace(tmp_path, self.file_path)
+        self.store = pd.HDFStore(
+            self.file_path, mode="a", complevel=self.complevel, complib=self.complib)
+
+    @property
+    def nrows(self):
+        """已写入的行数"""
+        if self.key not in self.store:
+            return 0
+        return self.store.get_storer(self.key).nrows
+
+    def truncate(self, rows):
+        """删除第 rows 行之后的数据，用于从检查点恢复"""
+        if self.nrows > rows:
+            self.store.remove(self.key, start=rows)
+            if self.index is not None:
+                self.index.truncate(rows)
+
+    def close(self):
+        if self.store.is_open:
+            self.store.close()
+            if self.index is not None:
+                self.index.save(self.file_path)
+
+
+def rewrite_column(file_path, column, convert, chunksize, key="df", on_chunk=None):
+    """分块改写表中的一列，写入临时文件后替换原文件
+
+    HDF5 table 格式不支持修改已有列的类型，需要重写整个表，新表沿用原表的压缩参数。
+
+    Args:
+        file_path (str): HDF5 文件路径
+        column (str): 列名
+        convert: 列转换函数，输入 pd.Series 返回转换后的数组
+        chunksize (int): 每块行数
+        key (str): 表名
+        on_chunk: 每写完一块后的回调，参数为该块行数
+    """
+    tmp_path = f"{file_path}.rewrite"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    with TableReader(file_path, key=key) as reader:
+        complevel, complib = reader.compression
+        with TableWriter(tmp_path, key=key, complevel=complevel, complib=complib) as writer:
+            for chunk in reader.iter_chunks(chunksize):
+                chunk[column] = convert(chunk[column])
+                writer.append(chunk)
+                if on_chunk is not None:
+                    on_chunk(len(chunk))
+    os.replace(tmp_path, file_path)
+    move_index(tmp_path, file_path)
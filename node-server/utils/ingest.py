@@ -0,0 +1,358 @@
+"""CSV 文件导入模块
+
+CSV 文件分两遍读取:
+1. infer: 扫描整个文件推断列类型，后面的数据块出现与已推断类型不兼容的值时放宽该列类型
+   (int -> float -> str)，同时统计字符串列画像(StringProfile)
+2. iter_chunks: 按推断出的统一类型流式读取，每块直接写入 HDF5
+
+安装了 pyarrow 时使用 pyarrow.csv 多线程解析，否则回退到 pandas 解析器。
+
+CsvStreamIngest 用于边上传边导入: 按顺序接收文件字节，凑满一块后解析并追加到 HDF5，
+不落地临时 CSV 文件。此时无法预先扫描整个文件，后面的数据块出现不兼容的值时改写已写入的列。
+"""
+
+import io
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from config import config
+from utils.chunk_index import remove_index
+from utils.hdf import StringProfile, TableWriter, rewrite_column
+from utils.stats import update_stats
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+except ImportError:  # pyarrow 为可选依赖
+    pa = None
+    pc = None
+    pa_csv = None
+
+CSV_ENGINES = ("pyarrow", "pandas")
+
+
+def default_engine():
+    """默认的 CSV 解析引擎: 安装了 pyarrow 时使用 pyarrow"""
+    return "pyarrow" if pa_csv is not None else "pandas"
+
+
+def widen_dtype(current, new):
+    """合并同一列在两个数据块中的类型: 数值类型取公共类型，其余不一致时为 object"""
+    if current is None:
+        return np.dtype(new)
+    current, new = np.dtype(current), np.dtype(new)
+    if current == new:
+        return current
+    if current.kind in "iuf" and new.kind in "iuf":
+        return np.result_type(current, new)
+    return np.dtype(object)
+
+
+def _widen_arrow(arrow_type):
+    """pyarrow 列类型的放宽顺序: null -> float64，int -> float64，其余 -> string"""
+    if pa.types.is_null(arrow_type) or pa.types.is_integer(arrow_type):
+        return pa.float64()
+    return pa.string()
+
+
+def _supported_arrow(arrow_type):
+    """与 pandas 解析结果一致的类型，日期、时间等其他类型按字符串读取"""
+    return (pa.types.is_null(arrow_type) or pa.types.is_integer(arrow_type)
+            or pa.types.is_floating(arrow_type) or pa.types.is_boolean(arrow_type)
+            or pa.types.is_string(arrow_type))
+
+
+class CsvSource:
+    """CSV 数据源
+
+    Args:
+        file_path (str): CSV 文件路径
+        chunk_size (int): pandas 解析时每块的行数，默认为 config.Ingest_chunk_size
+        block_size (int): pyarrow 解析时每块的字节数，默认为 config.Ingest_block_size
+        engine (str): 解析引擎 pyarrow / pandas，默认按是否安装 pyarrow 选择
+    """
+
+    def __init__(self, file_path, chunk_size=None, block_size=None, engine=None):
+        self.file_path = file_path
+        self.chunk_size = chunk_size or config.Ingest_chunk_size
+        self.block_size = block_size or config.Ingest_block_size
+        self.engine = engine or default_engine()
+        if self.engine not in CSV_ENGINES:
+            raise ValueError(f"不支持的 CSV 解析引擎: {self.engine}")
+        if self.engine == "pyarrow" and pa_csv is None:
+            raise ValueError("未安装 pyarrow")
+        if engine is None and pa_csv is None:
+            config.logger.warning("未安装 pyarrow，CSV 回退为 pandas 单线程解析: %s", file_path)
+        else:
+            config.logger.info("CSV 解析引擎 %s: %s", self.engine, file_path)
+        self.dtypes = None  # 列名 -> 推断出的 numpy 类型
+        self._arrow_types = None
+
+    def infer(self):
+        """扫描整个文件推断列类型
+
+        Returns:
+            StringProfile: 字符串列画像
+        """
+        if self.engine == "pyarrow":
+            return self._infer_arrow()
+        return self._infer_pandas()
+
+    def iter_chunks(self):
+        """按推断出的列类型分块读取，需先调用 infer"""
+        if self.dtypes is None:
+            raise RuntimeError("需先调用 infer 推断列类型")
+        if self.engine == "pyarrow":
+            reader = self._open_arrow(self._arrow_types)
+            for batch in reader:
+                yield batch.to_pandas().astype(self.dtypes, copy=False)
+        else:
+            yield from pd.read_csv(self.file_path, chunksize=self.chunk_size, dtype=self.dtypes)
+
+    def _infer_pandas(self):
+        profile = StringProfile()
+        dtypes = {}
+        mixed = set()  # 部分数据块中不是字符串的列
+        for chunk in pd.read_csv(self.file_path, chunksize=self.chunk_size):
+            profile.update(chunk)
+            for column, dtype in chunk.dtypes.items():
+                if dtype != object:
+                    mixed.add(column)
+                dtypes[column] = widen_dtype(dtypes.get(column), dtype)
+        for column in mixed:
+            if dtypes[column] == object:
+                profile.exclude(column)
+        self.dtypes = dtypes
+        return profile
+
+    def _open_arrow(self, column_types):
+        return pa_csv.open_csv(
+            self.file_path,
+            read_options=pa_csv.ReadOptions(use_threads=True, block_size=self.block_size),
+            convert_options=pa_csv.ConvertOptions(
+                column_types=column_types, strings_can_be_null=True),
+        )
+
+    def _infer_arrow(self):
+        # pyarrow 按第一块推断类型，后面的块转换失败时放宽该列类型后重新扫描
+        column_types = {}
+        while True:
+            reader = self._open_arrow(column_types)
+            schema = reader.schema
+            unsupported = {field.name: pa.string() for field in schema
+                           if not _supported_arrow(field.type)}
+            if unsupported:
+                column_types.update(unsupported)
+                continue
+            profile = StringProfile()
+            nulls = dict.fromkeys(schema.names, 0)
+            try:
+                for batch in reader:
+                    profile.rows += batch.num_rows
+                    for name, column in zip(schema.names, batch.columns):
+                        nulls[name] += column.null_count
+                        if pa.types.is_string(column.type):
+                            # 字符串列画像直接用 Arrow 计算，不转换为 pandas
+                            profile.add(
+                                name, pc.max(pc.binary_length(column)).as_py() or 0,
+                                lambda: pc.unique(column.drop_null()).to_pylist())
+            except pa.ArrowInvalid as e:
+                match = re.search(r"column #(\d+)", str(e))
+                if match is None:
+                    raise
+                field = schema.field(int(match.group(1)))
+                config.logger.info("CSV 列 %s 类型放宽: %s", field.name, str(e))
+                column_types[field.name] = _widen_arrow(field.type)
+                continue
+            break
+
+        self._arrow_types = {}
+        self.dtypes = {}
+        for field in schema:
+            arrow_type, has_nulls = field.type, nulls[field.name] > 0
+            if pa.types.is_null(arrow_type) or pa.types.is_floating(arrow_type) or (
+                    pa.types.is_integer(arrow_type) and has_nulls):
+                # 含空值的整数列与 pandas 一致保存为 float64
+                arrow_type, dtype = pa.float64(), np.dtype(np.float64)
+            elif pa.types.is_integer(arrow_type):
+                arrow_type, dtype = pa.int64(), np.dtype(np.int64)
+            elif pa.types.is_boolean(arrow_type):
+                dtype = np.dtype(object) if has_nulls else np.dtype(bool)
+            else:
+                dtype = np.dtype(object)
+            self._arrow_types[field.name] = arrow_type
+            self.dtypes[field.name] = dtype
+        return profile
+
+
+class CsvStreamIngest:
+    """边接收边导入的 CSV 数据源
+
+    按顺序调用 feed 传入文件内容，凑满 block_size 字节的完整行后解析为一个数据块写入 HDF5，
+    最后调用 finish 写入剩余数据。列类型按已接收的数据推断，
+    后面的数据块需要放宽类型(int -> float -> str)时改写 HDF5 中已写入的该列。
+    接收的内容同时顺序写入临时文件({original_path}.csv，结束后删除)，数值列放宽为字符串时
+    从中按原文重新读取该列，结果与整个文件读取(CsvSource)时一致，不会把 "1" 存为 "1.0"。
+
+    Args:
+        original_path (str): 原始数据 HDF5 文件路径
+        complevel (int): 压缩级别
+        complib (str): 压缩库
+        block_size (int): 每次解析的字节数，默认为 config.Ingest_block_size
+    """
+
+    def __init__(self, original_path, complevel=None, complib=None, block_size=None):
+        self.original_path = original_path
+        self.complevel = complevel
+        self.complib = complib
+        self.block_size = block_size or config.Ingest_block_size
+        self.dtypes = None  # 列名 -> 已写入数据的 numpy 类型
+        self.stats = {}
+        self.data_count = 0
+        self.received = 0  # 已接收的字节数
+        self._header = None
+        self._buffer = bytearray()
+        if os.path.exists(original_path):
+            os.remove(original_path)
+        self._writer = None
+        self._spool_path = f"{original_path}.csv"
+        self._spool = open(self._spool_path, "wb")
+
+    def feed(self, data):
+        """接收一段文件内容"""
+        self._spool.write(data)
+        self._buffer += data
+        self.received += len(data)
+        if self._header is None:
+            end = self._record_end(self._buffer, 0)
+            if end is None:
+                return
+            self._header = bytes(self._buffer[:end])
+            del self._buffer[:end]
+        if len(self._buffer) >= self.block_size:
+            end = self._record_end(self._buffer, len(self._buffer))
+            if end is not None:
+                block = bytes(self._buffer[:end])
+                del self._buffer[:end]
+                self._write(block)
+
+    def finish(self):
+        """写入剩余数据并关闭文件
+
+        Returns:
+            tuple: (数据行数, 各列统计量)
+        """
+        if self._header is None:
+            self._header = bytes(self._buffer)
+            self._buffer.clear()
+        if not self._header.strip():
+            raise ValueError("CSV 文件为空")
+        block = bytes(self._buffer)
+        self._buffer.clear()
+        if block.strip() or self._writer is None:
+            self._write(block)
+        self._writer.close()
+        self._remove_spool()
+        return self.data_count, self.stats
+
+    def abort(self):
+        """放弃导入，删除已写入的文件"""
+        if self._writer is not None:
+            self._writer.close()
+        if os.path.exists(self.original_path):
+            os.remove(self.original_path)
+        remove_index(self.original_path)
+        self._remove_spool()
+
+    def _remove_spool(self):
+        self._spool.close()
+        if os.path.exists(self._spool_path):
+            os.remove(self._spool_path)
+
+    @staticmethod
+    def _record_end(buffer, before):
+        """buffer[:before] 中最后一个不在引号内的换行符之后的位置，没有时返回 None
+
+        before 为 0 时查找第一个完整记录(表头)的结尾。
+        """
+        if before == 0:
+            position = 0
+            while True:
+                position = buffer.find(b"\n", position) + 1
+                if position == 0:
+                    return None
+                if buffer.count(b'"', 0, position) % 2 == 0:
+                    return position
+        quotes = buffer.count(b'"', 0, before)
+        position = before
+        while True:
+            newline = buffer.rfind(b"\n", 0, position)
+            if newline < 0:
+                return None
+            quotes -= buffer.count(b'"', newline, position)
+            if quotes % 2 == 0:
+                return newline + 1
+            position = newline
+
+    def _write(self, block):
+        chunk = pd.read_csv(io.BytesIO(self._header + block))
+        if self._writer is None:
+            self.dtypes = chunk.dtypes.to_dict()
+            self._writer = TableWriter(
+                self.original_path, complevel=self.complevel, complib=self.complib)
+        else:
+            text = []  # 本块中已解析为数值、需按原文转为字符串的列
+            for column, dtype in chunk.dtypes.items():
+                current = self.dtypes[column]
+                widened = widen_dtype(current, dtype)
+                if widened != current:
+                    self._widen(column, widened)
+                if widened == object and dtype != object:
+                    text.append(column)
+                elif widened != dtype:
+                    chunk[column] = chunk[column].astype(widened)
+            if text:
+                raw = pd.read_csv(io.BytesIO(self._header + block), usecols=text,
+                                  dtype={column: str for column in text})
+                for column in text:
+                    chunk[column] = raw[column].to_numpy(dtype=object)
+        if len(chunk):
+            # 与 pandas 分块读取一致，行索引在各块之间连续
+            chunk.index = pd.RangeIndex(self.data_count, self.data_count + len(chunk))
+            self._writer.append(chunk)
+            update_stats(self.stats, chunk)
+            self.data_count += len(chunk)
+
+    def _widen(self, column, dtype):
+        """放宽已写入数据中某列的类型"""
+        config.logger.info("CSV 列 %s 类型放宽: %s -> %s", column, self.dtypes[column], dtype)
+        self.dtypes[column] = dtype
+        if self._writer.nrows == 0:
+            return
+        rows = self._writer.nrows
+        self._writer.close()
+        chunk_size = config.Ingest_chunk_size
+        if dtype == object:
+            # 已写入的数值无法还原原文(如 1 与 1.0)，从临时文件中按字符串重新读取该列
+            self._spool.flush()
+            raw = pd.read_csv(self._spool_path, usecols=[column], dtype={column: str},
+                              nrows=rows, chunksize=chunk_size)
+
+            def convert(values):
+                text = next(raw)[column]
+                if len(text) != len(values):
+                    raise ValueError(f"CSV 列 {column} 改写时行数不一致")
+                return text.to_numpy(dtype=object)
+        else:
+            def convert(values):
+                return values.astype(dtype)
+        try:
+            rewrite_column(self.original_path, column, convert, chunk_size)
+        finally:
+            if dtype == object:
+                raw.close()
+        self._writer = TableWriter(self.original_path)
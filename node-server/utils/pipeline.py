@@ -0,0 +1,87 @@
+"""多进程有序数据处理流水线
+
+工作进程按行区间各自读取并转换原始 HDF5 数据块，主进程按原始顺序取回结果并写入，
+同时在途的数据块数量不超过队列深度，以限制内存占用。
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.expression import CompiledRuler
+from utils.hdf import TableReader
+
+# 工作进程内的对齐上下文，由 init_align_worker 初始化
+_align_context = {}
+
+
+def chunk_ranges(total, chunk_size, start=0):
+    """将 [start, total) 按 chunk_size 切分为行区间列表"""
+    return [(begin, min(begin + chunk_size, total))
+            for begin in range(start, total, chunk_size)]
+
+
+def resolve_workers(workers):
+    """解析工作进程数，0 或负数表示使用全部 CPU 核心"""
+    if workers is None or workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def ordered_map(func, tasks, workers=1, queue_depth=4, initializer=None, initargs=()):
+    """按任务顺序返回 func(task) 的结果
+
+    Args:
+        func: 任务处理函数，多进程模式下必须可被 pickle(模块级函数)
+        tasks: 任务列表
+        workers (int): 工作进程数，不大于 1 时在当前进程中顺序执行
+        queue_depth (int): 同时在途的最大任务数
+        initializer: 工作进程初始化函数
+        initargs (tuple): 初始化函数参数
+
+    Yields:
+        任务结果，顺序与 tasks 一致
+    """
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for task in tasks:
+            yield func(task)
+        return
+
+    queue_depth = max(queue_depth, workers)
+    executor = ProcessPoolExecutor(
+        max_workers=workers, initializer=initializer, initargs=initargs)
+    pending = deque()
+    try:
+        for task in tasks:
+            if len(pending) >= queue_depth:
+                yield pending.popleft().result()
+            pending.append(executor.submit(func, task))
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def init_align_worker(file_path, operators, constants):
+    """工作进程初始化: 打开原始文件并编译对齐规则"""
+    reader = TableReader(file_path)
+    transform = CompiledRuler(operators, constants)
+    _align_context["reader"] = reader
+    _align_context["transform"] = transform
+    _align_context["dtypes"] = reader.dtypes
+    # 只读取规则用到的列，全部为聚合操作符时读取一列以确定行数
+    _align_context["columns"] = transform.columns or reader.columns[:1]
+
+
+def align_range(bounds):
+    """读取并转换原始文件中 [start, stop) 行区间的数据
+
+    Returns:
+        tuple: (对齐后的数据块, 各字段类型转换失败的个数)
+    """
+    start, stop = bounds
+    chunk = _align_context["reader"].read(
+        columns=_align_context["columns"], start=start, stop=stop)
+    return _align_context["transform"].evaluate(chunk, _align_context["dtypes"])
@@ -0,0 +1,215 @@
+"""列统计模块
+
+在一次分块扫描中同时计算多个字段的多种统计量，供对齐规则中的聚合操作符使用。
+上传数据时会顺带生成统计目录(与 HDF5 文件同目录的 .stats.json)，文件变化后自动失效，
+聚合操作符优先从统计目录中直接读取结果；统计目录失效时 max/min 由数据块索引合并得到。
+支持的统计量:
+- avg: 求和 / 总行数(与原 get_data 的口径一致，空值计入行数)
+- max / min: 最大值 / 最小值(忽略空值)
+- count: 非空值个数
+- sum: 求和(忽略空值)
+- std: 样本标准差(忽略空值)
+- null_count: 空值个数
+"""
+
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.chunk_index import ChunkIndex
+from utils.hdf import iter_table
+
+STATISTICS = ("avg", "max", "min", "count", "sum", "std", "null_count")
+
+
+class ColumnStats:
+    """单列的可合并统计量"""
+
+    def __init__(self, rows=0, count=0, total=0.0, sum_sq=0.0,
+                 min_val=math.inf, max_val=-math.inf, null_count=0, numeric=True):
+        self.numeric = numeric
+        self.rows = rows
+        self.count = count
+        self.sum = total
+        self.sum_sq = sum_sq
+        self.min = min_val
+        self.max = max_val
+        self.null_count = null_count
+
+    def update(self, series):
+        """累加一个数据块中该列的统计量"""
+        if not pd.api.types.is_numeric_dtype(series):
+            self.numeric = False
+        if not self.numeric:
+            # 非数值列只统计行数和空值
+            nulls = int(series.isna().sum())
+            self.rows += len(series)
+            self.null_count += nulls
+            self.count += len(series) - nulls
+            return
+        values = pd.to_numeric(series, errors="coerce").to_numpy(dtype=np.float64)
+        mask = np.isnan(values)
+        valid = values[~mask]
+        self.rows += len(values)
+        self.null_count += int(mask.sum())
+        self.count += len(valid)
+        if len(valid):
+            self.sum += float(valid.sum())
+            self.sum_sq += float(np.square(valid).sum())
+            self.min = min(self.min, float(valid.min()))
+            self.max = max(self.max, float(valid.max()))
+
+    def get(self, statistic):
+        """返回指定统计量的值"""
+        if statistic == "count":
+            return self.count
+        elif statistic == "null_count":
+            return self.null_count
+        elif not self.numeric:
+            raise ValueError(f"非数值字段不支持统计量: {statistic}")
+        elif statistic == "avg":
+            return self.sum / self.rows if self.rows else math.nan
+        elif statistic == "max":
+            return self.max if self.count else math.nan
+        elif statistic == "min":
+            return self.min if self.count else math.nan
+        elif statistic == "sum":
+            return self.sum
+        elif statistic == "std":
+            if self.count < 2:
+                return math.nan
+            variance = (self.sum_sq - self.sum * self.sum / self.count) / (self.count - 1)
+            return math.sqrt(max(variance, 0.0))
+        raise ValueError(f"不支持的统计量: {statistic}")
+
+    def to_dict(self):
+        return {
+            "numeric": self.numeric,
+            "rows": self.rows,
+            "count": self.count,
+            "sum": self.sum,
+            "sum_sq": self.sum_sq,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "null_count": self.null_count,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            rows=data["rows"],
+            count=data["count"],
+            total=data["sum"],
+            sum_sq=data["sum_sq"],
+            min_val=math.inf if data["min"] is None else data["min"],
+            max_val=-math.inf if data["max"] is None else data["max"],
+            null_count=data["null_count"],
+            numeric=data.get("numeric", True),
+        )
+
+
+def update_stats(stats, chunk):
+    """用一个数据块更新各列的统计量(stats 为 列名 -> ColumnStats)"""
+    for column in chunk.columns:
+        stats.setdefault(column, ColumnStats()).update(chunk[column])
+
+
+def catalog_path(file_path):
+    """统计目录文件路径: data/original/xxx.h5 -> data/original/xxx.stats.json"""
+    return f"{os.path.splitext(file_path)[0]}.stats.json"
+
+
+def _signature(file_path):
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def save_catalog(file_path, stats):
+    """保存统计目录，记录数据文件的大小和修改时间用于失效判断"""
+    path = catalog_path(file_path)
+    data = {
+        "source": _signature(file_path),
+        "columns": {column: s.to_dict() for column, s in stats.items()},
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def load_catalog(file_path):
+    """读取统计目录，不存在或数据文件已变化时返回 None"""
+    path = catalog_path(file_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("source") != _signature(file_path):
+        return None
+    return {column: ColumnStats.from_dict(s) for column, s in data["columns"].items()}
+
+
+def scan_statistics(file_path, fields, chunk_size=10000):
+    """一次分块扫描计算多个字段的统计量，只读取涉及的列
+
+    Args:
+        file_path (str): HDF5 文件路径
+        fields (list): 字段名列表
+        chunk_size (int): 每次读取的行数
+
+    Returns:
+        dict: 字段名 -> ColumnStats
+    """
+    fields = list(dict.fromkeys(fields))
+    stats = {field: ColumnStats() for field in fields}
+    for chunk in iter_table(file_path, chunk_size, columns=fields):
+        for field in fields:
+            stats[field].update(chunk[field])
+    return stats
+
+
+def compute_statistics(file_path, items, chunk_size=10000):
+    """计算一组 (字段, 统计量) 请求
+
+    Args:
+        file_path (str): HDF5 文件路径
+        items (list): (field, statistic) 列表
+        chunk_size (int): 每次读取的行数
+
+    Returns:
+        list: 与 items 顺序一致的统计结果
+    """
+    for _, statistic in items:
+        if statistic not in STATISTICS:
+            raise ValueError(f"不支持的统计量: {statistic}")
+    stats = load_catalog(file_path) or {}
+    extremes = {}
+    if any(field not in stats for field, _ in items):
+        # 统计目录缺失或已失效时 max/min 优先由数据块索引合并，不需要扫描文件
+        index = ChunkIndex.load(file_path)
+        for field, statistic in items:
+            if index is not None and field not in stats and statistic in ("max", "min"):
+                value = index.extreme(field, statistic)
+                if value is not None:
+                    extremes[(field, statistic)] = float(value)
+    missing = [field for field, statistic in items
+               if field not in stats and (field, statistic) not in extremes]
+    if missing:
+        # 其余字段扫描一次后写回目录
+        stats.update(scan_statistics(file_path, missing, chunk_size))
+        save_catalog(file_path, stats)
+    return [to_json_number(extremes[(field, statistic)]) if (field, statistic) in extremes
+            else to_json_number(stats[field].get(statistic)) for field, statistic in items]
+
+
+def to_json_number(value):
+    """将统计结果转换为可 JSON 序列化的数值，NaN/inf 转为 None"""
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
@@ -0,0 +1,49 @@
+"""对齐数据集存储格式选择模块
+
+对齐数据支持两种存储格式:
+- hdf5: data/aligned/{file_name}.h5，PyTables table 格式(默认)
+- columnar: data/aligned/{file_name}/，按列存储，可内存映射(见 utils.columnar)
+"""
+
+import os
+
+from utils import columnar, hdf
+from utils.columnar import ColumnarReader, ColumnarWriter
+from utils.hdf import TableReader, TableWriter
+
+STORAGE_FORMATS = ("hdf5", "columnar")
+
+
+def aligned_path(file_name, storage_format=None, base_dir="data/aligned"):
+    """对齐数据集路径，未指定格式时按已存在的数据集判断"""
+    if storage_format is None:
+        dir_path = os.path.join(base_dir, file_name)
+        storage_format = "columnar" if os.path.isdir(dir_path) else "hdf5"
+    if storage_format == "columnar":
+        return os.path.join(base_dir, file_name)
+    elif storage_format == "hdf5":
+        return os.path.join(base_dir, f"{file_name}.h5")
+    raise ValueError(f"不支持的存储格式: {storage_format}")
+
+
+def open_reader(path, logger=None):
+    """按路径打开数据集读取器，目录为列式存储，否则为 HDF5"""
+    if os.path.isdir(path):
+        return ColumnarReader(path, logger=logger)
+    return TableReader(path, logger=logger)
+
+
+def open_writer(path, storage_format="hdf5", complevel=None, complib=None):
+    """打开数据集写入器，压缩参数只对 HDF5 生效(列式存储需要保持可内存映射)"""
+    if storage_format == "columnar":
+        return ColumnarWriter(path)
+    elif storage_format == "hdf5":
+        return TableWriter(path, complevel=complevel, complib=complib)
+    raise ValueError(f"不支持的存储格式: {storage_format}")
+
+
+def rewrite_column(path, column, convert, chunksize, on_chunk=None):
+    """改写数据集中的一列(如修改字段类型)，参数见 utils.hdf.rewrite_column"""
+    if os.path.isdir(path):
+        return columnar.rewrite_column(path, column, convert, chunksize, on_chunk=on_chunk)
+    return hdf.rewrite_column(path, column, convert, chunksize, on_chunk=on_chunk)
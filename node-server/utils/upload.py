@@ -0,0 +1,139 @@
+"""分块上传辅助函数
+
+已接收的数据用有序、互不重叠的字节区间 [start, end) 列表表示，
+乱序到达或重传的分块合并到区间列表中，断线重连后据此判断需要补传的部分。
+
+按内容存储的原始数据(data/original/{sha256}.h5)在导入时记录摘要和行数
+({sha256}.content.json)。原始数据可能在导入后被原地追加(增量刷新对齐数据)，
+追加后文件内容已与摘要不符，相同内容再次上传时不再复用该文件。
+"""
+
+import hashlib
+import json
+import os
+import zlib
+
+CHECKSUM_TYPES = ("sha256", "crc32")
+
+
+def add_range(ranges, start, end):
+    """将 [start, end) 合并到区间列表中，返回新的区间列表"""
+    merged = []
+    for range_start, range_end in sorted(ranges + [[start, end]]):
+        if merged and range_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], range_end)
+        else:
+            merged.append([range_start, range_end])
+    return merged
+
+
+def missing_ranges(ranges, size):
+    """[0, size) 中尚未接收的区间"""
+    missing = []
+    position = 0
+    for start, end in ranges:
+        if start > position:
+            missing.append([position, min(start, size)])
+        position = max(position, end)
+        if position >= size:
+            break
+    if position < size:
+        missing.append([position, size])
+    return missing
+
+
+def received_bytes(ranges):
+    """已接收的字节数"""
+    return sum(end - start for start, end in ranges)
+
+
+def compute_checksum(data, checksum_type="sha256"):
+    """计算分块校验和，sha256 返回十六进制摘要，crc32 返回 8 位十六进制"""
+    if checksum_type == "sha256":
+        return hashlib.sha256(data).hexdigest()
+    elif checksum_type == "crc32":
+        return f"{zlib.crc32(data) & 0xFFFFFFFF:08x}"
+    raise ValueError(f"不支持的校验和类型: {checksum_type}")
+
+
+def contiguous_end(ranges, size=None):
+    """从文件开头起连续接收到的位置"""
+    if not ranges or ranges[0][0] > 0:
+        return 0
+    return ranges[0][1] if size is None else min(ranges[0][1], size)
+
+
+class PrefixHasher:
+    """边接收边计算文件内容的 sha256
+
+    只能按顺序计算，乱序到达的分块先写入文件，前面的数据到齐后再从文件中读回计算。
+    """
+
+    def __init__(self):
+        self.sha256 = hashlib.sha256()
+        self.position = 0  # 已计算的字节数
+
+    def update(self, offset, data, file=None, end=None):
+        """
+        计算新到达的分块
+
+        Args:
+            offset (int): 分块在文件中的位置
+            data (bytes): 分块数据
+            file: 已写入分块的临时文件，为空时只计算按顺序到达的分块
+            end (int): 从文件开头起连续接收到的位置
+        """
+        if offset <= self.position < offset + len(data):
+            self.sha256.update(data[self.position - offset:])
+            self.position = offset + len(data)
+        if file is not None and end is not None and end > self.position:
+            self.read(file, end)
+
+    def read(self, file, end, block_size=1 << 20):
+        """从文件中读取 [position, end) 继续计算"""
+        file.flush()
+        file.seek(self.position)
+        while self.position < end:
+            data = file.read(min(block_size, end - self.position))
+            if not data:
+                break
+            self.sha256.update(data)
+            self.position += len(data)
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
+
+def content_path(file_path):
+    """内容记录路径: data/original/xxx.h5 -> data/original/xxx.content.json"""
+    return f"{os.path.splitext(file_path)[0]}.content.json"
+
+
+def save_content(file_path, digest, rows):
+    """记录按内容存储的原始数据文件的摘要和导入时的行数"""
+    path = content_path(file_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"sha256": digest, "rows": int(rows)}, f)
+    os.replace(tmp_path, path)
+
+
+def content_unchanged(file_path, rows):
+    """原始数据文件导入后是否未被追加数据
+
+    Args:
+        file_path (str): 原始数据文件路径
+        rows (int): 文件当前的行数
+
+    Returns:
+        bool: 当前行数与导入时记录的行数一致时为 True，没有记录(如记录之前导入的文件)时为 False
+    """
+    path = content_path(file_path)
+    if not os.path.exists(path):
+        return False
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return data.get("rows") == int(rows)
@@ -1,15 +1,30 @@
 """用于处理数据对齐的路由模块"""
-from typing import Union, List
-import pandas as pd
+from typing import Union, List, Optional
+import json
+import random
+import tempfile
+import time
+import uuid
 import requests
 import os
+import shutil
 from fastapi import APIRouter, Request, HTTPException
 from pydantic import BaseModel
-from utils.utils import add, sub, mul, div
+from utils.expression import CompiledRuler, cast_column, resolve_field_type
+from utils.stats import catalog_path, compute_statistics
+from utils.chunk_index import index_path
+from utils.hdf import TableReader, compression_options
+from utils.storage import STORAGE_FORMATS, aligned_path, open_reader, open_writer, rewrite_column
+from utils.pipeline import ordered_map, resolve_workers, init_align_worker, align_range
+from utils.utils import run_in_thread
+from model import redis
 from config import config
 
 aligned = APIRouter(prefix="/aligned")
 
+ALIGNED_JOB_EXPIRE = 60 * 60 * 24 * 7  # 对齐任务状态保留7天
+active_aligned_jobs = set()  # 当前进程中正在运行的对齐任务
+
 
 class DB(BaseModel):
     id: int
@@ -27,6 +42,7 @@ class OriginalField(BaseModel):
 class AlignedField(BaseModel):
     field: str
     type: str
+    on_error: Optional[str] = None  # 类型转换失败时的处理策略: raise / coerce / drop，为空时保持原有逐值转换
 
 
 class Operator(BaseModel):
@@ -34,11 +50,27 @@ class Operator(BaseModel):
     aligned_field: AlignedField
     operator: str
     original_field: Union[OriginalField, List[OriginalField]]
+    expression: Optional[str] = None  # operator 为 expr 时的算术表达式，字段名需出现在 original_field 中
 
 
 class Ruler(BaseModel):
     db: DB
     operator: List[Operator]
+    constants: Optional[dict] = None  # 聚合操作符(avg/max/min)的结果，增量刷新时传入创建时的值，为空时重新计算
+
+
+class StatisticsItem(BaseModel):
+    field: str
+    statistic: str
+
+
+class StatisticsRequest(BaseModel):
+    file_name: str
+    items: List[StatisticsItem]
+
+
+class DeleteAligned(BaseModel):
+    file_name: str
 
 
 class UpdateFieldType(BaseModel):
@@ -48,22 +80,6 @@ class UpdateFieldType(BaseModel):
     file_name: str
 
 
-def convert_type(value, type_str):
-    """根据类型字符串转换数据类型"""
-    try:
-        if type_str == "int":
-            return int(value)
-        elif type_str == "float":
-            return float(value)
-        elif type_str == "str":
-            return str(value)
-        elif type_str == "list":
-            return list(value)
-        return value
-    except (ValueError, TypeError):
-        return value
-
-
 @aligned.get("/get_data")
 def get_data(operator: Operator):
     """
@@ -74,159 +90,497 @@ def get_data(operator: Operator):
     Returns:
         dict: 包含状态信息的字典，成功返回 {"status": "success"}
     """
-    field = operator.original_field.field
-    chunk_size = 10000
+    if operator.operator not in ("avg", "max", "min"):
+        return None
     try:
-        if operator.operator == "avg":
-            count = 0
-            total = 0
-            for chunk in pd.read_hdf(f"data/original/{operator.original_field.file_name}.h5",
-                                     chunksize=chunk_size):
-                count += len(chunk)
-                total += chunk[field].sum()
-            return float(total / count)
-        elif operator.operator == "max":
-            max_val = float('-inf')
-            for chunk in pd.read_hdf(f"data/original/{operator.original_field.file_name}.h5",
-                                     chunksize=chunk_size):
-                max_val = max(max_val, chunk[field].max())
-            return float(max_val)
-        elif operator.operator == "min":
-            min_val = float('inf')
-            for chunk in pd.read_hdf(f"data/original/{operator.original_field.file_name}.h5",
-                                     chunksize=chunk_size):
-                min_val = min(min_val, chunk[field].min())
-            return float(min_val)
+        return compute_statistics(
+            f"data/original/{operator.original_field.file_name}.h5",
+            [(operator.original_field.field, operator.operator)],
+        )[0]
     except Exception as e:
         raise HTTPException(401, detail=f"{e}") from e
 
 
+@aligned.post("/get_data_batch")
+def get_data_batch(statistics: StatisticsRequest):
+    """
+    一次扫描计算多个字段的多种统计量
+    Args:
+        statistics (StatisticsRequest): 文件名及 (字段, 统计量) 列表
+    Returns:
+        dict: {"data": [...]}，顺序与请求中的 items 一致
+    """
+    file_path = f"data/original/{statistics.file_name}.h5"
+    if not os.path.exists(file_path):
+        raise HTTPException(401, detail=f"{statistics.file_name}文件不存在")
+    try:
+        data = compute_statistics(
+            file_path, [(item.field, item.statistic) for item in statistics.items])
+    except Exception as e:
+        raise HTTPException(401, detail=f"{e}") from e
+    return {"data": data}
+
+
+def resolve_constants(ruler):
+    """
+    计算规则中聚合操作符(avg/max/min)的结果并校验规则
+
+    规则中带有 constants 时直接使用(增量刷新沿用创建时的结果，新增的行与已对齐的行使用相同的常量)，
+    只计算其中缺少的字段。
+    Returns:
+        dict: 对齐字段名 -> 统计结果
+    """
+    other_data = dict(ruler.constants or {})
+    aggregate = [r.model_dump() for r in ruler.operator
+                 if r.operator in ("avg", "max", "min")
+                 and r.aligned_field.field not in other_data]
+    if aggregate:
+        try:
+            # 所有聚合操作符合并为一次请求，由中心按节点分组后各扫描一次文件
+            res = requests.post(
+                f"http://{config.center_host}:{config.center_port}/ruler/get_batch",
+                json=aggregate,
+                timeout=300
+            )
+            if res.status_code != 200:
+                raise HTTPException(
+                    401, detail=f"{res.json().get('detail')}")
+            other_data.update(res.json().get("data", {}))
+        except requests.Timeout as e:
+            raise HTTPException(408, detail="Request timeout") from e
+        except requests.RequestException as e:
+            raise HTTPException(
+                500, detail=f"Request failed: {str(e)}") from e
+
+    try:
+        # 先在当前进程编译一次以校验规则，工作进程中各自编译后按列对整个数据块求值
+        CompiledRuler(ruler.operator, other_data)
+    except (KeyError, ValueError) as e:
+        raise HTTPException(401, detail=f"{e}") from e
+    return other_data
+
+
+def parse_compression(request):
+    """从查询参数中解析 HDF5 压缩参数，未指定时使用节点默认配置"""
+    complevel = request.query_params.get("complevel")
+    try:
+        return compression_options(
+            None if complevel in (None, "") else int(complevel),
+            request.query_params.get("complib") or None)
+    except ValueError as e:
+        raise HTTPException(401, detail=f"{e}") from e
+
+
+def save_aligned_job(job):
+    """保存对齐任务状态(包含恢复任务所需的全部参数和检查点)"""
+    job["updated_at"] = time.time()
+    redis.set(f"aligned_job:{job['job_id']}", json.dumps(job), ex=ALIGNED_JOB_EXPIRE)
+
+
+def load_aligned_job(job_id):
+    """读取对齐任务状态，不存在时返回 None"""
+    job = redis.get(f"aligned_job:{job_id}")
+    if job is None:
+        return None
+    return json.loads(job)
+
+
+@run_in_thread
+def run_aligned_job(job_id):
+    """在后台线程中执行(或从检查点继续执行)对齐任务或字段类型转换任务"""
+    job = load_aligned_job(job_id)
+    active_aligned_jobs.add(job_id)
+    try:
+        if job.get("kind") == "field_type":
+            convert_field_type(job)
+        else:
+            align(job)
+        job["status"] = "finished"
+    except Exception as e:
+        config.logger.error("对齐任务失败: job_id=%s, %s", job_id, str(e))
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        active_aligned_jobs.discard(job_id)
+        save_aligned_job(job)
+
+
+def align(job):
+    """
+    对齐原始数据并追加写入对齐数据
+
+    每写完一个数据块保存一次检查点(next_row/output_rows)，中断后从检查点继续，
+    并先删除对齐数据中检查点之后已写入的部分，避免重复。
+    """
+    ruler = Ruler(**job["ruler"])
+    # 兼容旧版本创建的任务
+    job.setdefault("data_count", job["rows_done"])
+    job.setdefault("rows_dropped", 0)
+    job.setdefault("field_failures", {})
+    original_path = f"data/original/{job['original_file']}.h5"
+    # 按原始数据的数据块索引切分，每个工作进程读取的行区间不跨越写入时的数据块
+    with TableReader(original_path) as reader:
+        ranges = reader.chunk_ranges(
+            config.Aligned_chunk_size, start=job["next_row"], stop=job["total"])
+
+    # 工作进程按行区间读取并转换数据块，当前进程按原始顺序追加写入
+    results = ordered_map(
+        align_range,
+        ranges,
+        workers=job["workers"],
+        queue_depth=config.Aligned_queue_depth,
+        initializer=init_align_worker,
+        initargs=(original_path, ruler.operator, job["constants"]),
+    )
+    writer = open_writer(
+        aligned_path(job["file_name"], job["storage_format"]), job["storage_format"],
+        complevel=job.get("complevel"), complib=job.get("complib"))
+    try:
+        if job["output_rows"] is None:
+            job["output_rows"] = writer.nrows
+        else:
+            writer.truncate(job["output_rows"])
+        started_at = time.time()
+        rows_before = job["rows_done"]
+        for (start, stop), (chunk_df, failures) in zip(ranges, results):
+            if len(chunk_df) > 0:
+                writer.append(chunk_df)
+            job["rows_done"] += stop - start
+            job["data_count"] += len(chunk_df)
+            job["rows_dropped"] += (stop - start) - len(chunk_df)
+            job["output_rows"] += len(chunk_df)
+            for name, count in failures.items():
+                job["field_failures"][name] = job["field_failures"].get(name, 0) + count
+            job["next_row"] = stop
+            elapsed = time.time() - started_at
+            if elapsed > 0:
+                job["rows_per_second"] = (job["rows_done"] - rows_before) / elapsed
+            save_aligned_job(job)
+
+            # 清理内存
+            del chunk_df
+    finally:
+        results.close()
+        writer.close()
+
+
 @aligned.post("/add")
 def add_aligned(ruler: Ruler, request: Request):
+    """
+    创建后台对齐任务
+    Args:
+        ruler (Ruler): 该原始数据库的对齐规则
+        request (Request): 请求对象，查询参数包括 file_name、original_file、
+            storage_format、start(起始行)、workers(工作进程数)、complevel/complib(HDF5 压缩参数)
+    Returns:
+        dict: 包含任务ID和待对齐行数，进度通过 /aligned/progress/{job_id} 查询
+    """
     file_name = request.query_params.get("file_name")
     original_file = request.query_params.get("original_file")
-    other_data = {}
-    for r in ruler.operator:
-        if r.operator == "avg" or r.operator == "max" or r.operator == "min":
+    storage_format = request.query_params.get("storage_format", "hdf5")
+    if storage_format not in STORAGE_FORMATS:
+        raise HTTPException(401, detail=f"不支持的存储格式: {storage_format}")
+    complevel, complib = parse_compression(request)
+    other_data = resolve_constants(ruler)
+
+    original_path = f"data/original/{original_file}.h5"
+    if not os.path.exists(original_path):
+        raise HTTPException(401, detail=f"{original_file}文件不存在")
+    with TableReader(original_path) as reader:
+        total = reader.nrows
+    # start 为已对齐的行数(高水位)，增量刷新时只对齐之后新增的行
+    start = int(request.query_params.get("start", 0))
+
+    job = {
+        "job_id": str(uuid.uuid4()),
+        "status": "running",
+        "ruler": ruler.model_dump(),
+        "constants": other_data,
+        "file_name": file_name,
+        "original_file": original_file,
+        "storage_format": storage_format,
+        "complevel": complevel,
+        "complib": complib,
+        "workers": resolve_workers(
+            int(request.query_params.get("workers", config.Aligned_workers))),
+        "start": start,
+        "total": total,
+        "next_row": start,  # 检查点: 下一个待对齐的原始数据行
+        "output_rows": None,  # 检查点: 对齐数据中已确认写入的行数
+        "rows_done": 0,  # 已处理的原始数据行数
+        "data_count": 0,  # 已写入的对齐数据行数(drop 策略删除的行不计入)
+        "rows_dropped": 0,
+        "field_failures": {},  # 各字段类型转换失败的个数
+        "rows_per_second": 0.0,
+        "error": None,
+        "created_at": time.time(),
+    }
+    save_aligned_job(job)
+    run_aligned_job(job["job_id"])
+    return {"message": "aligned job started", "job_id": job["job_id"],
+            "total": max(total - start, 0)}
+
+
+@aligned.post("/dry_run")
+def dry_run_aligned(ruler: Ruler, request: Request):
+    """
+    试运行对齐规则
+    随机抽取若干数据块执行规则并写入临时文件，返回预览数据、各字段类型转换失败率，
+    并按实测吞吐量和写入大小估算完整对齐的耗时和输出大小。
+    Args:
+        ruler (Ruler): 该原始数据库的对齐规则
+        request (Request): 请求对象，查询参数包括 original_file、storage_format、
+            complevel/complib(HDF5 压缩参数)、chunks(抽样块数)、preview_rows(预览行数)
+    Returns:
+        dict: 试运行结果
+    """
+    original_file = request.query_params.get("original_file")
+    storage_format = request.query_params.get("storage_format", "hdf5")
+    if storage_format not in STORAGE_FORMATS:
+        raise HTTPException(401, detail=f"不支持的存储格式: {storage_format}")
+    complevel, complib = parse_compression(request)
+    sample_chunks = int(request.query_params.get("chunks", config.Aligned_dry_run_chunks))
+    preview_rows = int(request.query_params.get("preview_rows", 10))
+    original_path = f"data/original/{original_file}.h5"
+    if not os.path.exists(original_path):
+        raise HTTPException(401, detail=f"{original_file}文件不存在")
+    other_data = resolve_constants(ruler)
+
+    with TableReader(original_path) as reader:
+        total = reader.nrows
+        ranges = reader.chunk_ranges(config.Aligned_chunk_size)
+        sample = sorted(random.sample(ranges, min(sample_chunks, len(ranges))))
+        transform = CompiledRuler(ruler.operator, other_data)
+        dtypes = reader.dtypes
+        columns = transform.columns or reader.columns[:1]
+
+        fields = {op.aligned_field.field: {"nulls": 0, "failures": 0}
+                  for op in ruler.operator}
+        errors = []
+        preview = None
+        source_rows = 0
+        rows = 0
+        elapsed = 0.0
+        with tempfile.TemporaryDirectory(dir="data") as tmp_dir:
+            path = os.path.join(tmp_dir, "dry_run" if storage_format == "columnar" else "dry_run.h5")
+            writer = open_writer(path, storage_format, complevel=complevel, complib=complib)
             try:
-                # 设置请求超时时间为5秒
-                res = requests.get(
-                    f"http://{config.center_host}:{config.center_port}/ruler/get",
-                    json=r.model_dump(),
-                    timeout=5
-                )
-                if res.status_code != 200:
-                    raise HTTPException(
-                        401, detail=f"{res.json().get('detail')}")
-                else:
-                    other_data[f"{r.aligned_field.field}"] = res.json()
-            except requests.Timeout as e:
-                raise HTTPException(408, detail="Request timeout") from e
-            except requests.RequestException as e:
-                raise HTTPException(
-                    500, detail=f"Request failed: {str(e)}") from e
-        elif (
-            r.operator == "+"
-            or r.operator == "-"
-            or r.operator == "*"
-            or r.operator == "/"
-            or r.operator == "="
-        ):
-            pass
-
-    # 读取h5文件，使用分块读取
-    chunk_size = 10000  # 每次处理10000行数据
-    datacount = 0
-
-    # 分块读取和处理数据
-    for chunk in pd.read_hdf(f"data/original/{original_file}.h5", chunksize=chunk_size):
-        chunk_data = {}
-
-        # 初始化每个字段的数组
-        for r in ruler.operator:
-            chunk_data[r.aligned_field.field] = []
-
-        # 处理当前块的数据
-        for _, row in chunk.iterrows():
-            datacount += 1
-            for r in ruler.operator:
-                if r.operator == "avg" or r.operator == "max" or r.operator == "min":
-                    chunk_data[r.aligned_field.field].append(
-                        convert_type(
-                            other_data[r.aligned_field.field], r.aligned_field.type)
-                    )
-                elif r.operator in ["+", "-", "*", "/"]:
+                for bounds in sample:
+                    started_at = time.time()
                     try:
-                        data = []
-                        for f in r.original_field:
-                            filed = f.field
-                            data.append(round(float(row[filed]), 2))
-                        result = None
-                        if r.operator == "+":
-                            result = add(*data)
-                        elif r.operator == "-":
-                            result = sub(*data)
-                        elif r.operator == "*":
-                            result = mul(*data)
-                        elif r.operator == "/":
-                            result = div(*data)
-                        chunk_data[r.aligned_field.field].append(
-                            convert_type(result, r.aligned_field.type)
-                        )
+                        chunk_df, failures = transform.evaluate(
+                            reader.read(columns=columns, start=bounds[0], stop=bounds[1]), dtypes)
+                        if len(chunk_df) > 0:
+                            writer.append(chunk_df)
                     except Exception as e:
-                        raise HTTPException(401, detail=f"{e}") from e
-                elif r.operator == "=":
-                    filed = r.original_field.field
-                    chunk_data[r.aligned_field.field].append(row[filed])
-
-        # 将当前块的数据转换为DataFrame
-        chunk_df = pd.DataFrame(chunk_data)
-        min_itemsize = {}
-        for column in chunk_df.select_dtypes(include=['object']).columns:
-            min_itemsize[column] = 100  # 为每个字符串列设置最大长度
-        # 分段存储数据，使用append模式
-        chunk_df.to_hdf(
-            f"data/aligned/{file_name}.h5",
-            key='df',
-            mode='a',  # 使用append模式
-            append=True,  # 启用追加模式
-            format='table',  # 使用table格式支持追加
-            min_itemsize=min_itemsize  # 为字符串列预分配空间
-        )
-
-        # 清理内存
-        del chunk_df
-        del chunk_data
-
-    # 返回处理结果
-    return {"message": "aligned", "data_count": datacount}
+                        errors.append({"rows": list(bounds), "error": str(e)})
+                        continue
+                    elapsed += time.time() - started_at
+                    source_rows += bounds[1] - bounds[0]
+                    rows += len(chunk_df)
+                    for name, count in failures.items():
+                        fields[name]["failures"] += count
+                    for name, count in chunk_df.isna().sum().items():
+                        fields[name]["nulls"] += int(count)
+                    if preview is None:
+                        preview = chunk_df.head(preview_rows)
+            finally:
+                writer.close()
+            output_bytes = sum(
+                os.path.getsize(os.path.join(root, f))
+                for root, _, files in os.walk(tmp_dir) for f in files)
+
+    for stat in fields.values():
+        stat["failure_rate"] = stat["failures"] / source_rows if source_rows else None
+    rows_per_second = source_rows / elapsed if elapsed > 0 else None
+    workers = resolve_workers(config.Aligned_workers)
+    return {
+        "total_rows": total,
+        "sample_rows": source_rows,
+        "output_rows": rows,
+        "preview": [] if preview is None else json.loads(
+            preview.to_json(orient="records", force_ascii=False)),
+        "fields": fields,
+        "errors": errors,
+        "rows_per_second": rows_per_second,
+        # 多进程时按工作进程数线性估算，写入仍在单个进程中，实际耗时可能更长
+        "estimated_seconds": total / (rows_per_second * workers) if rows_per_second else None,
+        "estimated_bytes": int(output_bytes / source_rows * total) if source_rows else None,
+    }
+
+
+@aligned.get("/progress/{job_id}")
+def get_aligned_progress(job_id: str):
+    """
+    查询对齐任务进度
+    Returns:
+        dict: status 为 running/finished/failed/interrupted，interrupted 表示任务
+            未完成但已不在运行(如节点重启)，可通过 /aligned/resume/{job_id} 继续
+    """
+    job = load_aligned_job(job_id)
+    if job is None:
+        raise HTTPException(401, detail=f"对齐任务{job_id}不存在")
+    status = job["status"]
+    if status == "running" and job_id not in active_aligned_jobs:
+        status = "interrupted"
+    return {
+        "job_id": job_id,
+        "status": status,
+        "rows_done": job["rows_done"],
+        "rows_total": max(job["total"] - job["start"], 0),
+        "rows_per_second": job["rows_per_second"],
+        "data_count": job.get("data_count", job["rows_done"]),
+        "rows_dropped": job.get("rows_dropped", 0),
+        "field_failures": job.get("field_failures", {}),
+        "high_water_mark": job["total"],
+        "constants": job.get("constants"),
+        "error": job["error"],
+        # 字段类型转换任务的阶段及校验结果
+        "phase": job.get("phase"),
+        "convertible": job.get("convertible"),
+        "failures": job.get("failures"),
+        "examples": job.get("examples"),
+    }
+
+
+@aligned.post("/resume/{job_id}")
+def resume_aligned(job_id: str):
+    """从检查点继续执行中断或失败的对齐任务"""
+    job = load_aligned_job(job_id)
+    if job is None:
+        raise HTTPException(401, detail=f"对齐任务{job_id}不存在")
+    if job_id in active_aligned_jobs or job["status"] == "finished":
+        return {"message": f"对齐任务{job['status']}", "job_id": job_id}
+    job["status"] = "running"
+    job["error"] = None
+    save_aligned_job(job)
+    run_aligned_job(job_id)
+    return {"message": "aligned job resumed", "job_id": job_id,
+            "next_row": job["next_row"]}
+
+
+@aligned.post("/delete")
+def delete_aligned(delete_info: DeleteAligned):
+    """
+    删除对齐数据(HDF5 文件或列式存储目录)及其统计目录、数据块索引
+
+    由中心服务器在规则创建失败时调用，清理已写入的对齐数据；文件不存在时(如该节点尚未写入)同样返回成功。
+    仍有对齐任务在写入该文件时不删除。
+    """
+    file_name = delete_info.file_name
+    if not file_name or os.path.basename(file_name) != file_name:
+        raise HTTPException(401, detail=f"文件名不正确,{file_name}")
+    for job_id in list(active_aligned_jobs):
+        job = load_aligned_job(job_id)
+        if job is not None and job.get("file_name") == file_name:
+            raise HTTPException(401, detail=f"对齐任务{job_id}正在写入{file_name}")
+    deleted = False
+    for storage_format in STORAGE_FORMATS:
+        path = aligned_path(file_name, storage_format)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+            deleted = True
+        elif os.path.exists(path):
+            os.remove(path)
+            deleted = True
+        for sidecar in (catalog_path(path), index_path(path)):
+            if os.path.exists(sidecar):
+                os.remove(sidecar)
+    return {"status": "success", "message": "文件已删除" if deleted else "文件不存在"}
+
+
+def convert_field_type(job):
+    """
+    字段类型转换任务
+
+    先分块扫描整列校验是否全部可以转换(validating)，mode 为 convert 且校验通过时
+    再将该列按新的原生类型改写到对齐数据中(rewriting)。改写先写入临时文件再替换，
+    中断后从头重新执行。
+    """
+    file_path = aligned_path(job["file_name"])
+    field, type_str = job["field"], job["type"]
+
+    def report(rows):
+        job["rows_done"] += rows
+        elapsed = time.time() - started_at
+        if elapsed > 0:
+            job["rows_per_second"] = job["rows_done"] / elapsed
+        save_aligned_job(job)
+
+    job["phase"] = "validating"
+    job["rows_done"] = 0
+    job["failures"] = 0
+    job["examples"] = []
+    started_at = time.time()
+    with open_reader(file_path) as reader:
+        for chunk in reader.iter_chunks(config.Aligned_chunk_size, columns=[field]):
+            _, failed = cast_column(chunk[field], type_str)
+            if failed.any():
+                job["failures"] += int(failed.sum())
+                bad = chunk[field][failed].head(5 - len(job["examples"]))
+                job["examples"].extend(str(v) for v in bad)
+            report(len(chunk))
+    job["convertible"] = job["failures"] == 0
+    if not job["convertible"] or job["mode"] != "convert":
+        return
+
+    job["phase"] = "rewriting"
+    job["rows_done"] = 0
+    started_at = time.time()
+    rewrite_column(
+        file_path, field, lambda series: cast_column(series, type_str)[0],
+        config.Aligned_chunk_size, on_chunk=report)
 
 
 @aligned.post("/update_field_type")
 def update_field_type(
-    field_type: UpdateFieldType
+    field_type: UpdateFieldType,
+    request: Request
 ):
-    file_path = f"data/aligned/{field_type.file_name}.h5"
+    """
+    创建字段类型转换任务
+    Args:
+        field_type (UpdateFieldType): 对齐数据文件名、字段及目标类型
+        request (Request): 请求对象，查询参数 mode 为 validate(只校验，默认)或 convert(校验并改写)
+    Returns:
+        dict: 包含任务ID和总行数，进度及校验结果通过 /aligned/progress/{job_id} 查询；
+            目标类型无法转换(如 datetime/list)时不创建任务，直接返回 convertible 为 False 的校验结果
+    """
+    mode = request.query_params.get("mode", "validate")
+    if mode not in ("validate", "convert"):
+        raise HTTPException(401, detail=f"不支持的模式: {mode}")
+    type_str = resolve_field_type(field_type.type)
+    if type_str is None:
+        return {"message": f"字段类型无法转换: 不支持的类型 {field_type.type}",
+                "convertible": False}
+    file_path = aligned_path(field_type.file_name)
     if not os.path.exists(file_path):
         raise HTTPException(401, detail=f"{field_type.file_name}文件不存在")
+    with open_reader(file_path) as reader:
+        if field_type.field not in reader.columns:
+            raise HTTPException(401, detail=f"字段{field_type.field}不存在")
+        total = reader.nrows
 
-    chunk_size = 10
-    try:
-        # 只读取第一个数据块进行检查
-        for chunk in pd.read_hdf(file_path, chunksize=chunk_size):
-            try:
-                # 尝试转换数据类型，但不保存
-                _ = chunk[field_type.field].astype(field_type.type)
-                return {"message": "字段类型可以转换", "convertible": True}
-            except (ValueError, TypeError) as e:
-                return {
-                    "message": f"字段类型无法转换: {str(e)}",
-                    "convertible": False
-                }
-            break  # 只检查第一个数据块
-    except Exception as e:
-        print(str(e))
-        raise HTTPException(
-            status_code=500,
-            detail=f"检查字段类型时发生错误: {str(e)}"
-        ) from e
+    job = {
+        "job_id": str(uuid.uuid4()),
+        "kind": "field_type",
+        "mode": mode,
+        "status": "running",
+        "phase": "validating",
+        "file_name": field_type.file_name,
+        "field": field_type.field,
+        "type": type_str,
+        "start": 0,
+        "total": total,
+        "rows_done": 0,
+        "data_count": total,
+        "rows_per_second": 0.0,
+        "failures": 0,
+        "examples": [],
+        "convertible": None,
+        "error": None,
+        "created_at": time.time(),
+    }
+    save_aligned_job(job)
+    run_aligned_job(job["job_id"])
+    return {"message": "field type job started", "job_id": job["job_id"], "total": total}
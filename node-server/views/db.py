@@ -3,15 +3,29 @@
 本模块提供了数据库相关的API路由,包括:
 - 文件上传接口
 - 数据库信息管理
+
+原始数据按上传文件内容的 sha256 存储(data/original/{sha256}.h5)，
+相同内容的文件再次上传时直接引用已有文件，不再重复导入。
+原始数据导入后可能被原地追加(增量刷新对齐数据)，因此导入时同时记录行数(见 utils.upload)，
+复用前核对行数，已被追加过的文件不再复用，本次上传按上传ID单独导入。
+同一个文件可能被中心服务器上的多个数据库引用，由中心服务器在最后一个引用删除后调用 /db/delete 删除文件。
 """
 
+import json
 import os
+from typing import Optional
 import pandas
 import requests
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 from config import config
+from model import redis
 from utils.utils import map_dtype_to_simple_type
+from utils.stats import catalog_path, update_stats, save_catalog
+from utils.hdf import StringProfile, TableReader, TableWriter, compression_options
+from utils.chunk_index import index_path, move_index
+from utils.ingest import CsvSource
+from utils.upload import content_path, content_unchanged, save_content
 
 db = APIRouter(prefix="/db")
 
@@ -27,115 +41,190 @@ class UploadFileInfo(BaseModel):
         detail: 数据库详细描述
         file_name: 文件名
         file_type: 文件类型
+        complevel: HDF5 压缩级别，为空时使用节点默认配置
+        complib: HDF5 压缩库，为空时使用节点默认配置
     """
     user_id: int
     db_name: str
     detail: str
     file_name: str
     file_type: str
+    complevel: Optional[int] = None
+    complib: Optional[str] = None
 
 
-@db.post("/upload")
-def upload(
-    request: Request,
-    upload_file_info: UploadFileInfo
-):
+def ingest(read_chunks, dtypes, original_path, complevel=None, complib=None, profile=None):
+    """
+    将分块读取的数据写入原始数据 HDF5 文件
+
+    第一遍扫描统计字符串列的最大长度和不同取值，第二遍按统计结果写入:
+    不同取值较少的列按字典编码存储，其余字符串列按实际最大长度分配存储空间。
+
+    Args:
+        read_chunks: 每次调用返回一个新的数据块迭代器
+        dtypes (dict): 各列的数据类型
+        original_path (str): 原始数据文件路径
+        complevel (int): 压缩级别
+        complib (str): 压缩库
+        profile (StringProfile): 已有的字符串列画像，为空时先扫描一遍
+
+    Returns:
+        tuple: (数据行数, 各列统计量)
+    """
+    if profile is None:
+        profile = StringProfile()
+        for chunk in read_chunks():
+            profile.update(chunk)
+
+    data_count = 0
+    stats = {}  # 写入时顺带统计每列的 count/sum/min/max 等，生成统计目录
+    if os.path.exists(original_path):
+        os.remove(original_path)
+    with TableWriter(original_path, min_itemsize=profile.min_itemsize(),
+                     categories=profile.categories(),
+                     complevel=complevel, complib=complib) as writer:
+        for chunk in read_chunks():
+            # 确保所有列的数据类型一致
+            for col in chunk.columns:
+                if col in dtypes:
+                    chunk[col] = chunk[col].astype(dtypes[col])
+            writer.append(chunk)
+            update_stats(stats, chunk)
+            data_count += len(chunk)
+    return data_count, stats
+
+
+def convert_upload(upload_file_info, original_path):
+    """
+    将已上传的 CSV / HDF5 文件转换为原始数据 HDF5 文件，转换后删除上传的文件
+
+    先写入临时文件再替换，同时上传相同内容的文件时不会读到未写完的数据。
+
+    Args:
+        upload_file_info (UploadFileInfo): 文件上传信息
+        original_path (str): 原始数据文件路径
+
+    Returns:
+        int: 数据行数
+    """
     # 查找已上传的文件
     file_path = f"static/uploads/files/{upload_file_info.file_name}.{upload_file_info.file_type}"
     if not os.path.exists(file_path):
         raise HTTPException(401, detail=f"文件不存在,{file_path}")
-    data_count = 0
+    chunk_size = config.Ingest_chunk_size
+    tmp_path = f"{original_path}.{upload_file_info.file_name}.tmp"
+    try:
+        compression = compression_options(
+            upload_file_info.complevel, upload_file_info.complib)
+    except ValueError as e:
+        os.remove(file_path)
+        raise HTTPException(401, detail=f"{e}") from e
     if upload_file_info.file_type == "csv":
-        # 使用分块读取CSV文件
         try:
-            # 使用分块读取CSV文件
-            chunk_size = 100000  # 每次处理10000行
-            first_chunk = True
-
-            # 先读取一小部分数据来确定字符串列的最大长度和数据类型
-            sample_df = pandas.read_csv(file_path, nrows=1000)
-
-            # 计算每列的最大字符串长度
-            min_itemsize = {}
-            for col in sample_df.select_dtypes(include=['object']).columns:
-                # 为字符串列设置足够大的长度，默认设为100，可以根据实际情况调整
-                min_itemsize[col] = 100
-
-            # 创建一个字典来存储每列的数据类型
-            dtypes = sample_df.dtypes.to_dict()
-
-            # 使用相同的数据类型读取所有数据块
-            for chunk in pandas.read_csv(file_path, chunksize=chunk_size, dtype=dtypes):
-                # 确保所有列的数据类型一致
-                for col in chunk.columns:
-                    if col in dtypes:
-                        chunk[col] = chunk[col].astype(dtypes[col])
-                mode = 'w' if first_chunk else 'a'
-                chunk.to_hdf(
-                    f"data/original/{upload_file_info.file_name}.h5",
-                    key='df',
-                    format='table',
-                    mode=mode,
-                    append=not first_chunk,
-                    min_itemsize=min_itemsize
-                )
-                data_count += len(chunk)
-                first_chunk = False
+            # 先扫描整个文件推断列类型(按需放宽)，再按统一的类型流式写入
+            source = CsvSource(file_path, chunk_size=chunk_size)
+            profile = source.infer()
+            data_count, stats = ingest(
+                source.iter_chunks, source.dtypes, tmp_path, *compression,
+                profile=profile)
         except Exception as e:
             os.remove(file_path)
+            for path in (tmp_path, index_path(tmp_path)):
+                if os.path.exists(path):
+                    os.remove(path)
             raise HTTPException(401, detail=f"错误,{e}") from e
     else:
-        # 使用分块读取HDF5文件
-        chunk_size = 100000
-        first_chunk = True
         try:
-            # 尝试使用chunks读取
             # 先读取一个样本来确定数据类型
             sample_df = pandas.read_hdf(file_path, stop=1)
             dtypes = sample_df.dtypes.to_dict()
-            min_itemsize = {}
-            for col in sample_df.select_dtypes(include=['object']).columns:
-                min_itemsize[col] = 100
-
-            chunks = pandas.read_hdf(file_path, chunksize=chunk_size)
-            for chunk in chunks:
-                # 确保所有列的数据类型一致
-                for col in chunk.columns:
-                    if col in dtypes:
-                        chunk[col] = chunk[col].astype(dtypes[col])
-
-                data_count += len(chunk)
-                mode = 'w' if first_chunk else 'a'
-                chunk.to_hdf(
-                    f"data/original/{upload_file_info.file_name}.h5",
-                    key='df',
-                    format='table',
-                    mode=mode,
-                    append=not first_chunk,
-                    min_itemsize=min_itemsize
-                )
-                first_chunk = False
+            data_count, stats = ingest(
+                lambda: pandas.read_hdf(file_path, chunksize=chunk_size),
+                dtypes, tmp_path, *compression)
         except TypeError as e:
             os.remove(file_path)
+            for path in (tmp_path, index_path(tmp_path)):
+                if os.path.exists(path):
+                    os.remove(path)
             raise HTTPException(
                 401, detail=f"文件格式错误(请将其转化为table类型的h5文件),{e}") from e
     # 删除文件
     os.remove(file_path)
+    os.replace(tmp_path, original_path)
+    move_index(tmp_path, original_path)
+    save_catalog(original_path, stats)
+    return data_count
+
+
+def upload_result(file_id):
+    """websocket 上传结束时记录的结果(内容摘要、是否已边上传边导入)，没有时返回空字典"""
+    result = redis.get(f"uploaded:{file_id}")
+    return json.loads(result) if result is not None else {}
+
+
+@db.post("/upload")
+def upload(
+    request: Request,
+    upload_file_info: UploadFileInfo
+):
+    result = upload_result(upload_file_info.file_name)
+    # 按文件内容存储，没有摘要时(非 websocket 上传的文件)沿用上传时的文件名；
+    # 边接收边导入时由上传接口决定文件名(已有文件被追加过时为上传ID)
+    file_name = result.get("file_name", result.get("sha256", upload_file_info.file_name))
+    original_path = f"data/original/{file_name}.h5"
+    message = "文件上传成功"
+    reuse = False
+    if "sha256" in result and not result.get("ingested") and os.path.exists(original_path):
+        with TableReader(original_path) as reader:
+            reuse = content_unchanged(original_path, reader.nrows)
+        if not reuse:
+            # 已有文件导入后被追加过数据，内容与摘要不符，按上传ID单独导入
+            config.logger.info("%s 导入后已被追加数据，不再复用", original_path)
+            file_name = upload_file_info.file_name
+            original_path = f"data/original/{file_name}.h5"
+    if result.get("ingested") and os.path.exists(original_path):
+        # 上传时已边接收边导入，无需再读取文件
+        data_count = result["data_count"]
+    elif reuse:
+        # 相同内容的文件已导入过，直接引用
+        config.logger.info("文件内容与 %s 相同，跳过导入", original_path)
+        uploaded_path = f"static/uploads/files/{upload_file_info.file_name}.{upload_file_info.file_type}"
+        if os.path.exists(uploaded_path):
+            os.remove(uploaded_path)
+        with TableReader(original_path) as reader:
+            data_count = reader.nrows
+            stored = reader.compression
+        if upload_file_info.complevel is not None or upload_file_info.complib is not None:
+            try:
+                requested = compression_options(
+                    upload_file_info.complevel, upload_file_info.complib)
+            except ValueError as e:
+                raise HTTPException(401, detail=f"{e}") from e
+            if requested[0] != stored[0] or (stored[0] and requested[1] != stored[1]):
+                # 复用已有文件，本次指定的压缩参数不生效
+                message = (f"文件内容已存在，沿用已有文件的压缩参数"
+                           f"(complevel={stored[0]}, complib={stored[1]})")
+    else:
+        data_count = convert_upload(upload_file_info, original_path)
+        if file_name == result.get("sha256"):
+            save_content(original_path, file_name, data_count)
     fields = ''
-    with pandas.HDFStore(f"data/original/{upload_file_info.file_name}.h5", mode='r') as store:
+    with pandas.HDFStore(original_path, mode='r') as store:
         # 获取数据类型信息
         # 读取一行数据来获取类型信息
         df_sample = store.select('df', start=0, stop=1)
         fields = df_sample.dtypes.to_dict()
         fields = {col: map_dtype_to_simple_type(
             dtype) for col, dtype in fields.items()}
+    with TableReader(original_path) as reader:
+        complevel, complib = reader.compression
     db_info = {
         "user_id": upload_file_info.user_id,
         "db_name": upload_file_info.db_name,
         "field": fields,
         "detail": upload_file_info.detail,
         "data_count": int(data_count),
-        "file_name": upload_file_info.file_name,
+        "file_name": file_name,
     }
     # 设置5秒超时时间避免请求无限等待
     res = requests.post(
@@ -147,9 +236,40 @@ def upload(
     if res.status_code != 200:
         raise HTTPException(401, detail="数据库上传失败")
     else:
+        redis.delete(f"uploaded:{upload_file_info.file_name}")
         return {
             "status": "success",
-            "message": "文件上传成功",
+            "message": message,
             "file_id": upload_file_info.file_name,
-            "table_name": upload_file_info.db_name
+            "file_name": file_name,
+            "table_name": upload_file_info.db_name,
+            # 实际生效的压缩参数(复用已有文件时为已有文件的参数)
+            "complevel": complevel,
+            "complib": complib,
         }
+
+
+class DeleteInfo(BaseModel):
+    """原始数据删除信息
+
+    属性:
+        file_name: 原始数据文件名
+    """
+    file_name: str
+
+
+@db.post("/delete")
+def delete(delete_info: DeleteInfo):
+    """
+    删除原始数据文件及其统计目录、数据块索引和内容记录，由中心服务器在文件不再被任何数据库引用时调用
+    """
+    if os.path.basename(delete_info.file_name) != delete_info.file_name:
+        raise HTTPException(401, detail=f"文件名不正确,{delete_info.file_name}")
+    original_path = f"data/original/{delete_info.file_name}.h5"
+    if not os.path.exists(original_path):
+        raise HTTPException(401, detail=f"文件不存在,{original_path}")
+    for path in (original_path, catalog_path(original_path), index_path(original_path),
+                 content_path(original_path)):
+        if os.path.exists(path):
+            os.remove(path)
+    return {"status": "success", "message": "文件已删除"}
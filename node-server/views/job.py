@@ -5,7 +5,7 @@ import os
 import requests
 import json
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 job = APIRouter(prefix="/job")
 
 
@@ -14,6 +14,22 @@ class Field(BaseModel):
     type: str
 
 
+class LoaderConfig(BaseModel):
+    num_workers: int = config.Train_num_workers
+    prefetch_factor: int = config.Train_prefetch_factor
+    pin_memory: bool = config.Train_pin_memory
+    shuffle: bool = config.Train_shuffle
+    shuffle_buffer: int = config.Train_shuffle_buffer
+    seed: Optional[int] = None
+    cache: bool = config.Train_cache
+
+
+class ValidationConfig(BaseModel):
+    fraction: Optional[float] = config.Train_validation_fraction
+    row_range: Optional[List[int]] = None
+    max_rows: Optional[int] = config.Train_validation_max_rows
+
+
 class JobInfo(BaseModel):
     job_id: str
     net_file: str
@@ -22,6 +38,8 @@ class JobInfo(BaseModel):
     input_field: List[Field]  # 使用定义好的Field模型
     output_field: Field  # 使用定义好的Field模型
     node_id: int
+    loader_config: Optional[LoaderConfig] = None  # 训练数据加载配置，为空时使用节点默认配置
+    validation: Optional[ValidationConfig] = None  # 验证集划分配置，为空时使用节点默认配置
 
 
 @job.post("/start")
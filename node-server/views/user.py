@@ -2,9 +2,16 @@ import json
 import uuid
 import os
 from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from model import redis
 from config import config
+from utils.hdf import TableReader, compression_options
+from utils.chunk_index import move_index, remove_index
+from utils.ingest import CsvStreamIngest
+from utils.stats import save_catalog
+from utils.upload import (PrefixHasher, add_range, compute_checksum, content_unchanged,
+                          contiguous_end, missing_ranges, received_bytes, save_content)
 
 router = APIRouter()
 
@@ -68,11 +75,72 @@ def logout(request: Request):
 active_uploads = {}
 
 
+def save_upload(upload):
+    """保存上传会话(包含已接收的字节区间)，用于断线后续传"""
+    redis.set(f"upload:{upload['file_id']}", json.dumps(upload), ex=config.Upload_expire)
+
+
+def load_upload(file_id):
+    """读取上传会话，不存在时返回 None"""
+    upload = active_uploads.get(file_id)
+    if upload is not None:
+        return upload
+    upload = redis.get(f"upload:{file_id}")
+    if upload is None:
+        return None
+    return json.loads(upload)
+
+
+def upload_status(upload):
+    """上传会话的接收状态"""
+    status = {
+        "filename": upload["file_id"],
+        "ranges": upload["ranges"],
+        "received": received_bytes(upload["ranges"]),
+        "window": config.Upload_window,
+    }
+    if upload.get("file_size") is not None:
+        status["missing"] = missing_ranges(upload["ranges"], upload["file_size"])
+    return status
+
+
 @router.websocket("/upload_big_file")
 async def websocket_upload(websocket: WebSocket):
+    """
+    大文件分块上传
+
+    消息协议(文本帧为 JSON):
+    - start: {"type": "start", "fileType", "fileName", "totalChunks", "fileSize"(可选)}
+        返回 {"type": "start", "filename", "window"}，window 为建议的最大在途分块数
+    - resume: {"type": "resume", "filename"} 断线重连后恢复上传会话，
+        返回 {"type": "resume", "filename", "ranges", "received", "missing", "window"}
+    - status: {"type": "status", "filename"} 查询已接收的字节区间，返回格式同 resume
+    - chunk: {"type": "chunk", "filename", "offset", "size", "checksum", "checksumType"}
+        之后紧跟一个二进制帧。带 offset 时数据写入对应位置，可以不等确认连续发送多个分块，
+        每个分块返回 {"type": "ack", "offset", "size", "received"}，
+        校验失败返回 {"type": "nack", "offset", "message"}，客户端重传该分块即可。
+        不带 offset 时按旧协议追加到已接收数据之后，返回 {"type": "chunk", "received"}
+    - stop: {"type": "stop", "filename", "fileType"} 上传结束，已知 fileSize 时检查是否接收完整，
+        返回 {"type": "complete", "filename", "path", "sha256"}，sha256 为文件内容的摘要，
+        /db/upload 据此按内容存储原始数据，相同内容的文件只导入一次
+
+    CSV 文件在 start 消息中指定 "ingest": true (可选 "complevel", "complib") 时边接收边导入:
+    收到的数据按顺序直接解析写入 data/original/{filename}.h5 (原文同时顺序写入一个临时 CSV，
+    供列类型放宽为字符串时按原文改写，导入结束后删除)，乱序到达的分块暂存在内存中，等待前面的数据到齐。stop 时返回
+    {"type": "complete", "filename", "path", "sha256", "ingested": true, "data_count"}，
+    之后调用 /db/upload 时不再重新读取文件。这种方式不支持断线续传，断开连接后需重新上传。
+    """
     await websocket.accept()
     file_id = None
     temp_file = None
+    stream = None  # 边上传边导入时的 CSV 数据源
+    hasher = PrefixHasher()  # 边接收边计算文件内容的摘要
+    pending = {}  # 边上传边导入时乱序到达的分块: offset -> 数据
+
+    def open_upload(upload):
+        # 续传时保留已写入的数据
+        mode = "r+b" if os.path.exists(upload["path"]) else "wb"
+        return open(upload["path"], mode)
 
     try:
         while True:
@@ -85,28 +153,87 @@ async def websocket_upload(websocket: WebSocket):
                 file_ext = message.get("fileType", "")
                 file_name = f"{file_id}.{file_ext}"
 
-                # 创建临时文件
-                upload_dir = "static/uploads/temp"
-                os.makedirs(upload_dir, exist_ok=True)
-                temp_path = os.path.join(upload_dir, file_name)
-
-                temp_file = open(temp_path, "wb")
+                if temp_file:
+                    temp_file.close()
+                    temp_file = None
+                if stream:
+                    stream.abort()
+                    stream = None
+                pending.clear()
+                hasher = PrefixHasher()
+
+                if message.get("ingest"):
+                    if file_ext != "csv":
+                        await websocket.send_json({
+                            "type": "error",
+                            "message": "只有 CSV 文件支持边上传边导入"
+                        })
+                        continue
+                    try:
+                        compression = compression_options(
+                            message.get("complevel"), message.get("complib"))
+                    except ValueError as e:
+                        await websocket.send_json({"type": "error", "message": f"{e}"})
+                        continue
+                    temp_path = f"data/original/{file_id}.h5"
+                    os.makedirs(os.path.dirname(temp_path), exist_ok=True)
+                    stream = CsvStreamIngest(temp_path, *compression)
+                else:
+                    # 创建临时文件
+                    upload_dir = "static/uploads/temp"
+                    os.makedirs(upload_dir, exist_ok=True)
+                    temp_path = os.path.join(upload_dir, file_name)
+                    temp_file = open(temp_path, "wb")
 
                 # 存储上传信息
                 active_uploads[file_id] = {
+                    "file_id": file_id,
                     "path": temp_path,
+                    "file_type": file_ext,
+                    "file_size": message.get("fileSize"),
                     "metadata": message.get("metadata", {}),
                     "total_chunks": message.get("totalChunks", 0),
                     "received_chunks": 0,
+                    "ranges": [],
+                    "ingest": stream is not None,
                     "original_filename": message.get("fileName", "unknown")
                 }
+                save_upload(active_uploads[file_id])
 
                 # 返回文件ID
                 await websocket.send_json({
                     "type": "start",
-                    "filename": file_id
+                    "filename": file_id,
+                    "window": config.Upload_window,
                 })
 
+            elif message["type"] in ("resume", "status"):
+                upload = load_upload(message.get("filename"))
+                if upload is None:
+                    await websocket.send_json({
+                        "type": "error",
+                        "message": "无效的文件ID"
+                    })
+                    continue
+                if message["type"] == "resume":
+                    if upload.get("ingest") and upload["file_id"] != file_id:
+                        await websocket.send_json({
+                            "type": "error",
+                            "message": "边上传边导入不支持断线续传，请重新上传"
+                        })
+                        continue
+                    if upload.get("ingest"):
+                        await websocket.send_json({"type": "resume", **upload_status(upload)})
+                        continue
+                    if temp_file:
+                        temp_file.close()
+                    file_id = upload["file_id"]
+                    active_uploads[file_id] = upload
+                    temp_file = open_upload(upload)
+                    # 摘要无法保存，重连后从文件中重新计算已接收的部分
+                    hasher = PrefixHasher()
+                await websocket.send_json({"type": message["type"], **upload_status(upload)})
+
             elif message["type"] == "chunk":
                 if not file_id or file_id != message.get("filename"):
                     await websocket.send_json({
@@ -117,18 +244,70 @@ async def websocket_upload(websocket: WebSocket):
 
                 # 接收二进制数据
                 binary_data = await websocket.receive_bytes()
-
-                # 写入文件
-                if temp_file:
+                upload = active_uploads[file_id]
+                offset = message.get("offset")
+
+                checksum = message.get("checksum")
+                if checksum is not None:
+                    try:
+                        actual = compute_checksum(
+                            binary_data, message.get("checksumType", "sha256"))
+                    except ValueError as e:
+                        actual = str(e)
+                    if actual != checksum.lower() or (
+                            message.get("size") is not None and message["size"] != len(binary_data)):
+                        await websocket.send_json({
+                            "type": "nack",
+                            "offset": offset,
+                            "message": "分块校验失败"
+                        })
+                        continue
+
+                legacy = offset is None
+                if legacy:
+                    # 旧协议: 追加到已接收数据之后
+                    offset = upload["ranges"][-1][1] if upload["ranges"] else 0
+
+                if stream:
+                    if offset > stream.received and len(pending) >= config.Upload_window:
+                        await websocket.send_json({
+                            "type": "nack",
+                            "offset": offset,
+                            "message": "超出接收窗口"
+                        })
+                        continue
+                    if offset >= stream.received:
+                        pending[offset] = binary_data
+                    # 按顺序解析已到齐的数据，解析在线程池中进行，不阻塞其他连接
+                    while stream.received in pending:
+                        block = pending.pop(stream.received)
+                        hasher.update(stream.received, block)
+                        await run_in_threadpool(stream.feed, block)
+                    upload["ranges"] = add_range(upload["ranges"], offset, offset + len(binary_data))
+                    upload["received_chunks"] += 1
+                else:
+                    # 写入文件
+                    temp_file.seek(offset)
                     temp_file.write(binary_data)
-
-                active_uploads[file_id]["received_chunks"] += 1
+                    upload["ranges"] = add_range(upload["ranges"], offset, offset + len(binary_data))
+                    upload["received_chunks"] += 1
+                    hasher.update(offset, binary_data, temp_file,
+                                  contiguous_end(upload["ranges"], upload.get("file_size")))
+                    save_upload(upload)
 
                 # 发送确认
-                await websocket.send_json({
-                    "type": "chunk",
-                    "received": active_uploads[file_id]["received_chunks"]
-                })
+                if legacy:
+                    await websocket.send_json({
+                        "type": "chunk",
+                        "received": upload["received_chunks"]
+                    })
+                else:
+                    await websocket.send_json({
+                        "type": "ack",
+                        "offset": offset,
+                        "size": len(binary_data),
+                        "received": received_bytes(upload["ranges"])
+                    })
 
             elif message["type"] == "stop":
                 if not file_id or file_id != message.get("filename"):
@@ -138,24 +317,97 @@ async def websocket_upload(websocket: WebSocket):
                     })
                     continue
 
+                upload_info = active_uploads[file_id]
+                if upload_info.get("file_size") is not None:
+                    missing = missing_ranges(upload_info["ranges"], upload_info["file_size"])
+                    if missing:
+                        await websocket.send_json({
+                            "type": "error",
+                            "message": "文件未接收完整",
+                            "missing": missing
+                        })
+                        continue
+                    if temp_file:
+                        temp_file.truncate(upload_info["file_size"])
+
+                if temp_file:
+                    hasher.read(temp_file, contiguous_end(
+                        upload_info["ranges"], upload_info.get("file_size")))
+
+                if stream:
+                    try:
+                        if pending:
+                            raise ValueError("文件未接收完整")
+                        data_count, stats = await run_in_threadpool(stream.finish)
+                        digest = hasher.hexdigest()
+                        stored_name = digest
+                        original_path = f"data/original/{digest}.h5"
+                        if not os.path.exists(original_path):
+                            os.replace(upload_info["path"], original_path)
+                            move_index(upload_info["path"], original_path)
+                            save_catalog(original_path, stats)
+                            save_content(original_path, digest, data_count)
+                        else:
+                            with TableReader(original_path) as reader:
+                                unchanged = content_unchanged(original_path, reader.nrows)
+                            if unchanged:
+                                # 相同内容已导入过，直接引用已有文件
+                                os.remove(upload_info["path"])
+                                remove_index(upload_info["path"])
+                            else:
+                                # 已有文件导入后被追加过数据，内容与摘要不符，本次导入的数据按上传ID单独存储
+                                stored_name = file_id
+                                original_path = upload_info["path"]
+                                save_catalog(original_path, stats)
+                        # /db/upload 据此跳过文件转换
+                        redis.set(f"uploaded:{file_id}", json.dumps({
+                            "sha256": digest,
+                            "file_name": stored_name,
+                            "ingested": True,
+                            "data_count": data_count
+                        }), ex=config.Upload_expire)
+                        await websocket.send_json({
+                            "type": "complete",
+                            "filename": file_id,
+                            "path": original_path,
+                            "sha256": digest,
+                            "ingested": True,
+                            "data_count": data_count
+                        })
+                    except Exception as e:
+                        config.logger.error(f"文件导入失败: {str(e)}")
+                        stream.abort()
+                        await websocket.send_json({
+                            "type": "error",
+                            "message": f"文件导入失败: {str(e)}"
+                        })
+                    stream = None
+                    pending.clear()
+                    del active_uploads[file_id]
+                    redis.delete(f"upload:{file_id}")
+                    continue
+
                 # 关闭文件
                 if temp_file:
                     temp_file.close()
                     temp_file = None
 
                 # 移动到最终位置
-                upload_info = active_uploads[file_id]
                 final_dir = "static/uploads/files"
                 os.makedirs(final_dir, exist_ok=True)
                 final_path = os.path.join(
-                    final_dir, f"{file_id}.{message.get('fileType', '')}")
+                    final_dir, f"{file_id}.{message.get('fileType', upload_info.get('file_type', ''))}")
 
                 try:
                     os.rename(upload_info["path"], final_path)
+                    digest = hasher.hexdigest()
+                    redis.set(f"uploaded:{file_id}", json.dumps({"sha256": digest}),
+                              ex=config.Upload_expire)
                     await websocket.send_json({
                         "type": "complete",
                         "filename": file_id,
-                        "path": final_path
+                        "path": final_path,
+                        "sha256": digest
                     })
                 except Exception as e:
                     config.logger.error(f"文件处理失败: {str(e)}")
@@ -167,6 +419,7 @@ async def websocket_upload(websocket: WebSocket):
                 # 清理
                 if file_id in active_uploads:
                     del active_uploads[file_id]
+                redis.delete(f"upload:{file_id}")
 
     except WebSocketDisconnect:
         config.logger.info("WebSocket 连接断开")
@@ -180,6 +433,12 @@ async def websocket_upload(websocket: WebSocket):
         except:
             pass
     finally:
-        # 清理资源
+        # 清理资源，上传会话保留在 redis 中，重连后可通过 resume 继续
         if temp_file:
             temp_file.close()
+        if stream:
+            # 边上传边导入的会话无法恢复，删除已写入的数据
+            stream.abort()
+            redis.delete(f"upload:{file_id}")
+        if file_id in active_uploads:
+            del active_uploads[file_id]